@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+from backup_store import BackupStore
+from utils import BACKUP_KEEP_LAST, BACKUP_KEEP_DAILY, get_backup_dir
+
+# Scheduling defaults
+BACKUP_INTERVAL_MINUTES = 30
+END_OF_DAY_TIME = "23:00"  # Daily backup after closing, as HH:MM
+BACKUP_MAX_BYTES_PER_SECOND = 2 * 1024 * 1024  # Write budget so checkout I/O isn't starved
+METRICS_HISTORY = 50
+
+
+class BackupScheduler:
+    def __init__(self, data_manager, interval_minutes=BACKUP_INTERVAL_MINUTES, end_of_day=END_OF_DAY_TIME,
+                 max_bytes_per_second=BACKUP_MAX_BYTES_PER_SECOND, on_backup=None):
+        """Initialize the scheduler; on_backup(metrics) is called from the backup thread"""
+        self.data_manager = data_manager
+        self.interval = timedelta(minutes=interval_minutes) if interval_minutes else None
+        self.end_of_day = datetime.strptime(end_of_day, '%H:%M').time() if end_of_day else None
+        self.max_bytes_per_second = max_bytes_per_second
+        self.on_backup = on_backup
+        self.backup_dir = get_backup_dir(data_manager)
+        self.metrics_file = os.path.join(self.backup_dir, "backup_metrics.txt")
+
+        self.history = deque(maxlen=METRICS_HISTORY)
+        self._stop_event = threading.Event()
+        self._run_now_event = threading.Event()
+        self._thread = None
+        self._last_backup = None
+        self._last_end_of_day = None
+
+        # Throttle state for the backup currently running
+        self._throttle_start = 0.0
+        self._throttle_bytes = 0
+        self._throttle_wait = 0.0
+
+    def start(self):
+        """Start the background backup thread"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stop_event.clear()
+        self._last_backup = datetime.now()
+        self._thread = threading.Thread(target=self._run, name="BackupScheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """Stop the backup thread, letting a backup in progress finish"""
+        self._stop_event.set()
+        self._run_now_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def request_backup(self):
+        """Ask the backup thread to take a snapshot as soon as possible"""
+        self._run_now_event.set()
+
+    def get_metrics(self):
+        """Get metrics of recent backups, oldest first"""
+        return list(self.history)
+
+    def _run(self):
+        """Wait for each backup to become due and take it"""
+        while not self._stop_event.is_set():
+            now = datetime.now()
+            trigger = self._due_trigger(now)
+
+            if trigger is None:
+                wait = (self._next_due(now) - now).total_seconds()
+                self._run_now_event.wait(max(1.0, min(wait, 60.0)))
+                if self._run_now_event.is_set() and not self._stop_event.is_set():
+                    self._run_now_event.clear()
+                    trigger = 'manual'
+                else:
+                    continue
+
+            try:
+                self.backup(trigger)
+            except Exception as e:
+                self._record({
+                    'trigger': trigger,
+                    'started_at': now.strftime('%Y-%m-%d %H:%M:%S'),
+                    'error': str(e)
+                })
+            self._last_backup = datetime.now()
+
+    def _due_trigger(self, now):
+        """Get the reason a backup is due now, or None"""
+        if self.end_of_day:
+            closing = datetime.combine(now.date(), self.end_of_day)
+            if now >= closing and self._last_end_of_day != now.date():
+                self._last_end_of_day = now.date()
+                return 'end_of_day'
+
+        if self.interval and now - self._last_backup >= self.interval:
+            return 'interval'
+
+        return None
+
+    def _next_due(self, now):
+        """Get the time the next scheduled backup is due"""
+        candidates = []
+        if self.interval:
+            candidates.append(self._last_backup + self.interval)
+        if self.end_of_day:
+            closing = datetime.combine(now.date(), self.end_of_day)
+            if self._last_end_of_day == now.date():
+                closing += timedelta(days=1)
+            candidates.append(closing)
+        return min(candidates) if candidates else now + timedelta(hours=1)
+
+    def backup(self, trigger='manual'):
+        """Take a throttled snapshot and record its metrics"""
+        started_at = datetime.now()
+        start_time = time.perf_counter()
+
+        # The data files are only locked while the changeable ones are copied
+        # out; archive segments, chunking, compression and writes come after
+        files = self.data_manager.read_data_files()
+        read_seconds = time.perf_counter() - start_time
+
+        self._throttle_start = time.perf_counter()
+        self._throttle_bytes = 0
+        self._throttle_wait = 0.0
+
+        store = BackupStore(self.backup_dir, write_limiter=self._throttle)
+        snapshot_id, stats = store.create_snapshot(files)
+        removed, freed_chunks = store.prune(BACKUP_KEEP_LAST, BACKUP_KEEP_DAILY)
+
+        metrics = {
+            'snapshot_id': snapshot_id,
+            'trigger': trigger,
+            'started_at': started_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'duration': time.perf_counter() - start_time,
+            'read_seconds': read_seconds,
+            'throttled_seconds': self._throttle_wait,
+            'bytes': stats['bytes'],
+            'stored_bytes': stats['stored_bytes'],
+            'chunks': stats['chunks'],
+            'new_chunks': stats['new_chunks'],
+            'pruned_snapshots': len(removed),
+            'freed_chunks': freed_chunks
+        }
+        self._record(metrics)
+        return metrics
+
+    def _throttle(self, nbytes):
+        """Sleep as needed to keep backup writes under the byte rate limit"""
+        if not self.max_bytes_per_second:
+            return
+
+        self._throttle_bytes += nbytes
+        allowed_at = self._throttle_start + self._throttle_bytes / self.max_bytes_per_second
+        delay = allowed_at - time.perf_counter()
+        if delay > 0:
+            self._throttle_wait += delay
+            self._stop_event.wait(delay)
+
+    def _record(self, metrics):
+        """Keep metrics in memory, append them to the metrics log and report them"""
+        self.history.append(metrics)
+
+        try:
+            with open(self.metrics_file, 'a') as f:
+                f.write(json.dumps(metrics) + '\n')
+        except OSError:
+            pass  # Metrics are informational only
+
+        if self.on_backup:
+            self.on_backup(metrics)
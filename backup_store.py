@@ -0,0 +1,287 @@
+import os
+import json
+import gzip
+import time
+import hashlib
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency, fall back to gzip
+    zstandard = None
+
+# Content-defined chunking parameters (average chunk ~64 KB)
+CHUNK_WINDOW = 48
+CHUNK_MASK = (1 << 16) - 1
+MIN_CHUNK_SIZE = 16 * 1024
+MAX_CHUNK_SIZE = 256 * 1024
+SCAN_BLOCK_SIZE = 4 * 1024 * 1024
+
+# One lock per backup directory, shared by every store using it
+_directory_locks = {}
+_directory_locks_guard = threading.Lock()
+
+# Random value per byte, fixed so chunk boundaries are stable between runs
+GEAR_TABLE = np.random.default_rng(0x5EED).integers(0, 2 ** 32, 256, dtype=np.uint64)
+
+
+def chunk_boundaries(data):
+    """Find content-defined cut points in a bytes object
+
+    A rolling sum of GEAR_TABLE values over the last CHUNK_WINDOW bytes is
+    computed with NumPy; positions where its low bits are zero become
+    candidate cuts, so an insertion only changes the chunks around it.
+    """
+    size = len(data)
+    candidates = []
+
+    # Scan in blocks so the uint64 working arrays stay small
+    for block_start in range(0, size, SCAN_BLOCK_SIZE):
+        scan_start = max(0, block_start - CHUNK_WINDOW)
+        block = np.frombuffer(data, dtype=np.uint8, count=min(size, block_start + SCAN_BLOCK_SIZE) - scan_start,
+                              offset=scan_start)
+        sums = np.cumsum(GEAR_TABLE[block])
+        window = sums[CHUNK_WINDOW:] - sums[:-CHUNK_WINDOW]
+
+        # window[i] covers the bytes ending at scan_start + i + CHUNK_WINDOW
+        hits = np.flatnonzero((window & CHUNK_MASK) == 0) + scan_start + CHUNK_WINDOW + 1
+        candidates.extend(hits[hits > block_start].tolist())
+
+    # Apply minimum and maximum chunk sizes
+    cuts = []
+    last_cut = 0
+    for position in candidates:
+        while position - last_cut > MAX_CHUNK_SIZE:
+            last_cut += MAX_CHUNK_SIZE
+            cuts.append(last_cut)
+        if position - last_cut >= MIN_CHUNK_SIZE:
+            cuts.append(position)
+            last_cut = position
+    while size - last_cut > MAX_CHUNK_SIZE:
+        last_cut += MAX_CHUNK_SIZE
+        cuts.append(last_cut)
+    if size > last_cut:
+        cuts.append(size)
+
+    return cuts
+
+
+class BackupStore:
+    def __init__(self, backup_dir="data/backups", write_limiter=None):
+        """Initialize the store; write_limiter(nbytes) is called before each chunk write"""
+        self.backup_dir = backup_dir
+        self.chunks_dir = os.path.join(backup_dir, "chunks")
+        self.snapshots_dir = os.path.join(backup_dir, "snapshots")
+        self.write_limiter = write_limiter
+        with _directory_locks_guard:
+            self._lock = _directory_locks.setdefault(os.path.abspath(backup_dir), threading.Lock())
+
+        os.makedirs(self.chunks_dir, exist_ok=True)
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+
+    # Snapshot functions
+    def create_snapshot(self, files):
+        """Store a snapshot of files, given as name -> path or name -> bytes
+
+        Only chunks not already in the store are compressed and written.
+        Returns the snapshot id and its statistics.
+        """
+        start_time = time.perf_counter()
+
+        with self._lock:
+            snapshot_id = self._new_snapshot_id()
+            manifest = {
+                'id': snapshot_id,
+                'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'files': {}
+            }
+            stats = {'files': 0, 'bytes': 0, 'chunks': 0, 'new_chunks': 0, 'stored_bytes': 0}
+
+            for name, source in files.items():
+                if isinstance(source, (bytes, bytearray)):
+                    data = bytes(source)
+                elif os.path.exists(source):
+                    with open(source, 'rb') as f:
+                        data = f.read()
+                else:
+                    continue
+
+                chunk_hashes = []
+                start = 0
+                for end in chunk_boundaries(data):
+                    chunk = data[start:end]
+                    chunk_hash = hashlib.sha256(chunk).hexdigest()
+                    chunk_hashes.append(chunk_hash)
+
+                    written = self._store_chunk(chunk_hash, chunk)
+                    if written:
+                        stats['new_chunks'] += 1
+                        stats['stored_bytes'] += written
+                    start = end
+
+                manifest['files'][name] = {
+                    'size': len(data),
+                    'sha256': hashlib.sha256(data).hexdigest(),
+                    'chunks': chunk_hashes
+                }
+                stats['files'] += 1
+                stats['bytes'] += len(data)
+                stats['chunks'] += len(chunk_hashes)
+
+            stats['duration'] = time.perf_counter() - start_time
+            manifest['stats'] = stats
+            self._write_manifest(manifest)
+
+        return snapshot_id, stats
+
+    def restore_snapshot(self, snapshot_id, destinations):
+        """Reassemble the files of a snapshot into destinations (name -> path)"""
+        manifest = self.get_manifest(snapshot_id)
+        if manifest is None:
+            raise FileNotFoundError(f"Backup not found: {snapshot_id}")
+
+        # Rebuild and verify every file before replacing any of them
+        restored = {}
+        for name, entry in manifest['files'].items():
+            if name not in destinations:
+                continue
+
+            data = b''.join(self._load_chunk(chunk_hash) for chunk_hash in entry['chunks'])
+            if hashlib.sha256(data).hexdigest() != entry['sha256']:
+                raise ValueError(f"Backup of {name} is corrupt")
+            restored[name] = data
+
+        for name, data in restored.items():
+            temp_path = destinations[name] + '.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, destinations[name])
+
+        return list(restored)
+
+    def get_manifest(self, snapshot_id):
+        """Load the manifest of a snapshot, or None if it doesn't exist"""
+        path = os.path.join(self.snapshots_dir, f"{snapshot_id}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def list_snapshots(self):
+        """List snapshot ids, oldest first"""
+        return sorted(
+            name[:-len('.json')] for name in os.listdir(self.snapshots_dir)
+            if name.endswith('.json')
+        )
+
+    # Retention functions
+    def prune(self, keep_last=10, keep_daily=30):
+        """Delete old snapshots and the chunks only they referenced
+
+        Keeps the newest keep_last snapshots plus the newest snapshot of
+        each of the last keep_daily days.
+        """
+        with self._lock:
+            snapshot_ids = self.list_snapshots()
+            keep = set(snapshot_ids[-keep_last:]) if keep_last else set()
+
+            oldest_day = (datetime.now() - timedelta(days=keep_daily)).strftime('%Y%m%d')
+            newest_per_day = {}
+            for snapshot_id in snapshot_ids:
+                day = snapshot_id[:8]
+                if day >= oldest_day:
+                    newest_per_day[day] = snapshot_id
+            keep.update(newest_per_day.values())
+
+            removed = [snapshot_id for snapshot_id in snapshot_ids if snapshot_id not in keep]
+            for snapshot_id in removed:
+                os.remove(os.path.join(self.snapshots_dir, f"{snapshot_id}.json"))
+
+            freed_chunks = self._collect_garbage()
+
+        return removed, freed_chunks
+
+    def collect_garbage(self):
+        """Delete chunks that no snapshot references"""
+        with self._lock:
+            return self._collect_garbage()
+
+    def _collect_garbage(self):
+        """Mark chunks referenced by any manifest and sweep the rest"""
+        referenced = set()
+        for snapshot_id in self.list_snapshots():
+            for entry in self.get_manifest(snapshot_id)['files'].values():
+                referenced.update(entry['chunks'])
+
+        freed = 0
+        for prefix in os.listdir(self.chunks_dir):
+            prefix_dir = os.path.join(self.chunks_dir, prefix)
+            for name in os.listdir(prefix_dir):
+                if name.split('.')[0] not in referenced:
+                    os.remove(os.path.join(prefix_dir, name))
+                    freed += 1
+
+        return freed
+
+    # Chunk storage functions
+    def _chunk_path(self, chunk_hash, extension):
+        """Get the path of a stored chunk"""
+        return os.path.join(self.chunks_dir, chunk_hash[:2], f"{chunk_hash}.{extension}")
+
+    def _store_chunk(self, chunk_hash, chunk):
+        """Compress and write a chunk unless it is already stored
+
+        Returns the number of bytes written.
+        """
+        for extension in ('zst', 'gz'):
+            if os.path.exists(self._chunk_path(chunk_hash, extension)):
+                return 0
+
+        if zstandard is not None:
+            extension = 'zst'
+            compressed = zstandard.ZstdCompressor(level=3).compress(chunk)
+        else:
+            extension = 'gz'
+            compressed = gzip.compress(chunk, compresslevel=6, mtime=0)
+
+        if self.write_limiter:
+            self.write_limiter(len(compressed))
+
+        path = self._chunk_path(chunk_hash, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(compressed)
+        os.replace(path + '.tmp', path)
+
+        return len(compressed)
+
+    def _load_chunk(self, chunk_hash):
+        """Read and decompress a stored chunk"""
+        path = self._chunk_path(chunk_hash, 'zst')
+        if os.path.exists(path):
+            if zstandard is None:
+                raise RuntimeError("The zstandard package is needed to restore this backup")
+            with open(path, 'rb') as f:
+                return zstandard.ZstdDecompressor().decompress(f.read())
+
+        with open(self._chunk_path(chunk_hash, 'gz'), 'rb') as f:
+            return gzip.decompress(f.read())
+
+    def _new_snapshot_id(self):
+        """Create a timestamp id that doesn't clash with an existing snapshot"""
+        base_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        snapshot_id = base_id
+        counter = 1
+        while os.path.exists(os.path.join(self.snapshots_dir, f"{snapshot_id}.json")):
+            snapshot_id = f"{base_id}_{counter}"
+            counter += 1
+        return snapshot_id
+
+    def _write_manifest(self, manifest):
+        """Write a snapshot manifest atomically"""
+        path = os.path.join(self.snapshots_dir, f"{manifest['id']}.json")
+        with open(path + '.tmp', 'w') as f:
+            f.write(json.dumps(manifest, indent=2))
+        os.replace(path + '.tmp', path)
@@ -0,0 +1,302 @@
+import threading
+from itertools import combinations
+
+import numpy as np
+
+from data_manager import DAY_CLOSED
+from inventory_forecast import HISTORY_DAYS
+from records import item_key
+
+# Mining thresholds
+MIN_SUPPORT = 0.001  # Share of baskets an itemset must appear in
+MIN_SUPPORT_COUNT = 3  # ...and never fewer baskets than this
+MIN_CONFIDENCE = 0.1  # Share of antecedent baskets that also hold the suggestion
+MIN_LIFT = 1.0  # Only pairings that happen more often than by chance
+MAX_BASKET_ITEMS = 20  # Larger (catering) orders are left out of pair/triple counts
+
+# Item indices are packed into one int64 code per itemset, 20 bits each
+ITEM_BITS = 20
+ITEM_MASK = (1 << ITEM_BITS) - 1
+
+
+def itemset_codes(baskets, size):
+    """Get the packed code of every itemset of a given size in each basket
+
+    Baskets are sorted arrays of distinct item indices. Baskets of equal
+    length are stacked so each combination of columns is one vector op.
+    """
+    by_length = {}
+    for basket in baskets:
+        if size <= len(basket) <= MAX_BASKET_ITEMS:
+            by_length.setdefault(len(basket), []).append(basket)
+
+    codes = [np.empty(0, dtype=np.int64)]
+    for length, rows in by_length.items():
+        rows = np.array(rows, dtype=np.int64)
+        for columns in combinations(range(length), size):
+            code = rows[:, columns[0]]
+            for column in columns[1:]:
+                code = (code << ITEM_BITS) | rows[:, column]
+            codes.append(code)
+
+    return np.concatenate(codes)
+
+
+def count_codes(codes, counts=None):
+    """Collapse codes into sorted unique codes and their total counts"""
+    if counts is None:
+        return np.unique(codes, return_counts=True)
+
+    unique, inverse = np.unique(codes, return_inverse=True)
+    return unique, np.bincount(inverse, weights=counts, minlength=len(unique)).astype(np.int64)
+
+
+def merge_counts(codes, counts, new_codes, new_counts):
+    """Add one set of itemset counts to another"""
+    return count_codes(np.concatenate([codes, new_codes]), np.concatenate([counts, new_counts]))
+
+
+def lookup_counts(codes, counts, wanted):
+    """Get the counts for wanted codes, 0 where a code was never seen"""
+    if not len(codes):
+        return np.zeros(len(wanted), dtype=np.int64)
+
+    positions = np.minimum(np.searchsorted(codes, wanted), len(codes) - 1)
+    return np.where(codes[positions] == wanted, counts[positions], 0)
+
+
+class BasketAnalyzer:
+    def __init__(self, data_manager):
+        """Initialize the analyzer with a data manager instance"""
+        self.data_manager = data_manager
+
+        # Item vocabulary by menu item id (name for unlisted items); indices
+        # are stable for the life of the counts, names are the latest sold
+        self.item_keys = []
+        self.item_names = []
+        self.item_index = {}
+
+        # Baskets seen, per item counts and sorted pair/triple codes with counts
+        self.n_baskets = 0
+        self.item_counts = np.zeros(0, dtype=np.int64)
+        self.pair_codes = np.empty(0, dtype=np.int64)
+        self.pair_counts = np.empty(0, dtype=np.int64)
+        self.triple_codes = np.empty(0, dtype=np.int64)
+        self.triple_counts = np.empty(0, dtype=np.int64)
+
+        # New sales are folded in from change events between full rebuilds
+        self._lock = threading.Lock()
+        self._version = None
+        self._pending_sales = []
+        self._pending_events = 0
+        self._rebuild_thread = None
+        self._rules = None
+        self._rules_by_antecedent = None
+        data_manager.subscribe(self.on_data_changed)
+
+    def on_data_changed(self, event):
+        """Queue sales added since the counts were last brought up to date"""
+        if event['store'] == 'sales':
+            with self._lock:
+                # Closing a day moves sales to the archive without changing them
+                self._pending_events += 1
+                if event['type'] != DAY_CLOSED:
+                    self._pending_sales.append(event.get('sale'))
+
+    def sync(self, wait=True):
+        """Bring the counts up to date, rebuilding only if sale events were missed
+
+        A rebuild runs on a background thread and the counts are not used
+        until it is done. With wait=False this returns False instead of
+        waiting for one, and True once the counts are up to date.
+        """
+        thread = self._rebuild_thread
+        if thread is not None:
+            if not wait:
+                return False
+            thread.join()
+
+        version = self.data_manager.get_versions()['sales']
+        with self._lock:
+            pending, pending_events = self._pending_sales, self._pending_events
+            self._pending_sales, self._pending_events = [], 0
+
+        if version == self._version:
+            return True
+
+        missed = self._version is None or version - self._version != pending_events or None in pending
+        if missed:
+            self._rebuild_thread = threading.Thread(target=self._rebuild, args=(version,), daemon=True)
+            self._rebuild_thread.start()
+            if not wait:
+                return False
+            self._rebuild_thread.join()
+            return True
+
+        self.add_baskets(pending)
+        self._version = version
+        return True
+
+    def _rebuild(self, version):
+        """Rebuild the counts as of a sales version, on the rebuild thread"""
+        try:
+            self.rebuild()
+            self._version = version
+        finally:
+            self._rebuild_thread = None
+
+    def rebuild(self):
+        """Count the sales of the last HISTORY_DAYS business days from scratch
+
+        Baskets come from the sale line store rather than the sales
+        themselves, so archived days are never decompressed. Line rows only
+        know menu item ids, so only items on the menu are counted.
+        """
+        menu_names = {item['id']: item.get('name') for item in self.data_manager.get_menu_items()}
+        lines = self.data_manager.get_sale_lines()
+        first_day = np.datetime64(self.data_manager.business_date(), 'D').astype(np.int64) - HISTORY_DAYS + 1
+        lines = lines[(lines['business_day'] >= first_day) & np.isin(lines['item_id'], list(menu_names))]
+
+        # Distinct (sale, item) rows grouped by sale give the baskets
+        item_ids, indices = np.unique(lines['item_id'], return_inverse=True)
+        rows = np.unique(np.column_stack([lines['sale_id'], indices]), axis=0)
+        baskets = np.split(rows[:, 1], np.flatnonzero(np.diff(rows[:, 0])) + 1) if len(rows) else []
+
+        self.item_keys = item_ids.tolist()
+        self.item_names = [menu_names[item_id] for item_id in self.item_keys]
+        self.item_index = {key: i for i, key in enumerate(self.item_keys)}
+        self.n_baskets = 0
+        self.item_counts = np.zeros(0, dtype=np.int64)
+        self.pair_codes = self.pair_counts = np.empty(0, dtype=np.int64)
+        self.triple_codes = self.triple_counts = np.empty(0, dtype=np.int64)
+        self.count_baskets(baskets)
+
+    def add_baskets(self, sales):
+        """Fold the baskets of new sales into the counts"""
+        self.count_baskets([self._basket(sale) for sale in sales])
+
+    def count_baskets(self, baskets):
+        """Fold baskets, as sorted arrays of distinct item indices, into the counts"""
+        baskets = [basket for basket in baskets if len(basket)]
+        if not baskets:
+            return
+
+        self.n_baskets += len(baskets)
+        if len(self.item_counts) < len(self.item_names):
+            self.item_counts = np.concatenate([
+                self.item_counts, np.zeros(len(self.item_names) - len(self.item_counts), dtype=np.int64)
+            ])
+        self.item_counts += np.bincount(np.concatenate(baskets), minlength=len(self.item_names))
+
+        new_pairs = count_codes(itemset_codes(baskets, 2))
+        new_triples = count_codes(itemset_codes(baskets, 3))
+        self.pair_codes, self.pair_counts = merge_counts(self.pair_codes, self.pair_counts, *new_pairs)
+        self.triple_codes, self.triple_counts = merge_counts(self.triple_codes, self.triple_counts, *new_triples)
+        self._rules = None
+
+    def _basket(self, sale):
+        """Turn a sale's line items into a sorted array of distinct item indices"""
+        indices = set()
+        for item in sale.get('items', []):
+            key = item_key(item)
+            index = self.item_index.get(key)
+            if index is None:
+                index = len(self.item_keys)
+                self.item_index[key] = index
+                self.item_keys.append(key)
+                self.item_names.append(item.get('name'))
+            else:
+                self.item_names[index] = item.get('name')
+            indices.add(index)
+        return np.array(sorted(indices), dtype=np.int64)
+
+    def rules(self):
+        """Get association rules as dicts of antecedent, consequent, support, confidence and lift
+
+        Pairs give one-item antecedents in both directions and triples give
+        two-item antecedents for each of their items. Sorted by lift, then
+        confidence.
+        """
+        self.sync()
+        if self._rules is not None:
+            return self._rules
+
+        min_count = max(MIN_SUPPORT_COUNT, MIN_SUPPORT * self.n_baskets)
+        antecedents, consequents, counts, antecedent_counts = [], [], [], []
+
+        # Pairs {a, b}: a -> b and b -> a
+        keep = self.pair_counts >= min_count
+        pair_codes, pair_counts = self.pair_codes[keep], self.pair_counts[keep]
+        first, second = pair_codes >> ITEM_BITS, pair_codes & ITEM_MASK
+        for antecedent, consequent in ((first, second), (second, first)):
+            antecedents.append(antecedent[:, None])
+            consequents.append(consequent)
+            counts.append(pair_counts)
+            antecedent_counts.append(self.item_counts[antecedent])
+
+        # Triples {a, b, c}: the pair of any two implies the third
+        keep = self.triple_counts >= min_count
+        triple_codes, triple_counts = self.triple_codes[keep], self.triple_counts[keep]
+        items = [(triple_codes >> (2 * ITEM_BITS)) & ITEM_MASK, (triple_codes >> ITEM_BITS) & ITEM_MASK,
+                 triple_codes & ITEM_MASK]
+        for left, right, consequent in ((0, 1, 2), (0, 2, 1), (1, 2, 0)):
+            pair = (items[left] << ITEM_BITS) | items[right]
+            rule_counts = lookup_counts(self.pair_codes, self.pair_counts, pair)
+            valid = rule_counts > 0
+            antecedents.append(np.column_stack([items[left], items[right]])[valid])
+            consequents.append(items[consequent][valid])
+            counts.append(triple_counts[valid])
+            antecedent_counts.append(rule_counts[valid])
+
+        rules = []
+        for antecedent, consequent, count, antecedent_count in zip(antecedents, consequents, counts,
+                                                                 antecedent_counts):
+            if not len(count):
+                continue
+            confidence = count / antecedent_count
+            lift = confidence / (self.item_counts[consequent] / self.n_baskets)
+            keep = (confidence >= MIN_CONFIDENCE) & (lift > MIN_LIFT)
+            for row in np.flatnonzero(keep):
+                rules.append({
+                    'antecedent': [self.item_names[i] for i in antecedent[row]],
+                    'consequent': self.item_names[consequent[row]],
+                    'antecedent_keys': [self.item_keys[i] for i in antecedent[row]],
+                    'consequent_key': self.item_keys[consequent[row]],
+                    'count': int(count[row]),
+                    'support': float(count[row] / self.n_baskets),
+                    'confidence': float(confidence[row]),
+                    'lift': float(lift[row])
+                })
+
+        rules.sort(key=lambda rule: (rule['lift'], rule['confidence']), reverse=True)
+
+        self._rules = rules
+        self._rules_by_antecedent = {}
+        for rule in rules:
+            self._rules_by_antecedent.setdefault(frozenset(rule['antecedent_keys']), []).append(rule)
+        return rules
+
+    def suggest(self, cart_keys, k=3):
+        """Get up to k item ids frequently added together with the items (by id) in a cart
+
+        Called on every cart change, so it never waits: nothing is suggested
+        for an empty cart or while the counts are being rebuilt.
+        """
+        if not cart_keys or not self.sync(wait=False):
+            return []
+
+        self.rules()
+        cart = set(cart_keys)
+
+        # Rules whose antecedent is one cart item or a pair of them
+        keys = [frozenset([key]) for key in cart]
+        keys += [frozenset(pair) for pair in combinations(cart, 2)]
+
+        best = {}
+        for key in keys:
+            for rule in self._rules_by_antecedent.get(key, []):
+                consequent = rule['consequent_key']
+                if consequent not in cart and rule['confidence'] > best.get(consequent, 0):
+                    best[consequent] = rule['confidence']
+
+        return sorted(best, key=best.get, reverse=True)[:k]
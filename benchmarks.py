@@ -0,0 +1,126 @@
+import gc
+import json
+import time
+import random
+import argparse
+import tracemalloc
+
+from records import sale_from_json
+from store_codecs import JsonArrayCodec, JsonLinesCodec, CODECS, orjson
+
+BENCHMARK_SEED = 7
+ITEM_NAMES = [f"Menu Item {i}" for i in range(60)]
+
+
+def synthetic_sales_json(n_sales, seed=BENCHMARK_SEED):
+    """Build the text of a sales file with n_sales realistic sales"""
+    rng = random.Random(seed)
+    sales = []
+    sale_id = 1700000000000
+    for i in range(n_sales):
+        items = [
+            {'name': rng.choice(ITEM_NAMES), 'price': rng.choice([20, 35, 49.5, 60, 120]), 'quantity': rng.randint(1, 3)}
+            for _ in range(rng.randint(1, 4))
+        ]
+        sale_id += rng.randint(1, 5000)
+        sales.append({
+            'items': items,
+            'total_amount': sum(item['price'] * item['quantity'] for item in items),
+            'date': f"2026-{1 + i * 12 // n_sales:02d}-{rng.randint(1, 28):02d}",
+            'payment_method': rng.choice(['Cash', 'Card', 'UPI']),
+            'id': sale_id,
+            'timestamp': f"2026-01-01 {rng.randint(7, 22):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}"
+        })
+    return json.dumps(sales, indent=2)
+
+
+def measure(load, text):
+    """Load text once for time and once under tracemalloc for retained memory"""
+    gc.collect()
+    start = time.perf_counter()
+    records = load(text)
+    seconds = time.perf_counter() - start
+    del records
+
+    gc.collect()
+    tracemalloc.start()
+    records = load(text)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return seconds, retained, peak
+
+
+def bench_record_memory(n_sales):
+    """Compare memory held by sales loaded as plain dicts and as slotted records"""
+    text = synthetic_sales_json(n_sales)
+    results = {
+        'dicts': measure(json.loads, text),
+        'records': measure(lambda data: json.loads(data, object_hook=sale_from_json), text),
+    }
+
+    print(f"Sales history of {n_sales} sales ({len(text) / 1e6:.1f} MB of JSON)")
+    for label, (seconds, retained, peak) in results.items():
+        print(f"  {label:8} load {seconds:6.2f}s  retained {retained / 1e6:8.1f} MB  "
+              f"({retained / n_sales:5.0f} B/sale)  peak {peak / 1e6:8.1f} MB")
+
+    saved = 1 - results['records'][1] / results['dicts'][1]
+    print(f"  records hold {saved:.0%} less memory")
+    return results
+
+
+def timed(function, *args):
+    """Call function once, returning its result and the seconds it took"""
+    gc.collect()
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_codecs(n_sales):
+    """Compare save time, load time and size on disk of each data file codec
+
+    Runs for 10k, 100k and 1M sales, up to the --sales given.
+    """
+    codecs = {'json': JsonArrayCodec(), 'jsonl': JsonLinesCodec(use_orjson=False)}
+    if orjson:
+        codecs['jsonl+orjson'] = JsonLinesCodec()
+    if 'msgpack' in CODECS:
+        codecs['msgpack'] = CODECS['msgpack']
+
+    results = {}
+    for size in [size for size in (10000, 100000, 1000000) if size <= n_sales] or [n_sales]:
+        sales = json.loads(synthetic_sales_json(size), object_hook=sale_from_json)
+        print(f"Sales file of {size} sales")
+        for label, codec in codecs.items():
+            data, save_seconds = timed(codec.dump, sales)
+            loaded, load_seconds = timed(codec.load, data, sale_from_json)
+            assert len(loaded) == size
+            del loaded
+            results[size, label] = (save_seconds, load_seconds, len(data))
+            print(f"  {label:13} save {save_seconds:6.2f}s  load {load_seconds:6.2f}s  "
+                  f"size {len(data) / 1e6:8.1f} MB  ({len(data) / size:4.0f} B/sale)")
+    return results
+
+
+BENCHMARKS = {
+    'records': bench_record_memory,
+    'codecs': bench_codecs,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cost of loading and holding cafe data")
+    parser.add_argument("benchmarks", nargs='*', help=f"Benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument("--sales", type=int, default=200000, help="Sales in the synthetic history")
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark: {name}")
+
+    for name in args.benchmarks or BENCHMARKS:
+        BENCHMARKS[name](args.sales)
+
+
+if __name__ == "__main__":
+    main()
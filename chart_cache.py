@@ -0,0 +1,229 @@
+# Colormap for heatmap cells, light for quiet hours and dark for busy ones
+HEATMAP_COLORMAP = 'YlOrBr'
+
+
+def bar_label_position(bar, horizontal, offset):
+    """Get where a bar's value label goes: past its end, centred on it"""
+    if horizontal:
+        return bar.get_width() + offset, bar.get_y() + bar.get_height() / 2
+    return bar.get_x() + bar.get_width() / 2., bar.get_height() + offset
+
+
+def draw_bar_chart(ax, chart, colors):
+    """Draw a bar chart described by a chart dict and return its artists
+
+    The chart dict holds the prepared data: 'categories', 'values',
+    'bar_colors' and 'value_labels', plus 'title', 'xlabel', 'ylabel',
+    'horizontal', 'label_offset', and optionally 'kind' ('bar'), 'markers' (with
+    'marker_label'), 'value_max', 'invert' and 'empty_message'.
+    """
+    ax.set_facecolor(colors["background"])
+
+    if not chart['categories']:
+        ax.text(0.5, 0.5, chart.get('empty_message', "No data available"),
+                ha='center', va='center', transform=ax.transAxes,
+                fontsize=12, color=colors["primary"])
+        return None
+
+    horizontal = chart.get('horizontal', False)
+    offset = chart.get('label_offset', 0)
+    draw_bars = ax.barh if horizontal else ax.bar
+    bars = draw_bars(chart['categories'], chart['values'], color=chart['bar_colors'])
+
+    # Add data labels at the end of each bar
+    texts = []
+    for bar, label in zip(bars, chart['value_labels']):
+        x, y = bar_label_position(bar, horizontal, offset)
+        if horizontal:
+            texts.append(ax.text(x, y, label, ha='left', va='center'))
+        else:
+            texts.append(ax.text(x, y, label, ha='center', va='bottom'))
+
+    markers = None
+    if chart.get('markers') is not None:
+        markers = ax.scatter(chart['markers'], range(len(chart['markers'])), marker='|', s=200,
+                             color=colors["primary"], label=chart.get('marker_label'), zorder=3)
+        ax.legend(loc='lower right')
+
+    if chart.get('invert'):
+        ax.invert_yaxis()
+
+    # Set chart title and labels
+    ax.set_title(chart['title'], color=colors["primary"])
+    if chart.get('xlabel'):
+        ax.set_xlabel(chart['xlabel'], color=colors["primary"])
+    if chart.get('ylabel'):
+        ax.set_ylabel(chart['ylabel'], color=colors["primary"])
+
+    # Add grid lines along the value axis
+    ax.grid(axis='x' if horizontal else 'y', linestyle='--', alpha=0.7)
+    set_value_limits(ax, chart)
+
+    return {'bars': bars, 'texts': texts, 'markers': markers}
+
+
+def update_bar_chart(ax, artists, old_chart, chart):
+    """Move existing bars and labels to new values if the categories are unchanged
+
+    Returns False when the chart has to be drawn again instead.
+    """
+    if artists is None or not chart['categories']:
+        return False
+    if list(chart['categories']) != list(old_chart['categories']):
+        return False
+    if (chart.get('markers') is None) != (artists['markers'] is None):
+        return False
+
+    horizontal = chart.get('horizontal', False)
+    offset = chart.get('label_offset', 0)
+    bar_colors = chart['bar_colors']
+    if isinstance(bar_colors, str):
+        bar_colors = [bar_colors] * len(chart['values'])
+
+    for bar, text, value, color, label in zip(artists['bars'], artists['texts'], chart['values'],
+                                               bar_colors, chart['value_labels']):
+        if horizontal:
+            bar.set_width(value)
+        else:
+            bar.set_height(value)
+        bar.set_facecolor(color)
+        text.set_position(bar_label_position(bar, horizontal, offset))
+        text.set_text(label)
+
+    if artists['markers'] is not None:
+        artists['markers'].set_offsets(list(zip(chart['markers'], range(len(chart['markers'])))))
+
+    # Rescale the value axis to the new bar lengths
+    ax.relim()
+    ax.autoscale_view()
+    set_value_limits(ax, chart)
+    return True
+
+
+def set_value_limits(ax, chart):
+    """Start the value axis at zero, capping it if the chart asks for it"""
+    if chart.get('horizontal', False):
+        ax.set_xlim(left=0)
+        if chart.get('value_max') is not None:
+            ax.set_xlim(right=chart['value_max'])
+    else:
+        ax.set_ylim(bottom=0)
+        if chart.get('value_max') is not None:
+            ax.set_ylim(top=chart['value_max'])
+
+
+def draw_heatmap_chart(ax, chart, colors):
+    """Draw a heatmap described by a chart dict and return its artists
+
+    The chart dict has 'kind' set to 'heatmap' and holds 'cells' (a 2D array),
+    'row_labels', 'column_labels', 'title', 'xlabel', 'ylabel',
+    'colorbar_label' and optionally 'empty_message'.
+    """
+    ax.set_facecolor(colors["background"])
+
+    if not chart['cells'].any():
+        ax.text(0.5, 0.5, chart.get('empty_message', "No data available"),
+                ha='center', va='center', transform=ax.transAxes,
+                fontsize=12, color=colors["primary"])
+        return None
+
+    image = ax.imshow(chart['cells'], aspect='auto', cmap=HEATMAP_COLORMAP, interpolation='nearest')
+
+    # Label every row, but only every third column to keep labels readable
+    ax.set_yticks(range(len(chart['row_labels'])), labels=chart['row_labels'])
+    columns = range(0, len(chart['column_labels']), 3)
+    ax.set_xticks(columns, labels=[chart['column_labels'][i] for i in columns])
+
+    # The colorbar lives inside the heatmap axes so it hides along with them
+    colorbar = ax.figure.colorbar(image, cax=ax.inset_axes([1.02, 0, 0.03, 1]))
+    colorbar.set_label(chart['colorbar_label'], color=colors["primary"])
+
+    ax.set_title(chart['title'], color=colors["primary"])
+    ax.set_xlabel(chart['xlabel'], color=colors["primary"])
+    ax.set_ylabel(chart['ylabel'], color=colors["primary"])
+
+    return {'image': image, 'colorbar': colorbar}
+
+
+def update_heatmap_chart(ax, artists, old_chart, chart):
+    """Swap new cell values into an existing heatmap
+
+    Returns False when the chart has to be drawn again instead.
+    """
+    if artists is None or not chart['cells'].any():
+        return False
+    if chart['cells'].shape != old_chart['cells'].shape:
+        return False
+
+    # The colorbar follows the image's color limits
+    artists['image'].set_data(chart['cells'])
+    artists['image'].set_clim(chart['cells'].min(), chart['cells'].max())
+    ax.set_title(chart['title'], color=ax.title.get_color())
+    return True
+
+
+# Draw and in-place update functions for each chart kind
+CHART_KINDS = {
+    'bar': (draw_bar_chart, update_bar_chart),
+    'heatmap': (draw_heatmap_chart, update_heatmap_chart),
+}
+
+
+class ChartCache:
+    def __init__(self, figure, canvas, colors):
+        """Initialize the cache for the reports shown on one figure"""
+        self.figure = figure
+        self.canvas = canvas
+        self.colors = colors
+
+        # Report type -> axes, artists, prepared chart, data version and rendered pixels
+        self.entries = {}
+        self.current = None
+
+        # Rendered pixels only fit the canvas size they were captured at
+        canvas.mpl_connect('resize_event', self.on_resize)
+
+    def on_resize(self, event):
+        """Drop rendered pixels after the canvas changed size"""
+        for entry in self.entries.values():
+            entry['pixels'] = None
+
+    def show(self, report_type, version, prepare):
+        """Show a report, rebuilding it only if its data version changed
+
+        Each report keeps its own axes; switching back to an unchanged report
+        blits its saved pixels. prepare() returns the chart dict and is only
+        called when the version differs from the cached one.
+        """
+        if self.current is not None and self.current != report_type:
+            self.entries[self.current]['ax'].set_visible(False)
+        self.current = report_type
+
+        entry = self.entries.get(report_type)
+        if entry is not None and entry['version'] == version:
+            entry['ax'].set_visible(True)
+            if entry['pixels'] is not None and entry['size'] == self.canvas.get_width_height():
+                self.canvas.restore_region(entry['pixels'])
+                self.canvas.blit(self.figure.bbox)
+                return
+        else:
+            chart = prepare()
+            if entry is None:
+                ax = self.figure.add_subplot(111, label=report_type)
+                entry = {'ax': ax, 'artists': None, 'chart': None}
+                self.entries[report_type] = entry
+
+            ax = entry['ax']
+            ax.set_visible(True)
+            kind = chart.get('kind', 'bar')
+            draw_chart, update_chart = CHART_KINDS[kind]
+            same_kind = entry['chart'] is not None and entry['chart'].get('kind', 'bar') == kind
+            if not (same_kind and update_chart(ax, entry['artists'], entry['chart'], chart)):
+                ax.clear()
+                entry['artists'] = draw_chart(ax, chart, self.colors)
+            entry['chart'] = chart
+            entry['version'] = version
+
+        self.canvas.draw()
+        entry['pixels'] = self.canvas.copy_from_bbox(self.figure.bbox)
+        entry['size'] = self.canvas.get_width_height()
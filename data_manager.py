@@ -1,223 +1,1571 @@
 import os
+import gzip
 import json
 import time
-from datetime import datetime, date
+import heapq
+import threading
+from collections.abc import Mapping
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta
+import numpy as np
 import pandas as pd
+from utils import validate_json_file
+from records import MenuItem, Sale, InventoryItem, item_key, sale_from_json, json_default, is_amount
+from store_codecs import get_codec, detect_codec, file_codec
+from sale_lines import SaleLineStore, explode_sales
+
+try:
+    import fcntl
+except ImportError:  # Windows has no fcntl, fall back to msvcrt
+    fcntl = None
+    import msvcrt
+
+# Change event types published to subscribers
+MENU_ITEM_ADDED = 'menu_item_added'
+MENU_ITEM_UPDATED = 'menu_item_updated'
+MENU_ITEM_DELETED = 'menu_item_deleted'
+SALE_ADDED = 'sale_added'
+DAY_CLOSED = 'day_closed'
+INVENTORY_CHANGED = 'inventory_changed'
+
+# Number of ledger entries between inventory snapshot checkpoints
+INVENTORY_CHECKPOINT_INTERVAL = 500
+
+# Number of sales between sales rollup checkpoints
+ROLLUP_CHECKPOINT_INTERVAL = 500
+
+# Sales heatmap shape: weekday (Monday first) by hour of day
+HEATMAP_SHAPE = (7, 24)
+
+# Saved sales rollups in another format are rebuilt (2: amounts in paise,
+# 3: items keyed by menu item id, 4: byte spans of each day's sales)
+ROLLUP_FORMAT = 4
+
+# Layout of the data files; older directories are migrated when opened
+# (2: sale lines and stock rows carry the menu item id)
+DATA_FORMAT = 2
+
+# Codec of new record files until another is chosen with migrate_codec()
+DEFAULT_CODEC = 'json'
+
+# Bytes of the sales file read per step when converting or scanning all of it
+RECORD_CHUNK_SIZE = 4 * 1024 * 1024
+
+# gzip level of the archive segments closed days' sales are moved to
+ARCHIVE_COMPRESS_LEVEL = 6
+
+# Menu import column headings (lowercased) and the keys they fill; the
+# headings written by the menu export are accepted too
+MENU_IMPORT_COLUMNS = {
+    'name': 'name', 'item name': 'name',
+    'category': 'category',
+    'price': 'price', 'price (₹)': 'price',
+    'description': 'description',
+    'shortcut': 'shortcut', 'keyboard shortcut': 'shortcut',
+    'initial_stock': 'initial_stock', 'initial stock': 'initial_stock', 'stock': 'initial_stock'
+}
+
+def read_menu_import(filepath):
+    """Read menu items from a CSV or Excel file with prices in rupees
+    
+    Rows are validated column by column. Returns the valid rows as item
+    dicts with prices in paise, and the file row numbers that were rejected.
+    """
+    if filepath.lower().endswith(('.xlsx', '.xls')):
+        df = pd.read_excel(filepath, dtype=object)
+    else:
+        df = pd.read_csv(filepath, dtype=object, skipinitialspace=True)
+    
+    df = df.rename(columns=lambda column: MENU_IMPORT_COLUMNS.get(str(column).strip().lower(), column))
+    missing = [column for column in ('name', 'price') if column not in df.columns]
+    if missing:
+        raise ValueError(f"missing column(s): {', '.join(missing)}")
+    
+    def text(column, default=''):
+        values = df[column].fillna('').astype(str).str.strip()
+        return values.mask(values == '', default)
+    
+    def number(column):
+        if column not in df.columns:
+            return pd.Series(0.0, index=df.index)
+        values = df[column].fillna('').astype(str).str.replace(r'[₹,\s]', '', regex=True)
+        return pd.to_numeric(values.mask(values == '', '0'), errors='coerce')
+    
+    names = text('name')
+    prices = number('price')
+    stock = number('initial_stock')
+    valid = (names != '') & (prices >= 0) & (stock >= 0) & (stock == stock.round())
+    
+    # A missing price is an error rather than a free item
+    valid &= df['price'].notna()
+    
+    # Optional columns missing from the file are left out, so an upsert keeps them
+    rows = pd.DataFrame({'name': names, 'price': (prices.where(valid, 0) * 100).round().astype('int64')})
+    for column, default in (('category', 'Uncategorized'), ('description', ''), ('shortcut', '')):
+        if column in df.columns:
+            rows[column] = text(column, default)
+    if 'initial_stock' in df.columns:
+        rows['initial_stock'] = stock.where(valid, 0).astype('int64')
+    rows = rows[valid]
+    
+    # Row numbers as seen in a spreadsheet, after the heading row
+    rejected = [int(index) + 2 for index in df.index[~valid]]
+    return rows.to_dict('records'), rejected
 
 class DataManager:
-    def __init__(self):
-        self.menu_file = "data/menu.txt"
-        self.sales_file = "data/sales.txt"
-        self.inventory_file = "data/inventory.txt"
+    def __init__(self, data_dir="data"):
+        self.data_dir = data_dir
+        self.menu_file = os.path.join(data_dir, "menu.txt")
+        self.sales_file = os.path.join(data_dir, "sales.txt")
+        self.inventory_file = os.path.join(data_dir, "inventory.txt")
+        self.inventory_ledger_file = os.path.join(data_dir, "inventory_ledger.txt")
+        self.inventory_checkpoint_file = os.path.join(data_dir, "inventory_checkpoint.txt")
+        self.sales_rollup_file = os.path.join(data_dir, "sales_rollup.txt")
+        self.format_file = os.path.join(data_dir, "format.txt")
+        self.sale_lines_file = os.path.join(data_dir, "sale_lines.bin")
+        self.closed_days_file = os.path.join(data_dir, "closed_days.txt")
+        self.close_marker_file = os.path.join(data_dir, "close_pending.txt")
+        self.archive_dir = os.path.join(data_dir, "archive")
+        
+        # Held for every write so readers can take consistent snapshots; the
+        # lock file extends it to other processes sharing this directory
+        os.makedirs(data_dir, exist_ok=True)
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_file = open(os.path.join(data_dir, ".lock"), 'a+')
+        
+        # Codec for new record files; existing ones are read in whatever codec they are in
+        self.codec = get_codec(self._read_format().get('codec', DEFAULT_CODEC))
+        self._codec_migration = None
         
         # Ensure data files exist
-        self._ensure_file_exists(self.menu_file)
-        self._ensure_file_exists(self.sales_file)
-        self._ensure_file_exists(self.inventory_file)
+        with self._locked():
+            self._ensure_file_exists(self.menu_file)
+            self._ensure_file_exists(self.sales_file)
+            self._ensure_file_exists(self.inventory_file)
+            self._ensure_file_exists(self.inventory_ledger_file, '')
+        
+        # Last sale ID handed out
+        self._last_sale_id = 0
+        
+        # Version counter per store, bumped on every change
+        self.versions = {'menu': 0, 'sales': 0, 'inventory': 0}
+        self._subscribers = []
+        
+        # Current stock folded from the last checkpoint plus the ledger
+        self._inventory = None
+        self._ledger_offset = 0
+        self._ledger_seq = 0
+        self._entries_since_checkpoint = 0
+        
+        # Per-item and per-day sales counters folded from the sales file
+        self._sales_rollup = None
+        self._sales_since_checkpoint = 0
+        self._sales_file_ino = None
+        
+        # Line items of every sale as fixed-width rows for vectorised reports
+        self.sale_lines = SaleLineStore(self.sale_lines_file)
+        
+        # Menu item ids by name, cached until menu.txt is replaced
+        self._menu_ids_by_name = {}
+        self._menu_file_signature = None
+        
+        # Z-reports of closed days by date, cached until closed_days.txt is replaced
+        self._closed_days = {}
+        self._closed_days_signature = None
+        
+        self._migrate_if_needed()
+    
+    # Change notification functions
+    def subscribe(self, callback):
+        """Register a callback that receives change events"""
+        if callback not in self._subscribers:
+            self._subscribers.append(callback)
     
-    def _ensure_file_exists(self, filepath):
+    def unsubscribe(self, callback):
+        """Remove a previously registered callback"""
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+    
+    def get_versions(self):
+        """Get a snapshot of the version counter for each store"""
+        return dict(self.versions)
+    
+    def _publish(self, event_type, store, **payload):
+        """Bump the store version and notify subscribers of a change"""
+        self.versions[store] += 1
+        
+        event = {'type': event_type, 'store': store, 'version': self.versions[store]}
+        event.update(payload)
+        
+        for callback in list(self._subscribers):
+            callback(event)
+    
+    def get_data_files(self):
+        """Map the name of each data file to its path"""
+        paths = [
+            self.menu_file,
+            self.sales_file,
+            self.inventory_file,
+            self.inventory_ledger_file,
+            self.inventory_checkpoint_file,
+            self.sales_rollup_file,
+            self.format_file,
+            self.closed_days_file
+        ]
+        files = {os.path.basename(path): path for path in paths}
+        
+        # Archive segments are named by their path under the data directory
+        if os.path.isdir(self.archive_dir):
+            for name in sorted(os.listdir(self.archive_dir)):
+                if name.endswith('.gz'):
+                    files[f"archive/{name}"] = os.path.join(self.archive_dir, name)
+        return files
+    
+    def read_data_files(self):
+        """Read the raw contents of every data file as one consistent snapshot
+        
+        Archive segments never change once written, so only their names are
+        taken under the lock and their bytes are read after it is released.
+        """
+        contents = {}
+        segments = {}
+        with self._locked(shared=True):
+            for name, path in self.get_data_files().items():
+                if name.startswith('archive/'):
+                    segments[name] = path
+                elif os.path.exists(path):
+                    with open(path, 'rb') as f:
+                        contents[name] = f.read()
+        
+        for name, path in segments.items():
+            try:
+                with open(path, 'rb') as f:
+                    contents[name] = f.read()
+            except FileNotFoundError:
+                pass  # Removed by a restore meanwhile
+        return contents
+    
+    def reload(self):
+        """Drop cached state after the data files were replaced on disk"""
+        with self._locked():
+            self.codec = get_codec(self._read_format().get('codec', DEFAULT_CODEC))
+            self._ensure_file_exists(self.menu_file)
+            self._ensure_file_exists(self.sales_file)
+            self._ensure_file_exists(self.inventory_file)
+            self._ensure_file_exists(self.inventory_ledger_file, '')
+            
+            self._inventory = None
+            self._ledger_offset = 0
+            self._ledger_seq = 0
+            self._entries_since_checkpoint = 0
+            self._sales_rollup = None
+            self._sales_since_checkpoint = 0
+            self._menu_file_signature = None
+            self._closed_days = {}
+            self._closed_days_signature = None
+            
+            # Line rows are not backed up; build them again from the restored sales
+            if os.path.exists(self.sale_lines_file):
+                os.remove(self.sale_lines_file)
+            
+            self._migrate_if_needed()
+            
+            # Bump every version without an event so views do a full refresh
+            for store in self.versions:
+                self.versions[store] += 1
+    
+    def _read_format(self):
+        """Read the data layout and codec recorded in format.txt, {} if there is none"""
+        try:
+            with open(self.format_file, 'r') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (json.JSONDecodeError, FileNotFoundError):
+            return {}
+    
+    def _migrate_if_needed(self):
+        """Bring data files written in an older layout up to DATA_FORMAT"""
+        with self._locked():
+            self._recover_close()
+            data_format = self._read_format().get('format', 1)
+            
+            if data_format < 2:
+                self.migrate_item_ids()
+            
+            if data_format != DATA_FORMAT:
+                self._write_json_atomic(self.format_file, {'format': DATA_FORMAT, 'codec': self.codec.name})
+            
+            # A codec migration that was cut short carries on in the background
+            if any(file_codec(path) not in (None, self.codec) for path in self._record_files()):
+                self.migrate_codec(self.codec.name)
+    
+    def _record_files(self):
+        """Get the data files that hold records in the chosen codec"""
+        return [self.menu_file, self.sales_file, self.inventory_file]
+    
+    def migrate_codec(self, name, background=True):
+        """Convert the record files to another codec ('json', 'jsonl' or 'msgpack')
+        
+        The menu and the stock snapshot are small and converted at once. The
+        sales file is converted in a background thread (returned) unless
+        background is False; sales keep going to the old file until the new
+        one is complete.
+        """
+        codec = get_codec(name)
+        
+        with self._locked():
+            # One already under way to this codec carries on; one to another gives up
+            migration = self._codec_migration
+            if background and migration and migration.is_alive() and self.codec is codec:
+                return migration
+            
+            self.codec = codec
+            self._write_json_atomic(self.format_file, dict(self._read_format(), codec=codec.name))
+            for filepath in (self.menu_file, self.inventory_file):
+                if file_codec(filepath) not in (None, codec):
+                    self._write_records_atomic(filepath, self._read_records(filepath), codec)
+        
+        if not background:
+            self._convert_sales_file(codec)
+            return None
+        
+        self._codec_migration = threading.Thread(target=self._convert_sales_file, args=(codec,),
+                                                 name="codec-migration", daemon=True)
+        self._codec_migration.start()
+        return self._codec_migration
+    
+    def _convert_sales_file(self, codec):
+        """Rewrite the sales file in another codec while sales keep being appended to it
+        
+        Records are copied in chunks without holding the lock. Then, holding
+        it, the sales appended meanwhile are copied and the new file replaces
+        the old one.
+        """
+        temp_path = f"{self.sales_file}.{os.getpid()}.{threading.get_ident()}.migrate"
+        try:
+            while True:
+                with open(self.sales_file, 'rb') as source, open(temp_path, 'wb+') as target:
+                    old_codec = detect_codec(source.read(64))
+                    if old_codec is codec:
+                        return
+                    target.write(codec.dump([]))
+                    offset = self._copy_records(source, target, old_codec, codec, 0, final=False)
+                    
+                    with self._locked():
+                        # Another codec was chosen meanwhile
+                        if self.codec is not codec:
+                            return
+                        
+                        # A restore may have replaced the file meanwhile; start over
+                        if os.fstat(source.fileno()).st_ino != os.stat(self.sales_file).st_ino:
+                            continue
+                        
+                        self._copy_records(source, target, old_codec, codec, offset, final=True)
+                        target.flush()
+                        os.fsync(target.fileno())
+                        os.replace(temp_path, self.sales_file)
+                        
+                        # The saved counters point into the old file
+                        self._sales_rollup = None
+                        if os.path.exists(self.sales_rollup_file):
+                            os.remove(self.sales_rollup_file)
+                        break
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        
+        # Count the sales in the new file now rather than on the next report
+        self.checkpoint_sales_rollup()
+        with self._locked():
+            self._sync_sale_lines()
+    
+    def _copy_records(self, source, target, old_codec, codec, offset, final):
+        """Copy the records of a file from offset in another codec, returning where copying stopped
+        
+        Unless final, records at the very end (which may still be changing)
+        are left for a later call.
+        """
+        for records, offset in self._read_record_chunks(source, old_codec, offset, final):
+            if records:
+                codec.append(target, records)
+        return offset
+    
+    def _read_record_chunks(self, source, codec, offset, final=True, object_hook=None):
+        """Read the records of a file from offset a chunk at a time, yielding each chunk's
+        records and the offset after them
+        
+        Unless final, records at the very end (which may still be changing)
+        are left unread.
+        """
+        size = RECORD_CHUNK_SIZE
+        while True:
+            # Read again from the last whole record, as appends to a JSON
+            # array rewrite its closing bracket
+            source.seek(offset)
+            data = source.read(size)
+            at_end = len(data) < size
+            if at_end and not final:
+                return
+            
+            records, _, consumed = codec.read_records(data, offset, object_hook, final=at_end)
+            offset += consumed
+            yield records, offset
+            if at_end:
+                return
+            
+            # A record longer than a chunk needs a bigger one
+            size = RECORD_CHUNK_SIZE if consumed else size * 2
+    
+    def migrate_item_ids(self):
+        """Key existing sale lines and stock rows by menu item id, matching them by name
+        
+        Lines and rows whose name is not on the menu keep only their name.
+        """
+        with self._locked():
+            menu_ids = self._menu_ids()
+            
+            # Only the hot sales file; archived days stay in their segments
+            sales = self._read_records(self.sales_file, sale_from_json)
+            keyed = 0
+            for sale in sales:
+                for item in sale.get('items', []):
+                    if item.get('item_id') is None and item.get('name') in menu_ids:
+                        item['item_id'] = menu_ids[item['name']]
+                        keyed += 1
+            
+            if keyed:
+                self._write_records_atomic(self.sales_file, sales)
+                self._sales_rollup = None
+            
+            # Stock rows pick up their ids as the snapshot is loaded
+            self._inventory = None
+            self._load_inventory_state()
+            self.checkpoint_inventory()
+    
+    def _menu_ids(self):
+        """Map menu item names to their ids"""
+        try:
+            stat = os.stat(self.menu_file)
+            signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            signature = None
+        
+        # The menu is always replaced as a whole, so a new signature means new contents
+        if signature != self._menu_file_signature:
+            self._menu_ids_by_name = {item.get('name'): item.get('id') for item in self.get_menu_items()}
+            self._menu_file_signature = signature
+        return self._menu_ids_by_name
+    
+    @contextmanager
+    def _locked(self, shared=False):
+        """Hold the store lock against other threads and processes
+        
+        Shared holders only exclude writers in other processes; within this
+        process the lock is always exclusive and reentrant.
+        """
+        with self._lock:
+            self._lock_depth += 1
+            try:
+                if self._lock_depth == 1:
+                    self._lock_file_acquire(shared)
+                yield
+            finally:
+                if self._lock_depth == 1:
+                    self._lock_file_release()
+                self._lock_depth -= 1
+    
+    def _lock_file_acquire(self, shared):
+        """Take the advisory lock on the lock file, waiting as long as needed"""
+        if fcntl:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            return
+        
+        # msvcrt only has exclusive byte-range locks that give up after ~10s
+        self._lock_file.seek(0)
+        while True:
+            try:
+                msvcrt.locking(self._lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+    
+    def _lock_file_release(self):
+        """Release the advisory lock on the lock file"""
+        if fcntl:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._lock_file.seek(0)
+            msvcrt.locking(self._lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+    
+    def _ensure_file_exists(self, filepath, default_content=None):
         """Create file if it doesn't exist"""
         if not os.path.exists(filepath):
             directory = os.path.dirname(filepath)
-            if not os.path.exists(directory):
+            if directory and not os.path.exists(directory):
                 os.makedirs(directory)
-            with open(filepath, 'w') as f:
-                if filepath == self.menu_file or filepath == self.inventory_file:
-                    f.write('[]')  # Empty JSON array
-                else:
-                    f.write('[]')  # Empty JSON array for sales
+            with open(filepath, 'wb') as f:
+                # No records in the chosen codec unless told otherwise
+                f.write(self.codec.dump([]) if default_content is None else default_content.encode())
+    
+    def _append_records(self, filepath, records):
+        """Append records to a record file in its own codec
+        
+        A damaged JSON array file is salvaged first, keeping a copy of the original.
+        """
+        if not records:
+            return
+        
+        self._ensure_file_exists(filepath)
+        for attempt in range(2):
+            with open(filepath, 'rb+') as f:
+                if detect_codec(f.read(64)).append(f, records):
+                    return
+            
+            validate_json_file(filepath)
+            if filepath == self.sales_file:
+                self._sales_rollup = None  # Salvaging moves records, so count them again
+        
+        raise ValueError(f"{filepath} is not a JSON array")
+    
+    def _write_records_atomic(self, filepath, records, codec=None):
+        """Rewrite a record file, in its own codec unless told otherwise"""
+        codec = codec or file_codec(filepath) or self.codec
+        temp_path = filepath + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(codec.dump(records))
+        os.replace(temp_path, filepath)
+    
+    def _read_records(self, filepath, object_hook=None):
+        """Read all records of a record file in whichever codec it is in"""
+        with open(filepath, 'rb') as f:
+            content = f.read()
+        return detect_codec(content[:64]).load(content, object_hook) if content else []
+    
+    def _last_record_id(self, filepath):
+        """Find the ID of the last record in a record file"""
+        with open(filepath, 'rb') as f:
+            return detect_codec(f.read(64)).last_record_id(f)
+    
+    def _write_json_atomic(self, filepath, data):
+        """Write JSON to a temporary file and move it into place"""
+        temp_path = filepath + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(json.dumps(data, indent=2, default=json_default))
+        os.replace(temp_path, filepath)
     
     # Menu Management Functions
     def get_menu_items(self):
         """Retrieve all menu items"""
         try:
-            with open(self.menu_file, 'r') as f:
-                content = f.read()
-                return json.loads(content) if content else []
-        except (json.JSONDecodeError, FileNotFoundError):
+            with self._locked(shared=True):
+                return [MenuItem.from_json(item) for item in self._read_records(self.menu_file)]
+        except (ValueError, FileNotFoundError):
             # In case of corruption or missing file, create a new one
             self._ensure_file_exists(self.menu_file)
             return []
     
     def add_menu_item(self, item):
-        """Add a new menu item"""
-        all_items = self.get_menu_items()
-        
-        # Check if item with this name already exists
-        for existing_item in all_items:
-            if existing_item.get('name') == item.get('name'):
-                return False, "An item with this name already exists."
-        
-        # Add the new item with timestamp
-        item['id'] = int(time.time() * 1000)  # Generate unique ID based on timestamp
-        item['created_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        all_items.append(item)
-        
-        with open(self.menu_file, 'w') as f:
-            f.write(json.dumps(all_items, indent=2))
+        """Add a new menu item, with its price in paise"""
+        with self._locked():
+            all_items = self.get_menu_items()
+            
+            # Check if item with this name already exists
+            for existing_item in all_items:
+                if existing_item.get('name') == item.get('name'):
+                    return False, "An item with this name already exists."
+            
+            # Add the new item with timestamp; the ID is based on the time
+            # but must stay above IDs handed out by other processes
+            last_id = max((existing_item.get('id', 0) for existing_item in all_items), default=0)
+            item['id'] = max(int(time.time() * 1000), last_id + 1)
+            item['created_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            item['version'] = 1
+            all_items.append(MenuItem(item))
+            
+            self._write_records_atomic(self.menu_file, all_items)
+            
+            self._publish(MENU_ITEM_ADDED, 'menu', item=all_items[-1])
+            
+            # Update inventory if needed
+            self._update_inventory_for_new_item(item)
+            
+            return True, "Item added successfully."
+    
+    def import_menu(self, filepath, upsert=False):
+        """Import menu items from a CSV or Excel file, see import_menu_items()"""
+        try:
+            items, rejected = read_menu_import(filepath)
+        except (OSError, ValueError) as e:
+            return False, f"Import failed: {str(e)}"
         
-        # Update inventory if needed
-        self._update_inventory_for_new_item(item)
+        if not items:
+            return False, f"No valid menu items found in {os.path.basename(filepath)}."
         
-        return True, "Item added successfully."
+        success, message = self.import_menu_items(items, upsert)
+        if rejected:
+            shown = ', '.join(str(row) for row in rejected[:10])
+            more = f" and {len(rejected) - 10} more" if len(rejected) > 10 else ""
+            message += f" {len(rejected)} invalid rows skipped (rows {shown}{more})."
+        return success, message
     
-    def update_menu_item(self, item_id, updated_data):
-        """Update an existing menu item"""
-        all_items = self.get_menu_items()
+    def import_menu_items(self, items, upsert=False):
+        """Add many menu items, with prices in paise, in one menu write and one ledger write
         
-        for i, item in enumerate(all_items):
-            if item.get('id') == item_id:
-                # Update the item
-                all_items[i].update(updated_data)
-                all_items[i]['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        Items whose name is already on the menu are skipped, or updated in
+        place with upsert. Only the first item of a repeated name is used.
+        """
+        with self._locked():
+            all_items = self.get_menu_items()
+            positions = {item.get('name'): i for i, item in enumerate(all_items)}
+            
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            last_id = max((item.get('id', 0) for item in all_items), default=0)
+            next_id = max(int(time.time() * 1000), last_id + 1)
+            
+            seen = set()
+            added, updated, skipped = [], [], 0
+            for item in items:
+                name = item.get('name')
+                if name in seen:
+                    skipped += 1
+                    continue
+                seen.add(name)
+                
+                position = positions.get(name)
+                if position is None:
+                    record = MenuItem(item)
+                    record['id'] = next_id
+                    record['created_at'] = timestamp
+                    record['version'] = 1
+                    next_id += 1
+                    all_items.append(record)
+                    added.append(record)
+                    continue
                 
-                with open(self.menu_file, 'w') as f:
-                    f.write(json.dumps(all_items, indent=2))
-                return True, "Item updated successfully."
+                existing = all_items[position]
+                changes = {key: value for key, value in item.items()
+                           if key != 'initial_stock' and existing.get(key) != value}
+                if not upsert or not changes:
+                    skipped += 1
+                    continue
+                
+                existing.update(changes)
+                existing['updated_at'] = timestamp
+                existing['version'] = existing.get('version', 0) + 1
+                updated.append(existing)
+            
+            if added or updated:
+                self._write_records_atomic(self.menu_file, all_items)
+            
+            for record in added:
+                self._publish(MENU_ITEM_ADDED, 'menu', item=record)
+            for record in updated:
+                self._publish(MENU_ITEM_UPDATED, 'menu', item=record)
+            
+            # Opening stock of the new items as a single ledger append
+            self.apply_inventory_deltas([
+                {'item_id': record['id'], 'name': record['name'], 'delta': record['initial_stock'],
+                 'source_id': record['id']}
+                for record in added if 'initial_stock' in record
+            ], 'restock')
+            
+            return True, f"{len(added)} items added, {len(updated)} updated, {skipped} skipped."
+    
+    def update_menu_item(self, item_id, updated_data, expected_version=None):
+        """Update an existing menu item
         
-        return False, "Item not found."
+        With expected_version the update only applies if nobody else changed
+        the item since that version was read (compare-and-swap).
+        """
+        with self._locked():
+            all_items = self.get_menu_items()
+            
+            for i, item in enumerate(all_items):
+                if item.get('id') == item_id:
+                    if expected_version is not None and item.get('version', 0) != expected_version:
+                        return False, "Item was changed elsewhere. Reload and try again."
+                    
+                    # Update the item
+                    old_name = item.get('name')
+                    all_items[i].update(updated_data)
+                    all_items[i]['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    all_items[i]['version'] = item.get('version', 0) + 1
+                    
+                    self._write_records_atomic(self.menu_file, all_items)
+                    
+                    self._publish(MENU_ITEM_UPDATED, 'menu', item=all_items[i])
+                    
+                    # Stock is keyed by id, so a rename only relabels it
+                    if all_items[i].get('name') != old_name:
+                        rename = {'item_id': item_id, 'name': all_items[i].get('name'), 'delta': 0}
+                        self.apply_inventory_deltas([rename], 'rename')
+                    return True, "Item updated successfully."
+            
+            return False, "Item not found."
     
     def delete_menu_item(self, item_id):
         """Delete a menu item"""
-        all_items = self.get_menu_items()
-        
-        for i, item in enumerate(all_items):
-            if item.get('id') == item_id:
-                # Remove the item
-                deleted_item = all_items.pop(i)
-                
-                with open(self.menu_file, 'w') as f:
-                    f.write(json.dumps(all_items, indent=2))
-                return True, "Item deleted successfully."
-        
-        return False, "Item not found."
+        with self._locked():
+            all_items = self.get_menu_items()
+            
+            for i, item in enumerate(all_items):
+                if item.get('id') == item_id:
+                    # Remove the item
+                    deleted_item = all_items.pop(i)
+                    
+                    self._write_records_atomic(self.menu_file, all_items)
+                    
+                    self._publish(MENU_ITEM_DELETED, 'menu', item=deleted_item)
+                    return True, "Item deleted successfully."
+            
+            return False, "Item not found."
     
     # Sales Tracking Functions
     def get_sales(self, date_filter=None):
         """Retrieve sales data with optional date filtering"""
-        try:
-            with open(self.sales_file, 'r') as f:
-                content = f.read()
-                all_sales = json.loads(content) if content else []
+        if date_filter:
+            return list(self.iter_sales(date_filter, date_filter))
+        
+        with self._locked(shared=True):
+            # Closed days come from their archive segments, oldest first
+            sales = [sale for _, report in sorted(self._load_closed_days().items())
+                     for name in report.get('segments', []) for sale in self._read_segment(name)]
+            try:
+                # Sales are built as compact records while parsing, never as dicts
+                return sales + self._read_records(self.sales_file, sale_from_json)
+            except (ValueError, FileNotFoundError):
+                self._ensure_file_exists(self.sales_file)
+                return sales
+    
+    def iter_sales(self, start=None, end=None, fields=None):
+        """Stream the sales from start to end (inclusive) in timestamp order
+        
+        start and end are dates or 'YYYY-MM-DD[ HH:MM:SS]' strings; bare
+        dates select whole business days by the sales' date. Only the days in
+        range are read, one day at a time, from the byte spans the sales
+        counters keep for each day (or the archive segments of closed days).
+        fields limits the keys of the yielded records.
+        """
+        start, end = self._range_bound(start), self._range_bound(end)
+        
+        # The open file keeps reading the sales the spans point at even if it is replaced
+        with self._locked(shared=True):
+            try:
+                self._load_sales_rollup()
+                f = open(self.sales_file, 'rb')
+            except FileNotFoundError:
+                self._ensure_file_exists(self.sales_file)
+                return
+            codec = detect_codec(f.read(64))
+            closed_days = self._load_closed_days()
+            days = sorted(
+                (day_date, list(day['spans']), closed_days.get(day_date, {}).get('segments', []))
+                for day_date, day in self._sales_rollup['days'].items()
+                if isinstance(day_date, str) and (start is None or day_date >= start[:10])
+                and (end is None or day_date <= end[:10])
+            )
+        
+        with f:
+            for day_date, spans, segments in days:
+                # Closed days are in archive segments, which are never rewritten
+                sales = [sale for name in segments for sale in self._read_segment(name)]
                 
-                if date_filter:
-                    # Filter sales by date
-                    filtered_sales = [
-                        sale for sale in all_sales 
-                        if sale.get('date') == date_filter
-                    ]
-                    return filtered_sales
+                # A span may hold other days' sales when its batch could not be split
+                if spans:
+                    sales += [sale for sale in self._read_sale_spans(f, codec, spans) if sale.get('date') == day_date]
+                sales.sort(key=lambda sale: sale.get('timestamp') or '')
                 
-                return all_sales
-        except (json.JSONDecodeError, FileNotFoundError):
-            self._ensure_file_exists(self.sales_file)
-            return []
+                for sale in sales:
+                    timestamp = sale.get('timestamp') or day_date
+                    if start is not None and len(start) > 10 and timestamp < start:
+                        continue
+                    if end is not None and len(end) > 10 and timestamp > end:
+                        continue
+                    yield sale if fields is None else Sale({field: sale[field] for field in fields if field in sale})
+    
+    def _range_bound(self, value):
+        """Turn a date, datetime or string range bound into a comparable timestamp string"""
+        if isinstance(value, datetime):
+            return value.strftime('%Y-%m-%d %H:%M:%S')
+        if isinstance(value, date):
+            return value.strftime('%Y-%m-%d')
+        return value or None
+    
+    def _read_sale_spans(self, f, codec, spans):
+        """Parse the sales in byte spans of the sales file"""
+        chunks = []
+        for start, end in spans:
+            f.seek(start)
+            chunks.append(f.read(end - start))
+        return codec.read_spans(chunks, sale_from_json)
     
     def add_sale(self, sale_data):
-        """Add a new sale record"""
-        all_sales = self.get_sales()
+        """Add a new sale record, with amounts in paise"""
+        success, message = self.add_sales([sale_data])
+        return success, "Sale recorded successfully." if success else message
+    
+    def check_sales(self, sales):
+        """Get the reason each sale can't be recorded, or None for each one that can"""
+        with self._locked(shared=True):
+            known_ids = set(self._menu_ids().values())
+        return [self._sale_error(sale_data, known_ids) for sale_data in sales]
+    
+    def _sale_error(self, sale_data, known_ids):
+        """Get the reason a sale can't be recorded, or None if it can"""
+        if not isinstance(sale_data, Mapping):
+            return "sale is not an object"
+        items = sale_data.get('items')
+        if not isinstance(items, list):
+            return "items is not a list"
+        if not is_amount(sale_data.get('total_amount')):
+            return "total_amount is not a number"
+        
+        for item in items:
+            if not isinstance(item, Mapping):
+                return "item is not an object"
+            if not is_amount(item.get('price')):
+                return f"price of {item.get('name')} is not a number"
+            if not is_amount(item.get('quantity')):
+                return f"quantity of {item.get('name')} is not a number"
+            # Name-only lines are keyed later; a given id must be on the menu
+            if item.get('item_id') is not None and item['item_id'] not in known_ids:
+                return f"unknown item id {item['item_id']!r}"
+        return None
+    
+    def add_sales(self, sales, imported=False, update_inventory=True):
+        """Add several sale records with one append to the sales file
+        
+        Imported sales keep their own timestamp and date, and the sales
+        counters are left to fold them all at once on their next use.
+        update_inventory=False records the sales without stock movements.
+        """
+        with self._locked():
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            today = self.business_date()
+            
+            # Other processes may have handed out IDs since our last sale
+            self._last_sale_id = max(self._last_sale_id, self._last_record_id(self.sales_file))
+            menu_ids = self._menu_ids()
+            
+            # One bad sale would break the sales counters for everyone, so none are stored
+            known_ids = set(menu_ids.values())
+            for number, sale_data in enumerate(sales, 1):
+                error = self._sale_error(sale_data, known_ids)
+                if error:
+                    return False, f"Invalid sale {number}: {error}" if len(sales) > 1 else f"Invalid sale: {error}"
+            
+            for sale_data in sales:
+                # Lines are keyed by menu item id; callers may only know the name
+                for item in sale_data.get('items', []):
+                    if item.get('item_id') is None and item.get('name') in menu_ids:
+                        item['item_id'] = menu_ids[item['name']]
+                
+                # Add timestamp and sale ID, keeping IDs unique within a batch
+                self._last_sale_id = max(int(time.time() * 1000), self._last_sale_id + 1)
+                sale_data['id'] = self._last_sale_id
+                if not (imported and sale_data.get('timestamp')):
+                    sale_data['timestamp'] = timestamp
+                if 'date' not in sale_data:
+                    sale_data['date'] = sale_data['timestamp'][:10] if imported else today
+            
+            records = [Sale(sale_data) for sale_data in sales]
+            self._append_records(self.sales_file, records)
+            
+            for record in records:
+                self._publish(SALE_ADDED, 'sales', sale=record)
+            self._sync_sale_lines()
+            
+            # Update inventory based on the sales
+            if update_inventory:
+                self._update_inventory_from_sales(sales)
+            
+            if not imported:
+                self._load_sales_rollup()
+                if self._sales_since_checkpoint >= ROLLUP_CHECKPOINT_INTERVAL:
+                    self.checkpoint_sales_rollup()
+            
+            return True, f"{len(sales)} sales recorded successfully."
+    
+    def get_sales_signature(self):
+        """Get a cheap signature of the sales file that changes when any process records sales or closes a day"""
+        try:
+            stat = os.stat(self.sales_file)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size
+    
+    def get_sales_dates(self):
+        """Get the business dates that have sales, oldest first, from the sales counters"""
+        with self._locked(shared=True):
+            self._load_sales_rollup()
+            return sorted(day_date for day_date, day in self._sales_rollup['days'].items()
+                          if isinstance(day_date, str) and day.get('transactions'))
+    
+    def get_daily_sales_summary(self, target_date=None):
+        """Get a summary of sales for a specific date, with revenue in paise"""
+        if not target_date:
+            target_date = self.business_date()
+        
+        with self._locked(shared=True):
+            self._load_sales_rollup()
+            day = self._sales_rollup['days'].get(target_date, {})
+            items = day.get('items', {})
+            
+            names = self._item_names()
+            return {
+                'date': target_date,
+                'total_revenue': day.get('revenue', 0),
+                'items_sold': {names.get(key, totals['name']): totals['quantity'] for key, totals in items.items()},
+                'total_transactions': day.get('transactions', 0)
+            }
+    
+    def get_top_items(self, k=10, by='quantity', target_date=None):
+        """Get the k best selling items by 'quantity' or 'revenue' (paise), all-time or for one date
+        
+        Answered from running counters, so the cost depends on the number of
+        distinct items rather than on how many sales were ever recorded.
+        """
+        with self._locked(shared=True):
+            self._load_sales_rollup()
+            if target_date:
+                totals = self._sales_rollup['days'].get(target_date, {}).get('items', {})
+            else:
+                totals = self._sales_rollup['items']
+            
+            top = heapq.nlargest(k, totals.items(), key=lambda entry: entry[1][by])
+            names = self._item_names()
+            return [{'item_id': key if key in names else None, 'name': names.get(key, item['name']),
+                     'quantity': item['quantity'], 'revenue': item['revenue']}
+                    for key, item in top]
+    
+    def get_sales_heatmap(self):
+        """Get revenue (paise) and transaction counts by weekday and hour as 7x24 arrays"""
+        with self._locked(shared=True):
+            self._load_sales_rollup()
+            return {
+                'revenue': self._sales_rollup['heatmap_revenue'].copy(),
+                'transactions': self._sales_rollup['heatmap_transactions'].copy()
+            }
+    
+    def _item_names(self):
+        """Map menu item ids to their current names"""
+        return {item_id: name for name, item_id in self._menu_ids().items()}
+    
+    def checkpoint_sales_rollup(self):
+        """Save the sales counters so startup only folds newer sales"""
+        with self._locked():
+            self._load_sales_rollup()
+            
+            rollup = dict(self._sales_rollup, timestamp=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            for key in ('heatmap_revenue', 'heatmap_transactions'):
+                rollup[key] = rollup[key].tolist()
+            
+            # Item keys are ids or names, so counters are saved as [key, totals] pairs
+            rollup['items'] = list(rollup['items'].items())
+            rollup['days'] = {day_date: dict(day, items=list(day['items'].items()))
+                              for day_date, day in rollup['days'].items()}
+            self._write_json_atomic(self.sales_rollup_file, rollup)
+            self._sales_since_checkpoint = 0
+    
+    def _load_sales_rollup(self):
+        """Load the saved sales counters if needed and fold in newer sales"""
+        # Counters folded from a file another process has since replaced are reloaded
+        sales_file_ino = os.stat(self.sales_file).st_ino
+        if sales_file_ino != self._sales_file_ino:
+            self._sales_rollup = None
+            self._sales_file_ino = sales_file_ino
         
-        # Add timestamp and sale ID
-        sale_data['id'] = int(time.time() * 1000)
-        sale_data['timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        if 'date' not in sale_data:
-            sale_data['date'] = date.today().strftime('%Y-%m-%d')
+        if self._sales_rollup is None:
+            try:
+                with open(self.sales_rollup_file, 'r') as f:
+                    rollup = json.load(f)
+            except (json.JSONDecodeError, FileNotFoundError):
+                rollup = None
+            
+            # The saved counters only apply to the sales file they were folded from
+            if rollup is None or rollup.get('format') != ROLLUP_FORMAT or not self._sales_offset_matches(
+                    rollup.get('sales_offset', 0), rollup.get('last_sale_id', 0)):
+                rollup = self._archived_sales_rollup()
+            else:
+                rollup['items'] = dict(rollup['items'])
+                for day in rollup['days'].values():
+                    day['items'] = dict(day['items'])
+            
+            rollup.pop('timestamp', None)
+            rollup['heatmap_revenue'] = np.array(rollup['heatmap_revenue'], dtype=np.int64)
+            rollup['heatmap_transactions'] = np.array(rollup['heatmap_transactions'], dtype=np.int64)
+            self._sales_rollup = rollup
+            self._sales_since_checkpoint = 0
         
-        all_sales.append(sale_data)
+        try:
+            self._read_sales_tail()
+        except (json.JSONDecodeError, ValueError):
+            # The file was rewritten under us; count everything again
+            self._sales_rollup = self._archived_sales_rollup()
+            try:
+                self._read_sales_tail()
+            except (json.JSONDecodeError, ValueError):
+                pass  # Damaged, and salvaged on the next sale
+    
+    def _empty_sales_rollup(self):
+        """Create sales counters that have folded nothing yet"""
+        return {
+            'format': ROLLUP_FORMAT,
+            'sales_offset': 0,
+            'last_sale_id': 0,
+            'items': {},
+            'days': {},
+            'heatmap_revenue': np.zeros(HEATMAP_SHAPE, dtype=np.int64),
+            'heatmap_transactions': np.zeros(HEATMAP_SHAPE, dtype=np.int64)
+        }
+    
+    def _archived_sales_rollup(self):
+        """Create sales counters holding the sales of closed days only, folded from their archive segments"""
+        self._sales_rollup = self._empty_sales_rollup()
+        for report in self._load_closed_days().values():
+            for name in report.get('segments', []):
+                self._fold_sales(self._read_segment(name))
         
-        with open(self.sales_file, 'w') as f:
-            f.write(json.dumps(all_sales, indent=2))
+        # The counters still start at the beginning of the sales file
+        self._sales_rollup['last_sale_id'] = 0
+        return self._sales_rollup
+    
+    def _sales_offset_matches(self, offset, last_sale_id):
+        """Check that the sales file still has a record ending at offset, the sale last_sale_id"""
+        with open(self.sales_file, 'rb') as f:
+            codec = detect_codec(f.read(64))
+            if offset > f.seek(0, os.SEEK_END):
+                return False
+            return codec.is_record_end(f, offset) and codec.last_record_id(f, offset) == last_sale_id
+    
+    def get_sale_lines(self):
+        """Get the line items of every sale as a read-only memory-mapped LINE_DTYPE array
+        
+        Rows are in the order sales were recorded, with prices in paise.
+        Reports select and total them with array masks and np.bincount
+        instead of building a record per sale.
+        """
+        with self._locked():
+            self._sync_sale_lines()
+            return self.sale_lines.lines()
+    
+    def _sync_sale_lines(self):
+        """Add line rows for the sales recorded since the line store was last brought up to date"""
+        header = self.sale_lines.read_header()
+        offset = header[1] if header else 0
         
-        # Update inventory based on the sale
-        self._update_inventory_from_sale(sale_data)
+        # Rows from a sales file that has since been replaced are built again,
+        # starting with the closed days
+        if header is None or (offset and not self._sales_offset_matches(offset, header[2])):
+            self.sale_lines.reset()
+            offset = 0
+            for report in self._load_closed_days().values():
+                for name in report.get('segments', []):
+                    self.sale_lines.append(explode_sales(self._read_segment(name)), 0, 0)
         
-        return True, "Sale recorded successfully."
+        try:
+            with open(self.sales_file, 'rb') as f:
+                codec = detect_codec(f.read(64))
+                for sales, offset in self._read_record_chunks(f, codec, offset, object_hook=sale_from_json):
+                    if sales:
+                        self.sale_lines.append(explode_sales(sales), offset, sales[-1].get('id', 0))
+        except (ValueError, FileNotFoundError):
+            pass  # Damaged, and salvaged on the next sale
     
-    def get_daily_sales_summary(self, target_date=None):
-        """Get a summary of sales for a specific date"""
-        if not target_date:
-            target_date = date.today().strftime('%Y-%m-%d')
+    def _read_sales_tail(self):
+        """Fold sales appended after the rollup's offset into its counters"""
+        rollup = self._sales_rollup
+        offset = rollup['sales_offset']
+        with open(self.sales_file, 'rb') as f:
+            codec = detect_codec(f.read(64))
+            f.seek(offset)
+            data = f.read()
+        
+        # Each sale's span runs from the end of the one before it, so a day's
+        # sales appended together make up one span
+        sales, spans, consumed = codec.read_records(data, offset, sale_from_json)
+        self._fold_sales(sales, [(offset + start, offset + end) for start, end in spans])
+        rollup['sales_offset'] += consumed
+        self._sales_since_checkpoint += len(sales)
+    
+    def _fold_sales(self, sales, spans=None):
+        """Add sales, and their byte spans in the sales file unless archived, to the counters"""
+        rollup = self._sales_rollup
+        
+        # Heatmap cells for the whole batch are added in one go
+        weekdays, hours, amounts = [], [], []
+        for sale, span in zip(sales, spans or [None] * len(sales)):
+            self._fold_sale(sale, span)
+            
+            cell = self._heatmap_cell(sale.get('timestamp') or '')
+            if cell:
+                weekdays.append(cell[0])
+                hours.append(cell[1])
+                amounts.append(sale.get('total_amount', 0))
+        
+        if weekdays:
+            np.add.at(rollup['heatmap_revenue'], (weekdays, hours), amounts)
+            np.add.at(rollup['heatmap_transactions'], (weekdays, hours), 1)
+    
+    def _heatmap_cell(self, timestamp):
+        """Get the (weekday, hour) of a 'YYYY-MM-DD HH:MM:SS' timestamp, or None"""
+        try:
+            sale_date = date(int(timestamp[:4]), int(timestamp[5:7]), int(timestamp[8:10]))
+            hour = int(timestamp[11:13])
+        except ValueError:
+            return None
+        return (sale_date.weekday(), hour) if 0 <= hour < 24 else None
+    
+    def _fold_sale(self, sale, span):
+        """Add one sale and its byte span in the sales file (None if archived) to the all-time and per-day counters"""
+        rollup = self._sales_rollup
+        rollup['last_sale_id'] = max(rollup['last_sale_id'], sale.get('id', 0))
+        
+        day = rollup['days'].setdefault(sale.get('date'), {'revenue': 0, 'transactions': 0, 'items': {},
+                                                           'spans': []})
+        day['revenue'] += sale.get('total_amount', 0)
+        day['transactions'] += 1
+        
+        if span:
+            self._add_span(day, span)
+        
+        for item in sale.get('items', []):
+            key = item_key(item)
+            quantity = item.get('quantity', 1)
+            revenue = item.get('price', 0) * quantity
+            
+            for totals in (rollup['items'], day['items']):
+                counters = totals.setdefault(key, {'name': item.get('name'), 'quantity': 0, 'revenue': 0})
+                counters['name'] = item.get('name')  # Name as last sold
+                counters['quantity'] += quantity
+                counters['revenue'] += revenue
+    
+    def _add_span(self, day, span):
+        """Add the byte span of one of a day's sales to the day's spans"""
+        # Sales of a day are usually appended together, so their spans merge
+        spans = day['spans']
+        if spans and spans[-1][1] >= span[0]:
+            spans[-1] = [spans[-1][0], max(spans[-1][1], span[1])]
+        else:
+            spans.append(list(span))
+    
+    # Day Close Functions
+    def business_date(self):
+        """Get the open business day: today, or the day after the last closed one if today is closed"""
+        with self._locked(shared=True):
+            last_closed = max(self._load_closed_days(), default=None)
+        
+        today = date.today().strftime('%Y-%m-%d')
+        if last_closed and today <= last_closed:
+            return (date.fromisoformat(last_closed) + timedelta(days=1)).strftime('%Y-%m-%d')
+        return today
+    
+    def get_z_report(self, day_date):
+        """Get the Z-report (final totals, amounts in paise) of a closed day, or None if it is open"""
+        with self._locked(shared=True):
+            report = self._load_closed_days().get(self._range_bound(day_date))
+            return dict(report) if report else None
+    
+    def close_day(self, business_date=None):
+        """Close a business day (by default the open one) and write its Z-report
         
-        sales = self.get_sales(target_date)
+        Every sale dated on or before the day leaves the sales file for a
+        compressed archive segment per day, which is never rewritten, and
+        the final totals of each day are saved with the closed days. The
+        sales file then only holds the open day, so recording and showing
+        the day's sales and starting up stay as cheap as on the first day.
+        Sales later imported for a closed day get a segment of their own
+        when the next day is closed, and amend that day's report.
+        """
+        with self._locked():
+            closing_date = (self._range_bound(business_date) or self.business_date())[:10]
+            reports = dict(self._load_closed_days())
+            
+            # Count everything while the spans still point into the current file
+            self._load_sales_rollup()
+            self._sync_sale_lines()
+            
+            closing, keeping = {}, []
+            with open(self.sales_file, 'rb') as f:
+                codec = detect_codec(f.read(64))
+                for sales, _ in self._read_record_chunks(f, codec, 0, object_hook=sale_from_json):
+                    for sale in sales:
+                        sale_date = sale.get('date')
+                        if isinstance(sale_date, str) and sale_date <= closing_date:
+                            closing.setdefault(sale_date, []).append(sale)
+                        else:
+                            keeping.append(sale)
+            
+            if closing_date in reports and not closing:
+                return False, f"{closing_date} is already closed."
+            
+            # The marker lets a close cut short be undone, or finished once
+            # the closed days are saved
+            os.makedirs(self.archive_dir, exist_ok=True)
+            segments = {day_date: self._segment_name(day_date) for day_date in closing}
+            self._write_json_atomic(self.close_marker_file, {'segments': list(segments.values())})
+            for day_date, sales in closing.items():
+                self._write_segment(segments[day_date], sales)
+            
+            closed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            for day_date in sorted(set(closing) | {closing_date}):
+                reports[day_date] = self._z_report(day_date, closing.get(day_date, []), segments.get(day_date),
+                                                   closed_at, reports.get(day_date))
+            self._write_json_atomic(self.closed_days_file, [reports[day_date] for day_date in sorted(reports)])
+            
+            self._write_records_atomic(self.sales_file, keeping)
+            os.remove(self.close_marker_file)
+            self._rebase_sales_counters()
+            
+            self._publish(DAY_CLOSED, 'sales', date=closing_date)
+            archived = sum(len(sales) for sales in closing.values())
+            return True, f"Closed {closing_date}: {archived} sales archived."
+    
+    def _rebase_sales_counters(self):
+        """Point the sales counters and line rows at a rewritten sales file that only holds open days"""
+        rollup = self._sales_rollup
+        for day in rollup['days'].values():
+            day['spans'] = []
         
-        # Calculate summary
-        total_revenue = sum(sale.get('total_amount', 0) for sale in sales)
-        items_sold = {}
+        with open(self.sales_file, 'rb') as f:
+            self._sales_file_ino = os.fstat(f.fileno()).st_ino
+            data = f.read()
+        sales, spans, consumed = detect_codec(data[:64]).read_records(data, 0, sale_from_json)
+        for sale, span in zip(sales, spans):
+            self._add_span(rollup['days'][sale.get('date')], span)
+        
+        last_sale_id = sales[-1].get('id', 0) if sales else 0
+        rollup['sales_offset'] = consumed
+        rollup['last_sale_id'] = last_sale_id
+        self.checkpoint_sales_rollup()
+        self.sale_lines.rebase(consumed, last_sale_id)
+    
+    def _z_report(self, day_date, sales, segment, closed_at, earlier=None):
+        """Total a closed day's sales, adding to its earlier report when late sales amend it"""
+        if earlier:
+            report = dict(earlier, amended_at=closed_at)
+        else:
+            report = {'date': day_date, 'closed_at': closed_at, 'transactions': 0, 'revenue': 0, 'payments': {},
+                      'items': [], 'first_sale_at': None, 'last_sale_at': None, 'segments': []}
+        
+        payments = {method: dict(totals) for method, totals in report['payments'].items()}
+        items = {item['item_id'] if item['item_id'] is not None else item['name']: dict(item)
+                 for item in report['items']}
+        timestamps = [report[key] for key in ('first_sale_at', 'last_sale_at') if report[key]]
         
         for sale in sales:
+            amount = sale.get('total_amount', 0)
+            report['transactions'] += 1
+            report['revenue'] += amount
+            
+            totals = payments.setdefault(sale.get('payment_method') or 'Unknown', {'transactions': 0, 'revenue': 0})
+            totals['transactions'] += 1
+            totals['revenue'] += amount
+            
             for item in sale.get('items', []):
-                item_name = item.get('name')
-                item_quantity = item.get('quantity', 1)
-                
-                if item_name in items_sold:
-                    items_sold[item_name] += item_quantity
-                else:
-                    items_sold[item_name] = item_quantity
+                totals = items.setdefault(item_key(item), {'item_id': item.get('item_id'), 'name': item.get('name'),
+                                                           'quantity': 0, 'revenue': 0})
+                totals['quantity'] += item.get('quantity', 1)
+                totals['revenue'] += item.get('price', 0) * item.get('quantity', 1)
+            
+            if sale.get('timestamp'):
+                timestamps.append(sale['timestamp'])
         
-        return {
-            'date': target_date,
-            'total_revenue': total_revenue,
-            'items_sold': items_sold,
-            'total_transactions': len(sales)
-        }
+        report['payments'] = payments
+        report['items'] = sorted(items.values(), key=lambda item: item['revenue'], reverse=True)
+        report['first_sale_at'] = min(timestamps, default=None)
+        report['last_sale_at'] = max(timestamps, default=None)
+        report['segments'] = report['segments'] + [segment] if segment else report['segments']
+        return report
+    
+    def _load_closed_days(self):
+        """Get the Z-reports of closed days by date"""
+        try:
+            stat = os.stat(self.closed_days_file)
+            signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            signature = None
+        
+        # The file is always replaced as a whole, so a new signature means new contents
+        if signature != self._closed_days_signature:
+            try:
+                with open(self.closed_days_file, 'r') as f:
+                    reports = json.load(f)
+            except (json.JSONDecodeError, FileNotFoundError):
+                reports = []
+            self._closed_days = {report['date']: report for report in reports}
+            self._closed_days_signature = signature
+        return self._closed_days
+    
+    def _segment_name(self, day_date):
+        """Get an unused archive segment name for a day's sales"""
+        name, part = f"sales-{day_date}.gz", 1
+        while os.path.exists(os.path.join(self.archive_dir, name)):
+            part += 1
+            name = f"sales-{day_date}.{part}.gz"
+        return name
+    
+    def _write_segment(self, name, sales):
+        """Write sales to a new compressed archive segment in the chosen codec"""
+        path = os.path.join(self.archive_dir, name)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(gzip.compress(self.codec.dump(sales), compresslevel=ARCHIVE_COMPRESS_LEVEL, mtime=0))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+    
+    def _read_segment(self, name):
+        """Read the sales of an archive segment"""
+        with open(os.path.join(self.archive_dir, name), 'rb') as f:
+            data = gzip.decompress(f.read())
+        return detect_codec(data[:64]).load(data, sale_from_json)
+    
+    def _recover_close(self):
+        """Finish or undo a day close that was cut short"""
+        try:
+            with open(self.close_marker_file, 'r') as f:
+                segments = json.load(f).get('segments', [])
+        except FileNotFoundError:
+            return
+        
+        committed = {name for report in self._load_closed_days().values() for name in report.get('segments', [])}
+        if segments and all(name in committed for name in segments):
+            # The closed days were saved, so their sales only need to leave the sales file
+            archived_ids = {sale.get('id') for name in segments for sale in self._read_segment(name)}
+            sales = self._read_records(self.sales_file, sale_from_json)
+            self._write_records_atomic(self.sales_file, [sale for sale in sales if sale.get('id') not in archived_ids])
+        else:
+            for name in segments:
+                if os.path.exists(os.path.join(self.archive_dir, name)):
+                    os.remove(os.path.join(self.archive_dir, name))
+        os.remove(self.close_marker_file)
     
     # Inventory Management Functions
     def get_inventory(self):
         """Retrieve inventory data"""
-        try:
-            with open(self.inventory_file, 'r') as f:
-                content = f.read()
-                return json.loads(content) if content else []
-        except (json.JSONDecodeError, FileNotFoundError):
-            self._ensure_file_exists(self.inventory_file)
-            return []
+        with self._locked(shared=True):
+            self._load_inventory_state()
+            return [InventoryItem(self._inventory_row(item)) for item in self._inventory.values()]
     
-    def update_inventory(self, item_name, quantity_change, is_addition=True):
-        """Update inventory quantity for an item"""
-        inventory = self.get_inventory()
+    def _inventory_row(self, item):
+        """Copy a folded inventory item, exposing its last ledger entry as its version"""
+        row = {key: value for key, value in item.items() if key != 'ledger_seq'}
+        row['version'] = item.get('ledger_seq', 0)
+        return row
+    
+    def update_inventory(self, item_name, quantity_change, is_addition=True, reason=None, source_id=None,
+                         expected_version=None):
+        """Update inventory quantity for an item by appending a ledger movement
         
-        # Find the item in inventory
-        item_found = False
-        for item in inventory:
-            if item.get('name') == item_name:
-                current_quantity = item.get('quantity', 0)
+        With expected_version the movement is only recorded if the item's
+        version (from get_inventory) is unchanged (compare-and-swap).
+        """
+        if reason is None:
+            reason = 'restock' if is_addition else 'adjustment'
+        
+        return self.apply_inventory_deltas([{
+            'name': item_name,
+            'delta': quantity_change if is_addition else -quantity_change,
+            'expected_version': expected_version
+        }], reason, source_id)
+    
+    def apply_inventory_deltas(self, deltas, reason='adjustment', source_id=None):
+        """Apply a batch of stock changes with a single ledger write
+        
+        Each delta is a dict with the item 'name' and a signed 'delta', and
+        optionally its 'item_id' (looked up on the menu by name otherwise),
+        its own 'reason', 'source_id' and 'expected_version' (compare-and-swap).
+        Versions are checked for the whole batch first, so either every
+        change is recorded or none is.
+        """
+        with self._locked():
+            self._load_inventory_state()
+            menu_ids = self._menu_ids()
+            
+            movements = []
+            for change in deltas:
+                item_id = change.get('item_id')
+                if item_id is None:
+                    item_id = menu_ids.get(change['name'])
                 
-                if is_addition:
-                    item['quantity'] = current_quantity + quantity_change
-                else:
-                    new_quantity = current_quantity - quantity_change
-                    item['quantity'] = max(0, new_quantity)  # Prevent negative inventory
+                expected_version = change.get('expected_version')
+                if expected_version is not None:
+                    item = self._inventory.get(item_id if item_id is not None else change['name'], {})
+                    if item.get('ledger_seq', 0) != expected_version:
+                        return False, f"Stock of {change['name']} was changed elsewhere. Reload and try again."
                 
-                item['last_updated'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                item_found = True
-                break
-        
-        # If item not found, add it to inventory
-        if not item_found and is_addition:
-            inventory.append({
-                'name': item_name,
-                'quantity': quantity_change,
-                'last_updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                movement = {'item_id': item_id} if item_id is not None else {}
+                movement.update({
+                    'name': change['name'],
+                    'delta': change['delta'],
+                    'reason': change.get('reason', reason),
+                    'source_id': change.get('source_id', source_id)
+                })
+                movements.append(movement)
+            
+            if movements:
+                self._append_inventory_movements(movements)
+        
+        return True, "Inventory updated successfully."
+    
+    def get_inventory_movements(self, item_name=None, reason=None):
+        """Retrieve ledger movements, optionally for one item or reason"""
+        movements = []
+        
+        with open(self.inventory_ledger_file, 'r') as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    break  # Ignore a partially written last line
+                
+                entry = json.loads(line)
+                if item_name is not None and entry.get('name') != item_name:
+                    continue
+                if reason is not None and entry.get('reason') != reason:
+                    continue
+                movements.append(entry)
+        
+        return movements
+    
+    def checkpoint_inventory(self):
+        """Snapshot current stock so startup only replays newer ledger entries"""
+        with self._locked():
+            self._load_inventory_state()
+            
+            # The snapshot goes first; each row records the last entry folded into
+            # it, so replaying from an older offset after a crash is harmless
+            self._write_records_atomic(self.inventory_file, list(self._inventory.values()))
+            self._write_json_atomic(self.inventory_checkpoint_file, {
+                'ledger_offset': self._ledger_offset,
+                'ledger_seq': self._ledger_seq,
+                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             })
+            self._entries_since_checkpoint = 0
+    
+    def _load_inventory_state(self):
+        """Load the last checkpoint if needed and fold in new ledger entries"""
+        if self._inventory is None:
+            try:
+                snapshot = self._read_records(self.inventory_file)
+            except (ValueError, FileNotFoundError):
+                self._ensure_file_exists(self.inventory_file)
+                snapshot = []
+            
+            try:
+                with open(self.inventory_checkpoint_file, 'r') as f:
+                    checkpoint = json.load(f)
+            except (json.JSONDecodeError, FileNotFoundError):
+                checkpoint = {}
+            
+            # Rows saved before stock was keyed by menu item id get their id by name
+            menu_ids = self._menu_ids()
+            for item in snapshot:
+                if item.get('item_id') is None and item.get('name') in menu_ids:
+                    item['item_id'] = menu_ids[item['name']]
+            self._inventory = {item_key(item): item for item in snapshot}
+            self._ledger_offset = checkpoint.get('ledger_offset', 0)
+            self._ledger_seq = checkpoint.get('ledger_seq', 0)
         
-        with open(self.inventory_file, 'w') as f:
-            f.write(json.dumps(inventory, indent=2))
+        return self._read_ledger_tail()
+    
+    def _read_ledger_tail(self):
+        """Fold ledger entries appended since the last read into current stock"""
+        with open(self.inventory_ledger_file, 'rb') as f:
+            f.seek(self._ledger_offset)
+            data = f.read()
         
-        return True, "Inventory updated successfully."
+        # Only complete lines are folded; a torn write is picked up next time
+        complete = data[:data.rfind(b'\n') + 1]
+        self._ledger_offset += len(complete)
+        
+        changed_items = []
+        menu_ids = self._menu_ids() if complete else {}
+        for line in complete.splitlines():
+            entry = json.loads(line)
+            self._ledger_seq = max(self._ledger_seq, entry['seq'])
+            self._entries_since_checkpoint += 1
+            
+            # Entries written before stock was keyed by id are matched by name
+            if entry.get('item_id') is None and entry['name'] in menu_ids:
+                entry['item_id'] = menu_ids[entry['name']]
+            item = self._apply_inventory_movement(entry)
+            if item:
+                changed_items.append((item, entry))
+        
+        return changed_items
+    
+    def _apply_inventory_movement(self, entry):
+        """Apply a single ledger entry to the folded stock"""
+        key = item_key(entry)
+        item = self._inventory.get(key)
+        
+        # A row kept by name until its item joined the menu moves to the id
+        if item is None and key != entry['name'] and entry['name'] in self._inventory and \
+                self._inventory[entry['name']].get('item_id') is None:
+            item = self._inventory.pop(entry['name'])
+            item['item_id'] = key
+            self._inventory[key] = item
+        
+        if item is None:
+            # Removing stock from (or renaming) an unknown item is recorded but has no effect
+            if entry['delta'] < 0 or entry.get('reason') == 'rename':
+                return None
+            item = {'item_id': key, 'name': entry['name'], 'quantity': 0} if key != entry['name'] else \
+                {'name': entry['name'], 'quantity': 0}
+            self._inventory[key] = item
+        elif entry['seq'] <= item.get('ledger_seq', 0):
+            return None  # Already part of the checkpoint
+        
+        # Prevent negative inventory
+        item['name'] = entry['name']
+        item['quantity'] = max(0, item.get('quantity', 0) + entry['delta'])
+        item['last_updated'] = entry['timestamp']
+        item['ledger_seq'] = entry['seq']
+        return item
+    
+    def _append_inventory_movements(self, movements):
+        """Append movements to the ledger in one write and fold them in"""
+        with self._locked():
+            self._load_inventory_state()
+            
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            lines = []
+            for movement in movements:
+                self._ledger_seq += 1
+                entry = {'seq': self._ledger_seq, 'timestamp': timestamp}
+                entry.update(movement)
+                lines.append(json.dumps(entry) + '\n')
+            
+            with open(self.inventory_ledger_file, 'a') as f:
+                f.write(''.join(lines))
+            
+            for item, entry in self._read_ledger_tail():
+                self._publish(INVENTORY_CHANGED, 'inventory', item=self._inventory_row(item),
+                              delta=entry['delta'], reason=entry['reason'])
+            
+            if self._entries_since_checkpoint >= INVENTORY_CHECKPOINT_INTERVAL:
+                self.checkpoint_inventory()
     
     def _update_inventory_for_new_item(self, item):
         """Initialize inventory for a new menu item"""
         if 'initial_stock' in item:
-            self.update_inventory(item['name'], item['initial_stock'], True)
+            self.apply_inventory_deltas([{'item_id': item.get('id'), 'name': item['name'],
+                                          'delta': item['initial_stock']}],
+                                        'restock', item.get('id'))
     
-    def _update_inventory_from_sale(self, sale_data):
-        """Update inventory based on a sale"""
-        for item in sale_data.get('items', []):
-            item_name = item.get('name')
-            quantity = item.get('quantity', 1)
-            
-            # Decrease inventory
-            self.update_inventory(item_name, quantity, False)
+    def _update_inventory_from_sales(self, sales):
+        """Decrease inventory for the items of sales with one ledger write"""
+        deltas = []
+        for sale_data in sales:
+            for item in sale_data.get('items', []):
+                deltas.append({
+                    'item_id': item.get('item_id'),
+                    'name': item.get('name'),
+                    'delta': -item.get('quantity', 1),
+                    'source_id': sale_data.get('id')
+                })
+        
+        self.apply_inventory_deltas(deltas, 'sale')
     
     # Export functions
     def export_menu_to_excel(self, filepath):
@@ -226,13 +1574,13 @@ class DataManager:
         if not menu_items:
             return False, "No menu items to export"
         
-        df = pd.DataFrame(menu_items)
+        df = pd.DataFrame([item.to_json() for item in menu_items])
         df.to_excel(filepath, index=False)
         return True, f"Menu exported to {filepath}"
     
     def export_sales_to_excel(self, filepath, date_filter=None):
         """Export sales data to Excel"""
-        sales = self.get_sales(date_filter)
+        sales = [sale.to_json() for sale in self.iter_sales(date_filter, date_filter)]
         if not sales:
             return False, "No sales data to export"
         
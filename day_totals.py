@@ -0,0 +1,133 @@
+import heapq
+import threading
+
+from data_manager import DAY_CLOSED, SALE_ADDED
+from records import item_key
+
+# Times to re-read the counters when sales keep landing while seeding
+SEED_ATTEMPTS = 3
+
+
+class DayAccumulator:
+    """Running totals of the open business day, kept in memory from sale events
+
+    Seeded once from the sales counters, then every sale event adds to the
+    totals without touching the data files. Missed events (a gap in the
+    sales version), a closed day or sales recorded by another process (seen
+    as a changed sales file whose counters disagree with the totals) make
+    the next read seed again.
+    """
+
+    def __init__(self, data_manager):
+        """Initialize the totals for a data manager and seed them"""
+        self.data_manager = data_manager
+
+        # Totals of the open day, money in paise; items by item_key()
+        self.date = None
+        self.revenue = 0
+        self.transactions = 0
+        self.items = {}
+
+        self._lock = threading.Lock()
+        self._version = None
+        self._signature = None
+        self._stale = True
+        data_manager.subscribe(self.on_data_changed)
+        self.seed()
+
+    def seed(self):
+        """Load the open day's totals from the sales counters"""
+        for _ in range(SEED_ATTEMPTS):
+            version = self.data_manager.get_versions()['sales']
+            signature = self.data_manager.get_sales_signature()
+            day_date = self.data_manager.business_date()
+            summary = self.data_manager.get_daily_sales_summary(day_date)
+            top_items = self.data_manager.get_top_items(max(len(summary['items_sold']), 1), target_date=day_date)
+
+            # A sale recorded meanwhile may or may not be in the counters
+            if self.data_manager.get_versions()['sales'] == version and \
+                    self.data_manager.get_sales_signature() == signature:
+                break
+
+        with self._lock:
+            self.date = day_date
+            self.revenue = summary['total_revenue']
+            self.transactions = summary['total_transactions']
+            self.items = {item_key(item): {'name': item['name'], 'quantity': item['quantity'],
+                                           'revenue': item['revenue']}
+                          for item in top_items}
+            self._version = version
+            self._signature = signature
+            self._stale = False
+
+    def on_data_changed(self, event):
+        """Add a new sale to the totals, or mark them for seeding if events were missed"""
+        if event['store'] != 'sales':
+            return
+
+        with self._lock:
+            version = event.get('version')
+            if self._version is None or version is None or version <= self._version:
+                return
+
+            missed = version != self._version + 1 or event['type'] != SALE_ADDED or event.get('sale') is None
+            self._version = version
+            if missed:
+                # DAY_CLOSED lands here too: the next read starts the new day
+                self._stale = True
+                return
+
+            sale = event['sale']
+            sale_date = sale.get('date')
+            if self._stale or not sale_date or sale_date < self.date:
+                return
+            if sale_date > self.date:
+                # First sale of a new business day
+                self.date, self.revenue, self.transactions, self.items = sale_date, 0, 0, {}
+
+            self.revenue += sale.get('total_amount', 0)
+            self.transactions += 1
+            for item in sale.get('items', []):
+                quantity = item.get('quantity', 1)
+                totals = self.items.setdefault(item_key(item), {'name': item.get('name'), 'quantity': 0,
+                                                                'revenue': 0})
+                totals['name'] = item.get('name')  # Name as last sold
+                totals['quantity'] += quantity
+                totals['revenue'] += item.get('price', 0) * quantity
+
+    def _in_sync(self):
+        """Check that the totals still match the sales counters when the sales file changed since the last check
+
+        Sales recorded by other processes don't come as events, so a new
+        signature is only taken as ours while the day's counters agree.
+        """
+        signature = self.data_manager.get_sales_signature()
+        if signature == self._signature:
+            return True
+
+        with self._lock:
+            day_date, revenue, transactions = self.date, self.revenue, self.transactions
+        if self.data_manager.business_date() != day_date:
+            return False
+        summary = self.data_manager.get_daily_sales_summary(day_date)
+        if summary['total_transactions'] != transactions or summary['total_revenue'] != revenue:
+            return False
+
+        with self._lock:
+            self._signature = signature
+        return True
+
+    def totals(self, k=3):
+        """Get the day's date, revenue, transactions, average basket (paise) and k top items by quantity"""
+        if self._stale or not self._in_sync():
+            self.seed()
+
+        with self._lock:
+            return {
+                'date': self.date,
+                'total_revenue': self.revenue,
+                'total_transactions': self.transactions,
+                'average_basket': self.revenue // self.transactions if self.transactions else 0,
+                'top_items': [dict(item) for item in
+                              heapq.nlargest(k, self.items.values(), key=lambda item: item['quantity'])]
+            }
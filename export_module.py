@@ -1,12 +1,18 @@
 import os
+import numpy as np
 import pandas as pd
 from datetime import datetime
 from tkinter import filedialog, messagebox
 
+from inventory_forecast import StockForecaster
+from item_index import ItemIndex
+from records import from_paise, item_key
+
 class ExportManager:
     def __init__(self, data_manager):
         """Initialize the export manager with a data manager instance"""
         self.data_manager = data_manager
+        self.forecaster = StockForecaster(data_manager)
     
     def export_menu_to_excel(self):
         """Export menu data to Excel file"""
@@ -20,7 +26,8 @@ class ExportManager:
             return False, "Export cancelled"
         
         try:
-            menu_items = self.data_manager.get_menu_items()
+            # Spreadsheets show rupees, as in the data files
+            menu_items = [item.to_json() for item in self.data_manager.get_menu_items()]
             
             if not menu_items:
                 return False, "No menu items to export"
@@ -67,7 +74,8 @@ class ExportManager:
             return False, "Export cancelled"
         
         try:
-            sales = self.data_manager.get_sales(date_filter)
+            # Stream the day's sales (or all of them) in timestamp order
+            sales = [sale.to_json() for sale in self.data_manager.iter_sales(date_filter, date_filter)]
             
             if not sales:
                 return False, f"No sales data to export{' for selected date' if date_filter else ''}"
@@ -119,6 +127,11 @@ class ExportManager:
                     items_df = pd.DataFrame(items_rows)
                     items_df.to_excel(writer, index=False, sheet_name='Items Sold')
                 
+                # Per-item totals over the whole period, from the line store
+                item_summary_df = self.item_summary_frame(date_filter)
+                if not item_summary_df.empty:
+                    item_summary_df.to_excel(writer, index=False, sheet_name='Item Summary')
+                
                 # Create summary sheet if date filter is applied
                 if date_filter:
                     summary = self.data_manager.get_daily_sales_summary(date_filter)
@@ -128,7 +141,7 @@ class ExportManager:
                         'Metric': ['Date', 'Total Revenue (₹)', 'Total Transactions'],
                         'Value': [
                             summary.get('date', ''),
-                            summary.get('total_revenue', 0),
+                            from_paise(summary.get('total_revenue', 0)),
                             summary.get('total_transactions', 0)
                         ]
                     }
@@ -176,16 +189,20 @@ class ExportManager:
                 return False, "No inventory data to export"
             
             # Get menu items for price information
-            menu_items = self.data_manager.get_menu_items()
-            price_lookup = {item.get('name'): item.get('price', 0) for item in menu_items}
+            index = ItemIndex(self.data_manager.get_menu_items())
             
             # Create DataFrame
             df = pd.DataFrame(inventory)
             
-            # Add value column
-            df['price'] = df['name'].map(price_lookup)
+            # Add value column, joined to menu prices by item id
+            df['price'] = index.lookup(index.prices, [item.get('item_id') for item in inventory], np.nan) / 100
             df['value'] = df['quantity'] * df['price']
             
+            # Flag items at or below their forecast reorder point
+            forecast = self.forecaster.forecast()
+            is_low = pd.Series([forecast[key]['is_low'] if key in forecast else False
+                                for key in map(item_key, inventory)], index=df.index)
+            
             # Reorder columns
             columns_order = ['name', 'quantity', 'price', 'value', 'last_updated']
             available_columns = [col for col in columns_order if col in df.columns]
@@ -212,14 +229,14 @@ class ExportManager:
                         'Total Inventory Items',
                         'Total Quantity',
                         'Total Value (₹)',
-                        'Low Stock Items (≤5)',
+                        'Low Stock Items (At/Below Reorder Point)',
                         'Out of Stock Items (0)'
                     ],
                     'Value': [
                         len(df),
                         df['Quantity'].sum(),
                         df['Total Value (₹)'].sum(),
-                        len(df[df['Quantity'] <= 5]),
+                        int(is_low.sum()),
                         len(df[df['Quantity'] == 0])
                     ]
                 }
@@ -262,7 +279,7 @@ class ExportManager:
             summary = self.data_manager.get_daily_sales_summary(date_filter)
             
             # Get sales transactions for the day
-            sales = self.data_manager.get_sales(date_filter)
+            sales = [sale.to_json() for sale in self.data_manager.iter_sales(date_filter, date_filter)]
             
             # Create Excel writer for multiple sheets
             with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
@@ -271,7 +288,7 @@ class ExportManager:
                     'Metric': ['Date', 'Total Revenue (₹)', 'Total Transactions'],
                     'Value': [
                         summary.get('date', ''),
-                        summary.get('total_revenue', 0),
+                        from_paise(summary.get('total_revenue', 0)),
                         summary.get('total_transactions', 0)
                     ]
                 }
@@ -326,6 +343,11 @@ class ExportManager:
                     if items_rows:
                         items_df = pd.DataFrame(items_rows)
                         items_df.to_excel(writer, index=False, sheet_name='Items Sold')
+                    
+                    # Per-item totals for the day, from the line store
+                    item_summary_df = self.item_summary_frame(date_filter)
+                    if not item_summary_df.empty:
+                        item_summary_df.to_excel(writer, index=False, sheet_name='Item Summary')
                 
                 # Add export metadata
                 metadata = pd.DataFrame({
@@ -334,7 +356,7 @@ class ExportManager:
                         date_filter,
                         datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
                         summary.get('total_transactions', 0),
-                        summary.get('total_revenue', 0)
+                        from_paise(summary.get('total_revenue', 0))
                     ]
                 })
                 metadata.to_excel(writer, index=False, sheet_name='Metadata')
@@ -344,6 +366,31 @@ class ExportManager:
         except Exception as e:
             return False, f"Export failed: {str(e)}"
     
+    def item_summary_frame(self, date_filter=None):
+        """Total the quantity and revenue of each item for a business date (or all time) from the sale line store"""
+        lines = self.data_manager.get_sale_lines()
+        if date_filter:
+            # Same business day as the sales on the other sheets, not the wall-clock day
+            lines = lines[lines['business_day'] == np.datetime64(date_filter, 'D').astype(np.int64)]
+        
+        # One bin per menu item, plus a last one for items no longer on the menu
+        index = ItemIndex(self.data_manager.get_menu_items())
+        positions = index.positions(lines['item_id'])
+        bins = np.where(positions >= 0, positions, len(index.ids))
+        quantities = np.bincount(bins, weights=lines['qty'], minlength=len(index.ids) + 1)
+        revenue = np.bincount(bins, weights=lines['qty'] * lines['unit_paise'], minlength=len(index.ids) + 1)
+        
+        df = pd.DataFrame({
+            'Item Name': [item['name'] for item in index.items] + ['Other items'],
+            'Quantity Sold': quantities.round().astype(np.int64),
+            'Revenue (₹)': revenue.round() / 100
+        })
+        df = df[df['Quantity Sold'] > 0].sort_values('Revenue (₹)', ascending=False)
+        
+        total_revenue = df['Revenue (₹)'].sum()
+        df['Share of Revenue'] = (df['Revenue (₹)'] / total_revenue).round(4) if total_revenue else 0.0
+        return df
+    
     def generate_inventory_alert_report(self):
         """Generate and export an inventory alert report for low stock items"""
         filepath = filedialog.asksaveasfilename(
@@ -362,30 +409,39 @@ class ExportManager:
             if not inventory:
                 return False, "No inventory data to export"
             
-            # Filter low stock items (quantity <= 5)
-            low_stock_items = [item for item in inventory if item.get('quantity', 0) <= 5]
+            # Filter items at or below their forecast reorder point
+            forecast = self.forecaster.forecast()
+            low_stock_items = [
+                dict(item, **forecast[item_key(item)])
+                for item in inventory
+                if item_key(item) in forecast and forecast[item_key(item)]['is_low']
+            ]
             
             if not low_stock_items:
                 return False, "No low stock items found"
             
             # Get menu items for price information
-            menu_items = self.data_manager.get_menu_items()
-            price_lookup = {item.get('name'): item.get('price', 0) for item in menu_items}
+            index = ItemIndex(self.data_manager.get_menu_items())
             
             # Create DataFrame
             df = pd.DataFrame(low_stock_items)
+            df['price'] = index.lookup(index.prices, [item.get('item_id') for item in low_stock_items], np.nan) / 100
             
-            # Sort by quantity (ascending)
-            df = df.sort_values(by='quantity')
+            # Sort by forecast days until stockout (soonest first)
+            df = df.sort_values(by=['days_to_stockout', 'quantity'])
             
-            # Add value column
-            df['price'] = df['name'].map(price_lookup)
+            # Items without recent sales have no forecast stockout
+            df['days_to_stockout'] = df['days_to_stockout'].replace(float('inf'), float('nan')).round(1)
+            df['daily_velocity'] = df['daily_velocity'].round(2)
             
             # Add status column
             df['status'] = df['quantity'].apply(lambda q: 'Out of Stock' if q == 0 else 'Low Stock')
             
             # Reorder columns
-            columns_order = ['name', 'quantity', 'status', 'price', 'last_updated']
+            columns_order = [
+                'name', 'quantity', 'status', 'reorder_point', 'daily_velocity',
+                'days_to_stockout', 'price', 'last_updated'
+            ]
             available_columns = [col for col in columns_order if col in df.columns]
             df = df[available_columns]
             
@@ -394,6 +450,9 @@ class ExportManager:
                 'name': 'Item Name',
                 'quantity': 'Quantity',
                 'status': 'Status',
+                'reorder_point': 'Reorder Point',
+                'daily_velocity': 'Sales per Day',
+                'days_to_stockout': 'Days Until Stockout',
                 'price': 'Unit Price (₹)',
                 'last_updated': 'Last Updated'
             }
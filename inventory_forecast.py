@@ -0,0 +1,189 @@
+import numpy as np
+from datetime import datetime
+
+from records import item_key
+
+# Reorder point used for items without any sales history
+LOW_STOCK_THRESHOLD = 5
+
+# Forecast tuning
+HISTORY_DAYS = 730  # How far back sales are considered
+VELOCITY_HALF_LIFE_DAYS = 14  # Recent days count more towards velocity
+VELOCITY_WINDOW_DAYS = 20 * VELOCITY_HALF_LIFE_DAYS  # Older days weigh under a millionth of today
+PROFILE_HALF_LIFE_DAYS = 56  # Weekday/hour shape changes more slowly
+PROFILE_PRIOR_WEIGHT = 24.0  # Pseudo-count pulling sparse items towards the shop-wide shape
+REORDER_LEAD_DAYS = 2  # Time it takes for a restock to arrive (under a week)
+SAFETY_FACTOR = 1.65  # ~95% service level on daily demand variation
+MIN_DAILY_VELOCITY = 0.01  # Slower items fall back to the fixed threshold
+
+HOURS_PER_WEEK = 7 * 24
+
+
+def demand_arrays_from_lines(lines, item_keys, now=None):
+    """Pick the (item index, epoch seconds, quantity) arrays out of sale line rows
+
+    Only the last HISTORY_DAYS of rows are used. Line rows only know menu
+    item ids, so items that were never on the menu have no demand here.
+    """
+    now_seconds = int(np.datetime64(now or datetime.now(), 's').astype(np.int64))
+    recent = lines[lines['epoch_seconds'] >= now_seconds - HISTORY_DAYS * 24 * 3600]
+
+    # Match line item ids to inventory items with a sorted search; -1 (not
+    # on the menu) never matches
+    key_ids = np.array([key if isinstance(key, int) else -1 for key in item_keys] + [-1], dtype=np.int64)
+    order = np.argsort(key_ids, kind='stable')
+    sorted_ids = key_ids[order]
+    positions = np.minimum(np.searchsorted(sorted_ids, recent['item_id']), len(sorted_ids) - 1)
+    matched = (recent['item_id'] >= 0) & (sorted_ids[positions] == recent['item_id'])
+
+    return (
+        order[positions[matched]],
+        recent['epoch_seconds'][matched].astype(np.int64),
+        recent['qty'][matched].astype(np.float64)
+    )
+
+
+def forecast_depletion(item_idx, epoch_seconds, quantities, stock, now=None):
+    """Forecast sales velocity, stockout time and reorder point for each item
+
+    Line items are given as parallel NumPy arrays of item index, local time
+    in epoch seconds and quantity; stock holds the current quantity per item.
+    Returns a dict of per-item arrays.
+    """
+    now_hour = int(np.datetime64(now or datetime.now(), 'h').astype(np.int64))
+    stock = np.asarray(stock, dtype=np.float64)
+    n_items = len(stock)
+
+    # Age of each line item in hours, limited to the history window
+    item_idx = np.asarray(item_idx, dtype=np.intp)
+    age_hours = np.floor_divide(np.asarray(epoch_seconds, dtype=np.int64), 3600)
+    np.subtract(now_hour, age_hours, out=age_hours)
+    if len(age_hours) and age_hours.view(np.uint64).max() >= HISTORY_DAYS * 24:  # Negative ages wrap around
+        keep = (age_hours >= 0) & (age_hours < HISTORY_DAYS * 24)
+        item_idx, quantities, age_hours = item_idx[keep], quantities[keep], age_hours[keep]
+
+    # Everything a line item is binned by depends only on its age in hours,
+    # so it is looked up per hour rather than worked out per line item
+    hour_ages = np.arange(HISTORY_DAYS * 24)
+    day_rows = np.minimum(hour_ages // 24, VELOCITY_WINDOW_DAYS) * n_items
+    week_rows = ((now_hour + 72 - hour_ages) % HOURS_PER_WEEK) * n_items
+    profile_decay = 0.5 ** ((hour_ages // 24) / PROFILE_HALF_LIFE_DAYS)
+
+    # Daily demand by age in days (rows) per item (columns) over the velocity
+    # window only, with all older demand folded into one extra row
+    keys = day_rows[age_hours]
+    keys += item_idx
+    daily = np.bincount(
+        keys,
+        weights=quantities,
+        minlength=(VELOCITY_WINDOW_DAYS + 1) * n_items
+    ).reshape(VELOCITY_WINDOW_DAYS + 1, n_items)
+    sold_earlier = daily[-1] > 0
+    daily = daily[:-1]
+
+    # Exponentially weighted mean and variance of daily demand, normalised
+    # over the days since each item was first sold (the whole window for
+    # items first sold before it)
+    day_weights = 0.5 ** (np.arange(VELOCITY_WINDOW_DAYS) / VELOCITY_HALF_LIFE_DAYS)
+    sold = daily > 0
+    has_history = sold.any(axis=0) | sold_earlier
+    span = np.where(sold_earlier, VELOCITY_WINDOW_DAYS - 1, VELOCITY_WINDOW_DAYS - 1 - sold[::-1].argmax(axis=0))
+    total_weight = np.where(has_history, np.cumsum(day_weights)[span], 1.0)
+
+    velocity = (day_weights @ daily) / total_weight
+    variance = np.maximum((day_weights @ (daily * daily)) / total_weight - velocity ** 2, 0.0)
+
+    # Share of weekly demand falling in each weekday/hour slot
+    # (1970-01-01 was a Thursday, so shift epoch hours to start on Monday)
+    weights = profile_decay[age_hours]
+    weights *= quantities
+    np.take(week_rows, age_hours, out=keys, mode='clip')  # 'clip' spares take() a temporary copy
+    keys += item_idx
+    profile = np.bincount(
+        keys,
+        weights=weights,
+        minlength=HOURS_PER_WEEK * n_items
+    ).reshape(HOURS_PER_WEEK, n_items).T
+
+    shop_profile = profile.sum(axis=0) + 1.0
+    shop_profile /= shop_profile.sum()
+    profile = (profile + PROFILE_PRIOR_WEIGHT * shop_profile) / \
+        (profile.sum(axis=1, keepdims=True) + PROFILE_PRIOR_WEIGHT)
+
+    # Expected cumulative demand over the coming week, following its shape
+    week = (now_hour + 72 + np.arange(HOURS_PER_WEEK)) % HOURS_PER_WEEK
+    cumulative = np.cumsum(velocity[:, None] * 7 * profile[:, week], axis=1)
+    weekly = cumulative[:, -1]
+
+    # Whole weeks the stock lasts, then the hour within the final week
+    selling = weekly > 0
+    full_weeks = np.where(selling, np.ceil(stock / np.where(selling, weekly, 1)) - 1, 0)
+    remaining = stock - full_weeks * weekly
+    final_hour = (cumulative >= remaining[:, None]).argmax(axis=1) + 1
+    hours_to_stockout = np.where(selling, full_weeks * HOURS_PER_WEEK + final_hour, np.inf)
+    hours_to_stockout = np.where(stock <= 0, 0, hours_to_stockout)
+
+    # Reorder point: expected lead time demand plus safety stock
+    lead_demand = cumulative[:, REORDER_LEAD_DAYS * 24 - 1]
+    safety_stock = SAFETY_FACTOR * np.sqrt(variance * REORDER_LEAD_DAYS)
+    reorder_point = np.where(
+        has_history & (velocity >= MIN_DAILY_VELOCITY),
+        np.ceil(lead_demand + safety_stock),
+        LOW_STOCK_THRESHOLD
+    )
+
+    return {
+        'daily_velocity': velocity,
+        'hours_to_stockout': hours_to_stockout,
+        'reorder_point': reorder_point,
+        'is_low': stock <= reorder_point
+    }
+
+
+class StockForecaster:
+    def __init__(self, data_manager):
+        """Initialize the forecaster with a data manager instance"""
+        self.data_manager = data_manager
+        self._cached_versions = None
+        self._cached_forecast = {}
+
+    def forecast(self):
+        """Get the forecast for every inventory item, keyed by menu item id (name if not on the menu)"""
+        versions = self.data_manager.get_versions()
+        if versions == self._cached_versions:
+            return self._cached_forecast
+
+        inventory = self.data_manager.get_inventory()
+        item_keys = [item_key(item) for item in inventory]
+        stock = [item.get('quantity', 0) for item in inventory]
+
+        # Demand comes from the line store, never the full (archived) sales history
+        item_idx, epoch_seconds, quantities = demand_arrays_from_lines(self.data_manager.get_sale_lines(), item_keys)
+        result = forecast_depletion(item_idx, epoch_seconds, quantities, stock)
+
+        forecast = {}
+        for i, (key, item) in enumerate(zip(item_keys, inventory)):
+            hours = result['hours_to_stockout'][i]
+            forecast[key] = {
+                'name': item.get('name'),
+                'daily_velocity': float(result['daily_velocity'][i]),
+                'days_to_stockout': float(hours) / 24,
+                'reorder_point': int(result['reorder_point'][i]),
+                'is_low': bool(result['is_low'][i])
+            }
+
+        self._cached_versions = versions
+        self._cached_forecast = forecast
+        return forecast
+
+    def is_low(self, item):
+        """Check whether an inventory item is at or below its reorder point"""
+        info = self.forecast().get(item_key(item))
+        if info is None:
+            return item.get('quantity', 0) <= LOW_STOCK_THRESHOLD
+        return info['is_low']
+
+    def reorder_point(self, item):
+        """Get the reorder point for an inventory item"""
+        info = self.forecast().get(item_key(item))
+        return info['reorder_point'] if info else LOW_STOCK_THRESHOLD
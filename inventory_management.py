@@ -2,11 +2,18 @@ import tkinter as tk
 from tkinter import messagebox, filedialog
 import customtkinter as ctk
 import json
-from datetime import datetime
+from datetime import datetime, date
 import pandas as pd
+import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
+from inventory_forecast import StockForecaster, REORDER_LEAD_DAYS
+from chart_cache import ChartCache
+from item_index import ItemIndex
+from profiling import profiled, profiler
+from utils import format_currency
+
 class InventoryManagementFrame(ctk.CTkFrame):
     def __init__(self, parent, data_manager, colors):
         super().__init__(parent, fg_color=colors["background"])
@@ -14,6 +21,9 @@ class InventoryManagementFrame(ctk.CTkFrame):
         self.colors = colors
         self.parent = parent
         
+        # Forecast-based reorder points for low stock checks
+        self.forecaster = StockForecaster(data_manager)
+        
         # Configure grid
         self.grid_columnconfigure(0, weight=1)
         self.grid_rowconfigure(3, weight=1)  # Inventory list takes most space
@@ -124,13 +134,24 @@ class InventoryManagementFrame(ctk.CTkFrame):
         # Initialize inventory items display
         self.inventory_items = []
         self.inventory_item_frames = []
+        self.item_frames_by_name = {}
         self.selected_item = None
         
+        # Track which data versions are on screen
+        self.data_versions = {}
+        self.pending_events = []
+        self.data_manager.subscribe(self.on_data_changed)
+        
         # Load inventory items
         self.refresh_data()
     
+    @profiled()
     def refresh_data(self):
         """Refresh inventory data and update display"""
+        # Remember the data versions this display reflects
+        self.data_versions = self.data_manager.get_versions()
+        self.pending_events = []
+        
         # Get updated inventory items
         self.inventory_items = self.data_manager.get_inventory()
         
@@ -140,6 +161,44 @@ class InventoryManagementFrame(ctk.CTkFrame):
         # Update analytics
         self.update_analytics()
     
+    def on_data_changed(self, event):
+        """Queue change events that affect this frame"""
+        if event['store'] in ('menu', 'inventory'):
+            self.pending_events.append(event)
+            
+            # Patch straight away if the frame is on screen
+            if self.winfo_ismapped():
+                self.after_idle(self.sync_data)
+    
+    def sync_data(self):
+        """Bring the display up to date, patching only what changed"""
+        versions = self.data_manager.get_versions()
+        if versions['menu'] == self.data_versions.get('menu') and \
+                versions['inventory'] == self.data_versions.get('inventory'):
+            return
+        
+        events = self.pending_events
+        self.pending_events = []
+        
+        # Menu changes, new items or missed events need a full reload
+        items_by_name = {item.get('name'): item for item in self.inventory_items}
+        missed = versions['inventory'] - self.data_versions.get('inventory', 0) - len(events)
+        if versions['menu'] != self.data_versions.get('menu') or missed or \
+                any(event['item'].get('name') not in items_by_name for event in events):
+            self.refresh_data()
+            return
+        
+        for event in events:
+            item = items_by_name[event['item'].get('name')]
+            item.update(event['item'])
+            
+            frame = self.item_frames_by_name.get(item.get('name'))
+            if frame:
+                self.show_item_status(frame, item)
+        
+        self.data_versions = versions
+        self.update_analytics()
+    
     def setup_inventory_tab(self):
         """Set up the current inventory tab UI"""
         tab = self.content_frame.tab("Current Inventory")
@@ -179,7 +238,7 @@ class InventoryManagementFrame(ctk.CTkFrame):
         self.analytics_type_var = tk.StringVar(value="Stock Levels")
         self.analytics_type_menu = ctk.CTkComboBox(
             self.analytics_options_frame,
-            values=["Stock Levels", "Low Stock Items", "Stock Value"],
+            values=["Stock Levels", "Low Stock Items", "Stock Value", "Depletion Forecast"],
             variable=self.analytics_type_var,
             command=self.update_analytics
         )
@@ -197,6 +256,9 @@ class InventoryManagementFrame(ctk.CTkFrame):
         self.canvas = FigureCanvasTkAgg(self.figure, self.chart_frame)
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
         
+        # Each chart keeps its own axes so switching between them is cheap
+        self.chart_cache = ChartCache(self.figure, self.canvas, self.colors)
+        
         # Summary frame
         self.summary_frame = ctk.CTkFrame(
             tab,
@@ -255,6 +317,7 @@ class InventoryManagementFrame(ctk.CTkFrame):
             frame.destroy()
         
         self.inventory_item_frames = []
+        self.item_frames_by_name = {}
         
         # No items message
         if not items_to_display:
@@ -311,6 +374,7 @@ class InventoryManagementFrame(ctk.CTkFrame):
             item_frame = self.create_inventory_item_frame(item)
             item_frame.grid(row=i+1, column=0, padx=10, pady=5, sticky="ew")
             self.inventory_item_frames.append(item_frame)
+            self.item_frames_by_name[item.get('name')] = item_frame
     
     def create_inventory_item_frame(self, item):
         """Create a frame for a single inventory item"""
@@ -336,37 +400,33 @@ class InventoryManagementFrame(ctk.CTkFrame):
         name_label.grid(row=0, column=0, padx=10, pady=10, sticky="w")
         
         # Quantity
-        quantity = item.get('quantity', 0)
         quantity_label = ctk.CTkLabel(
             frame,
-            text=str(quantity),
             font=("Roboto", 14),
             text_color=self.colors["primary"]
         )
         quantity_label.grid(row=0, column=1, padx=10, pady=10, sticky="w")
         
         # Status
-        status_color = "#00B894" if quantity > 5 else "#FF9800" if quantity > 0 else "#FF5252"
-        status_text = "In Stock" if quantity > 5 else "Low Stock" if quantity > 0 else "Out of Stock"
-        
         status_label = ctk.CTkLabel(
             frame,
-            text=status_text,
-            font=("Roboto", 14),
-            text_color=status_color
+            font=("Roboto", 14)
         )
         status_label.grid(row=0, column=2, padx=10, pady=10, sticky="w")
         
         # Last updated
-        last_updated = item.get('last_updated', 'Never')
         updated_label = ctk.CTkLabel(
             frame,
-            text=last_updated,
             font=("Roboto", 14),
             text_color=self.colors["primary"]
         )
         updated_label.grid(row=0, column=3, padx=10, pady=10, sticky="w")
         
+        frame.quantity_label = quantity_label
+        frame.status_label = status_label
+        frame.updated_label = updated_label
+        self.show_item_status(frame, item)
+        
         # Add selection behavior
         frame.bind("<Button-1>", lambda event, f=frame: self.select_item(f))
         name_label.bind("<Button-1>", lambda event, f=frame: self.select_item(f))
@@ -383,6 +443,17 @@ class InventoryManagementFrame(ctk.CTkFrame):
         
         return frame
     
+    def show_item_status(self, frame, item):
+        """Show quantity, status and last update time on an item frame"""
+        quantity = item.get('quantity', 0)
+        is_low = self.forecaster.is_low(item)
+        status_color = "#00B894" if not is_low else "#FF9800" if quantity > 0 else "#FF5252"
+        status_text = "In Stock" if not is_low else "Low Stock" if quantity > 0 else "Out of Stock"
+        
+        frame.quantity_label.configure(text=str(quantity))
+        frame.status_label.configure(text=status_text, text_color=status_color)
+        frame.updated_label.configure(text=item.get('last_updated', 'Never'))
+    
     def select_item(self, frame):
         """Handle item selection"""
         # Deselect previously selected item
@@ -403,7 +474,7 @@ class InventoryManagementFrame(ctk.CTkFrame):
         """Open dialog to add new inventory"""
         self.inventory_dialog = InventoryDialog(self, self.colors, self.data_manager)
         self.wait_window(self.inventory_dialog)
-        self.refresh_data()
+        self.sync_data()
     
     def adjust_selected_inventory(self):
         """Adjust the selected inventory item"""
@@ -428,12 +499,15 @@ class InventoryManagementFrame(ctk.CTkFrame):
         
         self.inventory_dialog = InventoryDialog(self, self.colors, self.data_manager, item_data)
         self.wait_window(self.inventory_dialog)
-        self.refresh_data()
+        self.sync_data()
     
     def show_low_stock_alert(self):
         """Show a dialog with low stock items"""
-        # Get low stock items (quantity <= 5)
-        low_stock_items = [item for item in self.inventory_items if item.get('quantity', 0) <= 5]
+        # Get items at or below their forecast reorder point
+        low_stock_items = [
+            dict(item, reorder_point=self.forecaster.reorder_point(item))
+            for item in self.inventory_items if self.forecaster.is_low(item)
+        ]
         
         if not low_stock_items:
             messagebox.showinfo("Low Stock Alert", "No items are currently low in stock.")
@@ -442,55 +516,46 @@ class InventoryManagementFrame(ctk.CTkFrame):
         # Create alert dialog
         alert_dialog = LowStockAlertDialog(self, self.colors, low_stock_items, self.data_manager)
         self.wait_window(alert_dialog)
-        self.refresh_data()
+        self.sync_data()
     
     def update_analytics(self, *args):
         """Update the analytics chart based on selected type"""
         analytics_type = self.analytics_type_var.get()
         
-        # Clear previous chart
-        self.figure.clear()
-        ax = self.figure.add_subplot(111)
-        
         # Get menu items for price information
         menu_items = self.data_manager.get_menu_items()
         
-        # Create a price lookup dictionary
-        price_lookup = {item.get('name'): item.get('price', 0) for item in menu_items}
+        # Stock value per row, joined to menu prices by item id
+        index = ItemIndex(menu_items)
+        prices = index.lookup(index.prices, [item.get('item_id') for item in self.inventory_items])
+        values = prices * [item.get('quantity', 0) for item in self.inventory_items]
         
-        if analytics_type == "Stock Levels":
-            self.generate_stock_levels_chart(ax)
-        elif analytics_type == "Low Stock Items":
-            self.generate_low_stock_chart(ax)
-        elif analytics_type == "Stock Value":
-            self.generate_stock_value_chart(ax, price_lookup)
+        chart_data = {
+            "Stock Levels": self.stock_levels_chart_data,
+            "Low Stock Items": self.low_stock_chart_data,
+            "Stock Value": lambda: self.stock_value_chart_data(values),
+            "Depletion Forecast": self.depletion_forecast_chart_data,
+        }
         
-        # Update canvas
-        self.canvas.draw()
+        # Charts mix stock, prices and sales velocity, so any store change rebuilds them
+        version = (tuple(self.data_manager.get_versions().values()), date.today())
+        self.chart_cache.show(analytics_type, version, chart_data[analytics_type])
         
         # Update summary statistics
         total_items = len(self.inventory_items)
-        low_stock_count = sum(1 for item in self.inventory_items if item.get('quantity', 0) <= 5)
+        low_stock_count = sum(1 for item in self.inventory_items if self.forecaster.is_low(item))
         
         # Calculate total inventory value
-        total_value = 0
-        for item in self.inventory_items:
-            item_name = item.get('name')
-            quantity = item.get('quantity', 0)
-            price = price_lookup.get(item_name, 0)
-            total_value += quantity * price
+        total_value = int(values.sum())
         
         self.total_items_label.configure(text=f"Total Items: {total_items}")
         self.low_stock_label.configure(text=f"Low Stock Items: {low_stock_count}")
-        self.inventory_value_label.configure(text=f"Total Value: ₹{total_value:.2f}")
+        self.inventory_value_label.configure(text=f"Total Value: {format_currency(total_value)}")
     
-    def generate_stock_levels_chart(self, ax):
-        """Generate chart showing stock levels for all items"""
+    def stock_levels_chart_data(self):
+        """Prepare chart showing stock levels for all items"""
         if not self.inventory_items:
-            ax.text(0.5, 0.5, "No inventory data available", 
-                   ha='center', va='center', transform=ax.transAxes,
-                   fontsize=12, color=self.colors["primary"])
-            return
+            return {'categories': [], 'empty_message': "No inventory data available"}
         
         # Sort items by quantity (descending)
         sorted_items = sorted(self.inventory_items, key=lambda x: x.get('quantity', 0), reverse=True)
@@ -503,42 +568,30 @@ class InventoryManagementFrame(ctk.CTkFrame):
                       else item.get('name', 'Unnamed') for item in display_items]
         quantities = [item.get('quantity', 0) for item in display_items]
         
-        # Define colors based on quantity
-        colors = ['#00B894' if q > 5 else '#FF9800' if q > 0 else '#FF5252' for q in quantities]
-        
-        # Create horizontal bar chart
-        bars = ax.barh(item_names, quantities, color=colors)
-        
-        # Add data labels
-        for bar in bars:
-            width = bar.get_width()
-            ax.text(width + 0.5, bar.get_y() + bar.get_height()/2,
-                   f'{width:.0f}', ha='left', va='center')
-        
-        # Set chart title and labels
-        ax.set_title('Current Stock Levels', color=self.colors["primary"])
-        ax.set_xlabel('Quantity', color=self.colors["primary"])
-        
-        # Style the chart
-        ax.set_facecolor(self.colors["background"])
-        self.figure.set_facecolor(self.colors["background"])
-        
-        # Set x axis to start at 0
-        ax.set_xlim(left=0)
-        
-        # Add grid lines
-        ax.grid(axis='x', linestyle='--', alpha=0.7)
+        # Define colors based on quantity and reorder point
+        colors = [
+            '#00B894' if not self.forecaster.is_low(item) else '#FF9800' if item.get('quantity', 0) > 0 else '#FF5252'
+            for item in display_items
+        ]
+        
+        return {
+            'categories': item_names,
+            'values': quantities,
+            'bar_colors': colors,
+            'value_labels': [f'{quantity:.0f}' for quantity in quantities],
+            'label_offset': 0.5,
+            'horizontal': True,
+            'title': 'Current Stock Levels',
+            'xlabel': 'Quantity'
+        }
     
-    def generate_low_stock_chart(self, ax):
-        """Generate chart showing only low stock items"""
-        # Filter for low stock items (quantity <= 5)
-        low_stock_items = [item for item in self.inventory_items if item.get('quantity', 0) <= 5]
+    def low_stock_chart_data(self):
+        """Prepare chart showing only low stock items"""
+        # Filter for items at or below their forecast reorder point
+        low_stock_items = [item for item in self.inventory_items if self.forecaster.is_low(item)]
         
         if not low_stock_items:
-            ax.text(0.5, 0.5, "No low stock items", 
-                   ha='center', va='center', transform=ax.transAxes,
-                   fontsize=12, color=self.colors["primary"])
-            return
+            return {'categories': [], 'empty_message': "No low stock items"}
         
         # Sort by quantity (ascending)
         sorted_items = sorted(low_stock_items, key=lambda x: x.get('quantity', 0))
@@ -547,60 +600,40 @@ class InventoryManagementFrame(ctk.CTkFrame):
         item_names = [item.get('name', 'Unnamed')[:15] + '...' if len(item.get('name', 'Unnamed')) > 15 
                       else item.get('name', 'Unnamed') for item in sorted_items]
         quantities = [item.get('quantity', 0) for item in sorted_items]
+        reorder_points = [self.forecaster.reorder_point(item) for item in sorted_items]
         
         # Define colors based on quantity
         colors = ['#FF9800' if q > 0 else '#FF5252' for q in quantities]
         
-        # Create horizontal bar chart
-        bars = ax.barh(item_names, quantities, color=colors)
-        
-        # Add data labels
-        for bar in bars:
-            width = bar.get_width()
-            ax.text(width + 0.1, bar.get_y() + bar.get_height()/2,
-                   f'{width:.0f}', ha='left', va='center')
-        
-        # Set chart title and labels
-        ax.set_title('Low Stock Items (Quantity ≤ 5)', color=self.colors["primary"])
-        ax.set_xlabel('Quantity', color=self.colors["primary"])
-        
-        # Style the chart
-        ax.set_facecolor(self.colors["background"])
-        self.figure.set_facecolor(self.colors["background"])
-        
-        # Set x axis to start at 0
-        ax.set_xlim(left=0)
-        
-        # Add grid lines
-        ax.grid(axis='x', linestyle='--', alpha=0.7)
-        
-        # Set a maximum x-limit for better visibility
-        ax.set_xlim(right=6)
+        return {
+            'categories': item_names,
+            'values': quantities,
+            'bar_colors': colors,
+            'value_labels': [f'{quantity:.0f}' for quantity in quantities],
+            'label_offset': 0.1,
+            'horizontal': True,
+            # Mark each item's reorder point
+            'markers': reorder_points,
+            'marker_label': 'Reorder point',
+            # Set a maximum x-limit for better visibility
+            'value_max': max(quantities + reorder_points) + 1,
+            'title': 'Low Stock Items (At or Below Reorder Point)',
+            'xlabel': 'Quantity'
+        }
     
-    def generate_stock_value_chart(self, ax, price_lookup):
-        """Generate chart showing inventory value by item"""
+    def stock_value_chart_data(self, values):
+        """Prepare chart showing inventory value by item, from the value of each stock row"""
         if not self.inventory_items:
-            ax.text(0.5, 0.5, "No inventory data available", 
-                   ha='center', va='center', transform=ax.transAxes,
-                   fontsize=12, color=self.colors["primary"])
-            return
+            return {'categories': [], 'empty_message': "No inventory data available"}
         
-        # Calculate value for each item
-        item_values = []
-        for item in self.inventory_items:
-            item_name = item.get('name')
-            quantity = item.get('quantity', 0)
-            price = price_lookup.get(item_name, 0)
-            value = quantity * price
-            
-            if value > 0:  # Only include items with value > 0
-                item_values.append((item_name, value))
+        # Only include items with value > 0
+        item_values = [
+            (self.inventory_items[i].get('name'), int(values[i]))
+            for i in np.flatnonzero(values > 0)
+        ]
         
         if not item_values:
-            ax.text(0.5, 0.5, "No items with value found", 
-                   ha='center', va='center', transform=ax.transAxes,
-                   fontsize=12, color=self.colors["primary"])
-            return
+            return {'categories': [], 'empty_message': "No items with value found"}
         
         # Sort by value (descending)
         sorted_values = sorted(item_values, key=lambda x: x[1], reverse=True)
@@ -612,28 +645,57 @@ class InventoryManagementFrame(ctk.CTkFrame):
         item_names = [name[:15] + '...' if len(name) > 15 else name for name, _ in display_items]
         values = [value for _, value in display_items]
         
-        # Create horizontal bar chart
-        bars = ax.barh(item_names, values, color=self.colors["secondary"])
-        
-        # Add data labels
-        for bar in bars:
-            width = bar.get_width()
-            ax.text(width + 5, bar.get_y() + bar.get_height()/2,
-                   f'₹{width:.0f}', ha='left', va='center')
+        return {
+            'categories': item_names,
+            'values': [value / 100 for value in values],
+            'bar_colors': self.colors["secondary"],
+            'value_labels': [format_currency(value, 0) for value in values],
+            'label_offset': 5,
+            'horizontal': True,
+            'title': 'Inventory Value by Item',
+            'xlabel': 'Value (₹)'
+        }
+    
+    def depletion_forecast_chart_data(self):
+        """Prepare chart showing how many days each item's stock will last"""
+        forecast = self.forecaster.forecast()
         
-        # Set chart title and labels
-        ax.set_title('Inventory Value by Item', color=self.colors["primary"])
-        ax.set_xlabel('Value (₹)', color=self.colors["primary"])
+        # Items that are forecast to run out, soonest first
+        depleting = [
+            (info['name'], info) for info in forecast.values()
+            if info['days_to_stockout'] != float('inf')
+        ]
         
-        # Style the chart
-        ax.set_facecolor(self.colors["background"])
-        self.figure.set_facecolor(self.colors["background"])
+        if not depleting:
+            return {'categories': [], 'empty_message': "No sales history to forecast from"}
         
-        # Set x axis to start at 0
-        ax.set_xlim(left=0)
+        # Take the 15 items running out soonest
+        display_items = sorted(depleting, key=lambda x: x[1]['days_to_stockout'])[:15]
         
-        # Add grid lines
-        ax.grid(axis='x', linestyle='--', alpha=0.7)
+        # Extract names and days left
+        item_names = [name[:15] + '...' if len(name) > 15 else name for name, _ in display_items]
+        days_left = [info['days_to_stockout'] for _, info in display_items]
+        
+        # Red if stock runs out before a restock could arrive, orange if below reorder point
+        colors = [
+            '#FF5252' if info['days_to_stockout'] <= REORDER_LEAD_DAYS else
+            '#FF9800' if info['is_low'] else self.colors["accent"]
+            for _, info in display_items
+        ]
+        
+        return {
+            'categories': item_names,
+            'values': days_left,
+            'bar_colors': colors,
+            'value_labels': [f'{info["days_to_stockout"]:.1f}d ({info["daily_velocity"]:.1f}/day)'
+                             for _, info in display_items],
+            'label_offset': 0.1,
+            'horizontal': True,
+            # Soonest at the top
+            'invert': True,
+            'title': 'Forecast Days Until Stockout',
+            'xlabel': 'Days'
+        }
     
     def export_data(self):
         """Export inventory data to Excel"""
@@ -646,7 +708,8 @@ class InventoryManagementFrame(ctk.CTkFrame):
         if not filepath:
             return  # User cancelled
         
-        success, message = self.data_manager.export_inventory_to_excel(filepath)
+        with profiler.action("export_inventory"):
+            success, message = self.data_manager.export_inventory_to_excel(filepath)
         
         if success:
             messagebox.showinfo("Export Successful", message)
@@ -887,7 +950,10 @@ class InventoryDialog(ctk.CTkToplevel):
             is_addition = self.adjustment_type_var.get() == "Add"
             
             # Update inventory
-            success, message = self.data_manager.update_inventory(item_name, quantity, is_addition)
+            success, message = self.data_manager.apply_inventory_deltas(
+                [{'item_id': self.item_data.get('item_id'), 'name': item_name,
+                  'delta': quantity if is_addition else -quantity}], 'restock' if is_addition else 'adjustment'
+            )
         else:
             # Adding new item or stock
             if self.new_item_var.get() == 1:
@@ -904,7 +970,9 @@ class InventoryDialog(ctk.CTkToplevel):
                     return
             
             # Update inventory (always an addition for new items)
-            success, message = self.data_manager.update_inventory(item_name, quantity, True)
+            success, message = self.data_manager.apply_inventory_deltas(
+                [{'name': item_name, 'delta': quantity}], 'restock'
+            )
         
         if success:
             messagebox.showinfo("Success", message)
@@ -1022,9 +1090,13 @@ class LowStockAlertDialog(ctk.CTkToplevel):
         # Quantity
         quantity = item.get('quantity', 0)
         quantity_color = "#FF9800" if quantity > 0 else "#FF5252"
+        quantity_text = f"Qty: {quantity}"
+        if 'reorder_point' in item:
+            quantity_text += f" (reorder at {item['reorder_point']})"
+        
         quantity_label = ctk.CTkLabel(
             frame,
-            text=f"Qty: {quantity}",
+            text=quantity_text,
             font=("Roboto", 14),
             text_color=quantity_color
         )
@@ -1192,17 +1264,14 @@ class BulkRestockDialog(ctk.CTkToplevel):
             messagebox.showerror("Error", "Please enter a valid positive quantity")
             return
         
-        # Update inventory for each item
-        success_count = 0
-        for item_name in self.item_names:
-            success, _ = self.data_manager.update_inventory(item_name, quantity, True)
-            if success:
-                success_count += 1
+        # Restock every item with one batched inventory write
+        success, message = self.data_manager.apply_inventory_deltas(
+            [{'name': item_name, 'delta': quantity} for item_name in self.item_names], 'restock'
+        )
         
-        if success_count == len(self.item_names):
-            messagebox.showinfo("Success", f"Successfully restocked all {success_count} items")
+        if success:
+            messagebox.showinfo("Success", f"Successfully restocked all {len(self.item_names)} items")
         else:
-            messagebox.showinfo("Partial Success", 
-                              f"Restocked {success_count} out of {len(self.item_names)} items")
+            messagebox.showerror("Error", message)
         
         self.destroy()
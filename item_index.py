@@ -0,0 +1,42 @@
+import numpy as np
+
+
+class ItemIndex:
+    """Menu items by id, for joining other stores to the menu with array lookups
+
+    Menu item ids are the key shared by the menu, stock rows and sale
+    lines. They are kept sorted, so a whole column of ids turns into dense
+    positions with one searchsorted, and per-item values such as prices
+    live in arrays indexed by position.
+    """
+
+    def __init__(self, menu_items):
+        """Initialize the index from the current menu items"""
+        items = sorted((item for item in menu_items if item.get('id') is not None), key=lambda item: item['id'])
+        self.items = items
+        self.ids = np.array([item['id'] for item in items], dtype=np.int64)
+        self.prices = np.array([item.get('price', 0) for item in items], dtype=np.int64)
+
+    def positions(self, item_ids):
+        """Get the dense position of each item id, -1 for ids not on the menu (or None)"""
+        if isinstance(item_ids, np.ndarray):
+            ids = item_ids.astype(np.int64)  # Sale line columns use -1 for no id already
+        else:
+            ids = np.array([-1 if item_id is None else item_id for item_id in item_ids], dtype=np.int64)
+        if not len(self.ids):
+            return np.full(len(ids), -1, dtype=np.int64)
+
+        positions = np.minimum(np.searchsorted(self.ids, ids), len(self.ids) - 1)
+        return np.where(self.ids[positions] == ids, positions, -1)
+
+    def lookup(self, values, item_ids, default=0):
+        """Get the per-item value for each item id, default where the id is not on the menu"""
+        positions = self.positions(item_ids)
+        if not len(self.ids):
+            return np.full(len(positions), default)
+        return np.where(positions >= 0, values[np.maximum(positions, 0)], default)
+
+    def item(self, item_id):
+        """Get the menu item with an id, or None"""
+        position = self.positions([item_id])[0]
+        return self.items[position] if position >= 0 else None
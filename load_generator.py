@@ -0,0 +1,373 @@
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import argparse
+import tempfile
+import threading
+import numpy as np
+
+from data_manager import DataManager
+
+# Rush profiles: arrival rate (customers per minute) at points through the rush
+# as (fraction of duration, rate), linearly interpolated; basket sizes and
+# quantities as value -> probability; share of items added by shortcut key
+RUSH_PROFILES = {
+    'lunch': {
+        'duration_minutes': 120,
+        'arrival_curve': [(0.0, 0.5), (0.2, 3.0), (0.4, 5.0), (0.6, 4.0), (0.8, 1.5), (1.0, 0.5)],
+        'basket_sizes': {1: 0.30, 2: 0.30, 3: 0.20, 4: 0.12, 6: 0.08},
+        'quantities': {1: 0.80, 2: 0.15, 3: 0.05},
+        'shortcut_share': 0.7,
+    },
+    'breakfast': {
+        'duration_minutes': 90,
+        'arrival_curve': [(0.0, 1.0), (0.3, 4.0), (0.5, 6.0), (0.7, 3.0), (1.0, 1.0)],
+        'basket_sizes': {1: 0.55, 2: 0.35, 3: 0.10},
+        'quantities': {1: 0.90, 2: 0.10},
+        'shortcut_share': 0.85,
+    },
+    'steady': {
+        'duration_minutes': 60,
+        'arrival_curve': [(0.0, 1.5), (1.0, 1.5)],
+        'basket_sizes': {1: 0.40, 2: 0.35, 3: 0.25},
+        'quantities': {1: 0.85, 2: 0.15},
+        'shortcut_share': 0.5,
+    },
+}
+
+# Popularity of the n-th menu item falls off as 1 / n^MENU_POPULARITY_SKEW
+MENU_POPULARITY_SKEW = 0.8
+
+# Synthetic menu for runs against an empty data folder
+SYNTHETIC_MENU_SIZE = 20
+SYNTHETIC_STOCK = 1000000
+
+# Same colors as the main window
+UI_COLORS = {
+    "primary": "#2D3436",
+    "secondary": "#0984E3",
+    "accent": "#00B894",
+    "background": "#F5F6FA",
+    "text": "#2D3436"
+}
+
+
+def arrival_times(profile, duration_seconds, rng):
+    """Draw customer arrival times in rush seconds from the profile's arrival curve
+
+    A non-homogeneous Poisson process is sampled by thinning a homogeneous
+    one running at the peak rate.
+    """
+    points = np.array(profile['arrival_curve'], dtype=np.float64)
+    peak_rate = points[:, 1].max() / 60  # Customers per second
+
+    count = rng.poisson(peak_rate * duration_seconds)
+    times = np.sort(rng.uniform(0, duration_seconds, count))
+    rates = np.interp(times / duration_seconds, points[:, 0], points[:, 1]) / 60
+    return times[rng.uniform(0, 1, count) < rates / peak_rate]
+
+
+def build_baskets(profile, menu, count, rng):
+    """Draw count baskets of (menu item, quantity, added by shortcut) entries"""
+    ranks = np.arange(1, len(menu) + 1)
+    popularity = 1.0 / ranks ** MENU_POPULARITY_SKEW
+    popularity /= popularity.sum()
+
+    sizes = rng.choice(list(profile['basket_sizes']), size=count, p=list(profile['basket_sizes'].values()))
+    quantity_values = list(profile['quantities'])
+    quantity_weights = list(profile['quantities'].values())
+
+    baskets = []
+    for size in sizes:
+        picks = rng.choice(len(menu), size=min(size, len(menu)), replace=False, p=popularity)
+        quantities = rng.choice(quantity_values, size=len(picks), p=quantity_weights)
+        by_shortcut = rng.uniform(0, 1, len(picks)) < profile['shortcut_share']
+        baskets.append([
+            (menu[pick], int(quantity), bool(shortcut and menu[pick].get('shortcut')))
+            for pick, quantity, shortcut in zip(picks, quantities, by_shortcut)
+        ])
+    return baskets
+
+
+def sale_from_basket(basket):
+    """Build sale data the way QuickSaleFrame.complete_sale does"""
+    items = [
+        {'name': item['name'], 'price': item.get('price', 0), 'quantity': quantity}
+        for item, quantity, _ in basket
+    ]
+    return {
+        'items': items,
+        'total_amount': sum(item['price'] * item['quantity'] for item in items),
+        'payment_method': 'Cash'
+    }
+
+
+def seed_synthetic_menu(data_manager):
+    """Add a menu with single-letter shortcuts and plenty of stock"""
+    categories = ["Beverages", "Snacks", "Meals", "Desserts"]
+    for i in range(SYNTHETIC_MENU_SIZE):
+        data_manager.add_menu_item({
+            'name': f"Load Item {i + 1}",
+            'category': categories[i % len(categories)],
+            'price': (20 + 10 * (i % 8)) * 100,  # Paise
+            'description': "",
+            'shortcut': chr(ord('a') + i) if i < 26 else "",
+            'initial_stock': SYNTHETIC_STOCK
+        })
+
+
+def file_sizes(data_manager):
+    """Get the size of each data file, if the data manager has local files"""
+    if not hasattr(data_manager, 'get_data_files'):
+        return {}
+    return {
+        name: os.path.getsize(path)
+        for name, path in data_manager.get_data_files().items()
+        if os.path.exists(path)
+    }
+
+
+def latency_summary(values):
+    """Summarize latencies in seconds as milliseconds"""
+    values = np.sort(np.asarray(values, dtype=np.float64)) * 1000
+    if not len(values):
+        return {}
+    return {
+        'p50_ms': float(np.percentile(values, 50)),
+        'p95_ms': float(np.percentile(values, 95)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'max_ms': float(values[-1]),
+    }
+
+
+def run_headless(data_manager, schedule, baskets, tills):
+    """Replay the rush through the data manager with one thread per till
+
+    Returns per-checkout service times (add_sale only) and response times
+    (from the customer's arrival, including waiting for a free till).
+    """
+    checkout_queue = queue.Queue()
+    service_times = []
+    response_times = []
+    errors = []
+    lock = threading.Lock()
+
+    def till():
+        while True:
+            job = checkout_queue.get()
+            if job is None:
+                return
+            arrived_at, basket = job
+
+            start = time.perf_counter()
+            try:
+                success, message = data_manager.add_sale(sale_from_basket(basket))
+            except Exception as e:
+                success, message = False, str(e)
+            end = time.perf_counter()
+
+            with lock:
+                service_times.append(end - start)
+                response_times.append(end - arrived_at)
+                if not success:
+                    errors.append(message)
+
+    threads = [threading.Thread(target=till, daemon=True) for _ in range(tills)]
+    for thread in threads:
+        thread.start()
+
+    # Release customers at their scheduled wall clock times
+    start_time = time.perf_counter()
+    for offset, basket in zip(schedule, baskets):
+        delay = start_time + offset - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        checkout_queue.put((start_time + offset, basket))
+
+    for _ in threads:
+        checkout_queue.put(None)
+    for thread in threads:
+        thread.join()
+
+    return service_times, response_times, errors, time.perf_counter() - start_time
+
+
+def run_ui(data_manager, schedule, baskets):
+    """Replay the rush through QuickSaleFrame with synthetic Tk events
+
+    Items with a shortcut are added with generated key presses, the rest by
+    invoking their menu buttons; the checkout is timed from pressing Complete
+    Sale until the window has processed all resulting redraws.
+    """
+    import customtkinter as ctk
+    import quick_sales
+    from quick_sales import QuickSaleFrame
+
+    # Confirmation dialogs would block the event loop; count them instead
+    errors = []
+    original_messagebox = quick_sales.messagebox
+
+    class SilentMessagebox:
+        @staticmethod
+        def showinfo(title, message, **kwargs):
+            pass
+
+        @staticmethod
+        def showerror(title, message, **kwargs):
+            errors.append(message)
+
+        @staticmethod
+        def askyesno(title, message, **kwargs):
+            return True
+
+    quick_sales.messagebox = SilentMessagebox
+
+    root = ctk.CTk()
+    root.geometry("1200x700")
+    root.grid_columnconfigure(0, weight=1)
+    root.grid_rowconfigure(0, weight=1)
+    frame = QuickSaleFrame(root, data_manager, UI_COLORS)
+    frame.grid(row=0, column=0, sticky="nsew")
+    frame.sync_data()
+    root.update()
+
+    # Shortcuts are bound on whichever widget of the frame holds the binding
+    shortcut_targets = {}
+    for widget in [frame] + frame.winfo_children():
+        for sequence in widget.bind():
+            shortcut_targets[sequence] = widget
+
+    service_times = []
+    response_times = []
+    pending = list(zip(schedule, baskets))
+    start_time = time.perf_counter()
+
+    def serve_next():
+        while pending and start_time + pending[0][0] <= time.perf_counter():
+            offset, basket = pending.pop(0)
+            for item, quantity, by_shortcut in basket:
+                key = (item.get('shortcut') or '').lower()
+                target = shortcut_targets.get(f"<Key-{key}>") if by_shortcut else None
+                for _ in range(quantity):
+                    if target is not None:
+                        target.focus_force()
+                        target.event_generate(f"<KeyPress-{key}>")
+                    else:
+                        frame.add_to_cart(item)
+                root.update_idletasks()
+
+            checkout_start = time.perf_counter()
+            frame.complete_button.invoke()
+            root.update()
+            end = time.perf_counter()
+            service_times.append(end - checkout_start)
+            response_times.append(end - (start_time + offset))
+
+        if pending:
+            wait_ms = max(1, int((start_time + pending[0][0] - time.perf_counter()) * 1000))
+            root.after(wait_ms, serve_next)
+        else:
+            root.quit()
+
+    root.after(0, serve_next)
+    try:
+        root.mainloop()
+    finally:
+        quick_sales.messagebox = original_messagebox
+        root.destroy()
+
+    return service_times, response_times, errors, time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate rush-hour checkout traffic and report latency")
+    parser.add_argument("--profile", choices=sorted(RUSH_PROFILES), default="lunch")
+    parser.add_argument("--speed", type=float, default=60.0,
+                        help="Rush minutes simulated per wall clock minute (default 60: an hour per minute)")
+    parser.add_argument("--duration", type=float, help="Override the profile duration in rush minutes")
+    parser.add_argument("--tills", type=int, default=2, help="Concurrent checkouts in headless mode")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--data-dir", help="Existing data folder to use (default: fresh temporary folder)")
+    parser.add_argument("--server", help="host:port of a POS server to drive instead of local files")
+    parser.add_argument("--ui", action="store_true", help="Drive QuickSaleFrame with synthetic Tk events")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    profile = RUSH_PROFILES[args.profile]
+    duration_minutes = args.duration or profile['duration_minutes']
+    rng = np.random.default_rng(args.seed)
+
+    temp_dir = None
+    if args.server:
+        from pos_client import RemoteDataManager
+        data_manager = RemoteDataManager(args.server, pool_size=max(args.tills, 1))
+    else:
+        data_dir = args.data_dir or tempfile.mkdtemp(prefix="cafe_load_")
+        temp_dir = None if args.data_dir else data_dir
+        data_manager = DataManager(data_dir)
+
+    try:
+        menu = data_manager.get_menu_items()
+        if not menu:
+            seed_synthetic_menu(data_manager)
+            menu = data_manager.get_menu_items()
+
+        # Rush time is compressed by the speed factor
+        schedule = arrival_times(profile, duration_minutes * 60, rng) / args.speed
+        baskets = build_baskets(profile, menu, len(schedule), rng)
+        sizes_before = file_sizes(data_manager)
+
+        print(f"Replaying {len(schedule)} customers ({args.profile}, {duration_minutes:g} rush minutes "
+              f"in {duration_minutes * 60 / args.speed:.1f}s)...")
+        if args.ui:
+            service_times, response_times, errors, elapsed = run_ui(data_manager, schedule, baskets)
+        else:
+            service_times, response_times, errors, elapsed = run_headless(
+                data_manager, schedule, baskets, args.tills
+            )
+
+        sizes_after = file_sizes(data_manager)
+        checkouts = len(service_times)
+        growth = {name: sizes_after.get(name, 0) - sizes_before.get(name, 0) for name in sizes_after}
+        report = {
+            'profile': args.profile,
+            'mode': 'ui' if args.ui else ('server' if args.server else 'headless'),
+            'customers': len(schedule),
+            'checkouts': checkouts,
+            'errors': len(errors),
+            'elapsed_seconds': elapsed,
+            'throughput_per_second': checkouts / elapsed if elapsed else 0.0,
+            'items_per_checkout': float(np.mean([sum(q for _, q, _ in basket) for basket in baskets])) if baskets else 0.0,
+            'service_latency': latency_summary(service_times),
+            'response_latency': latency_summary(response_times),
+            'file_growth_bytes': growth,
+            'bytes_per_checkout': sum(growth.values()) / checkouts if checkouts else 0.0,
+        }
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    print(f"  {report['checkouts']} checkouts, {report['errors']} errors, "
+          f"{report['throughput_per_second']:.1f} checkouts/s, "
+          f"{report['items_per_checkout']:.2f} items per basket")
+    for label, key in (("Checkout (add_sale)", 'service_latency'), ("Arrival to done", 'response_latency')):
+        summary = report[key]
+        if summary:
+            print(f"  {label}: p50 {summary['p50_ms']:.2f} ms, p95 {summary['p95_ms']:.2f} ms, "
+                  f"p99 {summary['p99_ms']:.2f} ms, max {summary['max_ms']:.2f} ms")
+    for name, grown in sorted(report['file_growth_bytes'].items()):
+        print(f"  {name}: +{grown / 1024:.1f} KB")
+    print(f"  {report['bytes_per_checkout']:.0f} bytes stored per checkout")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            f.write(json.dumps(report, indent=2))
+
+    sys.exit(1 if report['errors'] else 0)
+
+
+if __name__ == "__main__":
+    main()
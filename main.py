@@ -10,8 +10,15 @@ from sales_tracking import SalesTrackingFrame
 from inventory_management import InventoryManagementFrame
 from quick_sales import QuickSaleFrame
 from data_manager import DataManager
+from backup_scheduler import BackupScheduler
+from pos_client import RemoteDataManager
+from profiling import profiled, profiler
 from utils import create_data_directory
 
+# Set to host:port of a running pos_server.py to use it as the data store
+POS_SERVER_ENV = "CAFE_POS_SERVER"
+POS_POLL_INTERVAL_MS = 2000
+
 # Set appearance mode and default color theme
 ctk.set_appearance_mode("light")
 ctk.set_default_color_theme("blue")
@@ -23,8 +30,18 @@ class CafeManagementSystem(ctk.CTk):
         # Create data directory if it doesn't exist
         create_data_directory()
         
-        # Initialize data manager
-        self.data_manager = DataManager()
+        # Initialize data manager; with a POS server the store lives there
+        # and this window is one of several terminals
+        pos_server = os.environ.get(POS_SERVER_ENV)
+        if pos_server:
+            self.data_manager = RemoteDataManager(pos_server)
+            self.backup_scheduler = None
+        else:
+            self.data_manager = DataManager()
+            
+            # Take automatic backups in the background
+            self.backup_scheduler = BackupScheduler(self.data_manager)
+            self.backup_scheduler.start()
         
         # Set up window
         self.title("Cafe Management System")
@@ -170,42 +187,71 @@ class CafeManagementSystem(ctk.CTk):
         self.bind("<Control-n>", lambda event: self.current_frame.add_new_item())
         self.bind("<Control-e>", lambda event: self.current_frame.export_data())
         
+        # Hidden developer shortcut: profile each action to collapsed-stack files
+        self.bind("<Control-P>", lambda event: self.toggle_profiling())
+        self.update_title()
+        
         # Track current frame for keyboard shortcuts
         self.current_frame = self.menu_frame
         
+        # Pick up changes made on other terminals
+        if pos_server:
+            self.after(POS_POLL_INTERVAL_MS, self.poll_pos_server)
+    
+    def poll_pos_server(self):
+        try:
+            self.data_manager.poll_changes()
+        except ConnectionError:
+            pass  # Try again on the next poll
+        self.after(POS_POLL_INTERVAL_MS, self.poll_pos_server)
+        
+    def toggle_profiling(self):
+        profiler.toggle()
+        self.update_title()
+    
+    def update_title(self):
+        if profiler.enabled:
+            self.title(f"Cafe Management System [profiling to {profiler.output_dir}]")
+        else:
+            self.title("Cafe Management System")
+    
+    @profiled()
     def show_menu_frame(self):
         self.sales_frame.grid_forget()
         self.inventory_frame.grid_forget()
         self.quick_sale_frame.grid_forget()
         self.menu_frame.grid(row=0, column=0, sticky="nsew")
-        self.menu_frame.refresh_data()
+        self.menu_frame.sync_data()
         self.current_frame = self.menu_frame
         self.select_frame_by_name("menu")
         
+    @profiled()
     def show_sales_frame(self):
         self.menu_frame.grid_forget()
         self.inventory_frame.grid_forget()
         self.quick_sale_frame.grid_forget()
         self.sales_frame.grid(row=0, column=0, sticky="nsew")
-        self.sales_frame.refresh_data()
+        self.sales_frame.sync_data()
         self.current_frame = self.sales_frame
         self.select_frame_by_name("sales")
         
+    @profiled()
     def show_inventory_frame(self):
         self.menu_frame.grid_forget()
         self.sales_frame.grid_forget()
         self.quick_sale_frame.grid_forget()
         self.inventory_frame.grid(row=0, column=0, sticky="nsew")
-        self.inventory_frame.refresh_data()
+        self.inventory_frame.sync_data()
         self.current_frame = self.inventory_frame
         self.select_frame_by_name("inventory")
         
+    @profiled()
     def show_quick_sale_frame(self):
         self.menu_frame.grid_forget()
         self.sales_frame.grid_forget()
         self.inventory_frame.grid_forget()
         self.quick_sale_frame.grid(row=0, column=0, sticky="nsew")
-        self.quick_sale_frame.refresh_data()
+        self.quick_sale_frame.sync_data()
         self.current_frame = self.quick_sale_frame
         self.select_frame_by_name("quick_sale")
         
@@ -234,6 +280,8 @@ class CafeManagementSystem(ctk.CTk):
     
     def on_closing(self):
         if messagebox.askokcancel("Quit", "Do you want to quit?"):
+            if self.backup_scheduler:
+                self.backup_scheduler.stop()
             self.destroy()
 
 if __name__ == "__main__":
@@ -5,6 +5,10 @@ import json
 from PIL import Image, ImageTk
 import os
 
+from profiling import profiled, profiler
+from records import item_key
+from utils import format_currency, parse_currency
+
 class MenuManagementFrame(ctk.CTkFrame):
     def __init__(self, parent, data_manager, colors):
         super().__init__(parent, fg_color=colors["background"])
@@ -28,7 +32,7 @@ class MenuManagementFrame(ctk.CTkFrame):
         # Buttons frame
         self.button_frame = ctk.CTkFrame(self, fg_color="transparent")
         self.button_frame.grid(row=1, column=0, padx=20, pady=10, sticky="ew")
-        self.button_frame.grid_columnconfigure((0, 1, 2, 3), weight=1)
+        self.button_frame.grid_columnconfigure((0, 1, 2, 3, 4), weight=1)
         
         # Add item button
         self.add_button = ctk.CTkButton(
@@ -74,6 +78,17 @@ class MenuManagementFrame(ctk.CTkFrame):
         )
         self.export_button.grid(row=0, column=3, padx=5, pady=10, sticky="ew")
         
+        # Import button
+        self.import_button = ctk.CTkButton(
+            self.button_frame,
+            text="Import Menu",
+            font=("Roboto", 12),
+            fg_color=self.colors["primary"],
+            hover_color="#1e2526",
+            command=self.import_data
+        )
+        self.import_button.grid(row=0, column=4, padx=5, pady=10, sticky="ew")
+        
         # Search frame
         self.search_frame = ctk.CTkFrame(self, fg_color="transparent")
         self.search_frame.grid(row=2, column=0, padx=20, pady=(0, 10), sticky="ew")
@@ -110,25 +125,85 @@ class MenuManagementFrame(ctk.CTkFrame):
         # Initialize menu items display
         self.menu_items = []
         self.menu_item_frames = []
+        self.item_frames_by_id = {}
+        self.stock_levels = {}
         self.selected_item = None
         
+        # Track which data versions are on screen
+        self.data_versions = {}
+        self.pending_events = []
+        self.data_manager.subscribe(self.on_data_changed)
+        
         # Load menu items
         self.refresh_data()
     
+    @profiled()
     def refresh_data(self):
         """Refresh menu items data and update display"""
+        # Remember the data versions this display reflects
+        self.data_versions = self.data_manager.get_versions()
+        self.pending_events = []
+        
         # Clear existing items
         for frame in self.menu_item_frames:
             frame.destroy()
         
         self.menu_item_frames = []
         
-        # Get updated menu items
+        # Get updated menu items and stock levels
         self.menu_items = self.data_manager.get_menu_items()
+        self.stock_levels = {
+            item_key(item): item.get('quantity', 0)
+            for item in self.data_manager.get_inventory()
+        }
         
         # Display menu items
         self.display_menu_items(self.menu_items)
     
+    def on_data_changed(self, event):
+        """Queue change events that affect this frame"""
+        if event['store'] in ('menu', 'inventory'):
+            self.pending_events.append(event)
+            
+            # Patch straight away if the frame is on screen
+            if self.winfo_ismapped():
+                self.after_idle(self.sync_data)
+    
+    def sync_data(self):
+        """Bring the display up to date, patching only what changed"""
+        versions = self.data_manager.get_versions()
+        if versions['menu'] == self.data_versions.get('menu') and \
+                versions['inventory'] == self.data_versions.get('inventory'):
+            return
+        
+        events = self.pending_events
+        self.pending_events = []
+        
+        # Menu changes or missed inventory events need a full reload
+        missed = versions['inventory'] - self.data_versions.get('inventory', 0) - len(events)
+        if versions['menu'] != self.data_versions.get('menu') or missed:
+            self.refresh_data()
+            return
+        
+        for event in events:
+            self.update_item_stock(event['item'])
+        
+        self.data_versions = versions
+    
+    def update_item_stock(self, inventory_item):
+        """Update the stock shown for a single menu item"""
+        key = item_key(inventory_item)
+        self.stock_levels[key] = inventory_item.get('quantity', 0)
+        
+        frame = self.item_frames_by_id.get(key)
+        if frame:
+            self.show_stock(frame.stock_label, self.stock_levels[key])
+    
+    def show_stock(self, stock_label, stock_quantity):
+        """Show a stock quantity on a label"""
+        stock_color = "#00B894" if stock_quantity > 0 else "#FF5252"
+        stock_label.configure(text=f"{stock_quantity} in stock", text_color=stock_color)
+    
     def filter_menu_items(self, *args):
         """Filter menu items based on search text"""
         search_text = self.search_var.get().lower()
@@ -142,7 +217,7 @@ class MenuManagementFrame(ctk.CTkFrame):
                 item for item in self.menu_items
                 if search_text in item.get('name', '').lower() or 
                    search_text in item.get('category', '').lower() or
-                   search_text in str(item.get('price', '')).lower()
+                   search_text in format_currency(item.get('price', 0))
             ]
             self.display_menu_items(filtered_items)
     
@@ -153,6 +228,7 @@ class MenuManagementFrame(ctk.CTkFrame):
             frame.destroy()
         
         self.menu_item_frames = []
+        self.item_frames_by_id = {}
         
         # No items message
         if not items_to_display:
@@ -232,6 +308,7 @@ class MenuManagementFrame(ctk.CTkFrame):
                 item_frame = self.create_menu_item_frame(item)
                 item_frame.grid(row=row_counter, column=0, padx=10, pady=5, sticky="ew")
                 self.menu_item_frames.append(item_frame)
+                self.item_frames_by_id[item.get('id')] = item_frame
                 row_counter += 1
     
     def create_menu_item_frame(self, item):
@@ -258,7 +335,7 @@ class MenuManagementFrame(ctk.CTkFrame):
         name_label.grid(row=0, column=0, padx=10, pady=10, sticky="w")
         
         # Price
-        price_text = f"₹{item.get('price', '0.00')}"
+        price_text = format_currency(item.get('price', 0))
         price_label = ctk.CTkLabel(
             frame,
             text=price_text,
@@ -278,24 +355,13 @@ class MenuManagementFrame(ctk.CTkFrame):
         shortcut_label.grid(row=0, column=2, padx=10, pady=10, sticky="w")
         
         # Stock status
-        inventory = self.data_manager.get_inventory()
-        stock_quantity = 0
-        
-        for inv_item in inventory:
-            if inv_item.get('name') == item.get('name'):
-                stock_quantity = inv_item.get('quantity', 0)
-                break
-        
-        stock_color = "#00B894" if stock_quantity > 0 else "#FF5252"
-        stock_text = f"{stock_quantity} in stock"
-        
         stock_label = ctk.CTkLabel(
             frame,
-            text=stock_text,
-            font=("Roboto", 14),
-            text_color=stock_color
+            font=("Roboto", 14)
         )
         stock_label.grid(row=0, column=3, padx=10, pady=10, sticky="w")
+        self.show_stock(stock_label, self.stock_levels.get(item.get('id'), 0))
+        frame.stock_label = stock_label
         
         # Add selection behavior
         frame.bind("<Button-1>", lambda event, f=frame: self.select_item(f))
@@ -333,7 +399,7 @@ class MenuManagementFrame(ctk.CTkFrame):
         """Open dialog to add a new menu item"""
         self.item_dialog = ItemDialog(self, self.colors, self.data_manager)
         self.wait_window(self.item_dialog)
-        self.refresh_data()
+        self.sync_data()
     
     def edit_selected_item(self):
         """Edit the selected menu item"""
@@ -358,7 +424,7 @@ class MenuManagementFrame(ctk.CTkFrame):
         
         self.item_dialog = ItemDialog(self, self.colors, self.data_manager, item_data)
         self.wait_window(self.item_dialog)
-        self.refresh_data()
+        self.sync_data()
     
     def delete_selected_item(self):
         """Delete the selected menu item"""
@@ -386,7 +452,7 @@ class MenuManagementFrame(ctk.CTkFrame):
             
             if success:
                 messagebox.showinfo("Success", message)
-                self.refresh_data()
+                self.sync_data()
             else:
                 messagebox.showerror("Error", message)
     
@@ -401,12 +467,37 @@ class MenuManagementFrame(ctk.CTkFrame):
         if not filepath:
             return  # User cancelled
         
-        success, message = self.data_manager.export_menu_to_excel(filepath)
+        with profiler.action("export_menu"):
+            success, message = self.data_manager.export_menu_to_excel(filepath)
         
         if success:
             messagebox.showinfo("Export Successful", message)
         else:
             messagebox.showerror("Export Failed", message)
+    
+    def import_data(self):
+        """Import menu items from a CSV or Excel file"""
+        filepath = filedialog.askopenfilename(
+            filetypes=[("Menu files", "*.csv *.xlsx *.xls"), ("All files", "*.*")],
+            title="Import Menu"
+        )
+        
+        if not filepath:
+            return  # User cancelled
+        
+        # Items already on the menu are skipped unless the user wants them updated
+        upsert = messagebox.askyesno(
+            "Import Menu",
+            "Update items that are already on the menu with the prices and details from the file?\n\n"
+            "Choose No to only add new items."
+        )
+        success, message = self.data_manager.import_menu(filepath, upsert)
+        
+        if success:
+            messagebox.showinfo("Import Successful", message)
+            self.sync_data()
+        else:
+            messagebox.showerror("Import Failed", message)
 
 
 class ItemDialog(ctk.CTkToplevel):
@@ -497,7 +588,7 @@ class ItemDialog(ctk.CTkToplevel):
         )
         self.price_label.grid(row=2, column=0, padx=5, pady=10, sticky="w")
         
-        self.price_var = tk.StringVar(value=str(item_data.get('price', '0.00')) if item_data else '0.00')
+        self.price_var = tk.StringVar(value=format_currency(item_data.get('price', 0)).lstrip('₹') if item_data else '0.00')
         self.price_entry = ctk.CTkEntry(
             self.form_frame,
             font=("Roboto", 14),
@@ -556,7 +647,7 @@ class ItemDialog(ctk.CTkToplevel):
         if item_data:
             inventory = self.data_manager.get_inventory()
             for inv_item in inventory:
-                if inv_item.get('name') == item_data.get('name'):
+                if item_key(inv_item) == item_data.get('id'):
                     initial_stock = inv_item.get('quantity', 0)
                     break
         
@@ -605,7 +696,8 @@ class ItemDialog(ctk.CTkToplevel):
             return
         
         try:
-            price = float(self.price_var.get())
+            # Prices are kept in paise so totals add up exactly
+            price = parse_currency(self.price_var.get())
             if price < 0:
                 raise ValueError("Price must be positive")
         except ValueError:
@@ -624,14 +716,17 @@ class ItemDialog(ctk.CTkToplevel):
         item_data = {
             'name': self.name_var.get().strip(),
             'category': self.category_var.get(),
-            'price': float(self.price_var.get()),
+            'price': price,
             'description': self.desc_var.get().strip(),
             'shortcut': self.shortcut_var.get().strip(),
             'initial_stock': int(self.stock_var.get())
         }
         
         if self.item_data:  # Editing existing item
-            success, message = self.data_manager.update_menu_item(self.item_data['id'], item_data)
+            # Refuse to overwrite changes saved from another terminal meanwhile
+            success, message = self.data_manager.update_menu_item(
+                self.item_data['id'], item_data, expected_version=self.item_data.get('version')
+            )
         else:  # Adding new item
             success, message = self.data_manager.add_menu_item(item_data)
         
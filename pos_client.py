@@ -0,0 +1,403 @@
+import json
+import time
+import queue
+import socket
+import argparse
+import threading
+from urllib.parse import urlencode
+
+import numpy as np
+
+from data_manager import DataManager
+from records import MenuItem, Sale, InventoryItem, convert_report_amounts, to_paise
+from sale_lines import LINE_DTYPE
+
+# Client defaults
+DEFAULT_ADDRESS = "127.0.0.1:8765"
+DEFAULT_POOL_SIZE = 4
+REQUEST_TIMEOUT = 10.0
+
+
+class POSConnection:
+    def __init__(self, host, port, timeout=REQUEST_TIMEOUT):
+        """Open a keep-alive connection to the POS server"""
+        self.host = host
+        self.sock = socket.create_connection((host, port), timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+
+    def send(self, requests):
+        """Send (method, path, payload) requests back to back without waiting"""
+        data = []
+        for method, path, payload in requests:
+            body = json.dumps(payload).encode() if payload is not None else b''
+            data.append(
+                f"{method} {path} HTTP/1.1\r\n"
+                f"Host: {self.host}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body
+            )
+        self.sock.sendall(b''.join(data))
+
+    def read_response(self):
+        """Read the next response as (status, decoded JSON body)"""
+        status_line = self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by server")
+        status = int(status_line.split()[1])
+
+        length = 0
+        while True:
+            line = self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+
+        body = self.reader.read(length)
+        if len(body) < length:
+            raise ConnectionError("Connection closed mid-response")
+        return status, json.loads(body) if body else None
+
+    def close(self):
+        """Close the connection"""
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RemoteDataManager:
+    def __init__(self, address=DEFAULT_ADDRESS, pool_size=DEFAULT_POOL_SIZE, timeout=REQUEST_TIMEOUT):
+        """Initialize a thin client for a POS server at host:port"""
+        host, _, port = address.rpartition(':')
+        self.host = host or "127.0.0.1"
+        self.port = int(port)
+        self.timeout = timeout
+
+        # Idle connections are reused; the semaphore caps how many exist
+        self._pool = queue.LifoQueue()
+        self._pool_slots = threading.BoundedSemaphore(pool_size)
+
+        # Change tracking mirrors DataManager, fed from the server's event log
+        self.versions = {'menu': 0, 'sales': 0, 'inventory': 0}
+        self._subscribers = []
+        self._event_seq = 0
+
+        # Sale line rows fetched so far; later calls only fetch newer ones
+        self._sale_lines = np.zeros(0, dtype=LINE_DTYPE)
+
+    # Connection pool functions
+    def request_many(self, requests):
+        """Send requests pipelined on one pooled connection, returning responses in order"""
+        self._pool_slots.acquire()
+        try:
+            for attempt in range(2):
+                try:
+                    connection = self._pool.get_nowait()
+                    reused = True
+                except queue.Empty:
+                    connection = POSConnection(self.host, self.port, self.timeout)
+                    reused = False
+
+                try:
+                    connection.send(requests)
+                    responses = [connection.read_response() for _ in requests]
+                except (OSError, ValueError) as e:
+                    connection.close()
+                    # An idle connection may have been dropped by the server;
+                    # only reads are safe to resend
+                    if reused and all(method == 'GET' for method, _, _ in requests):
+                        continue
+                    raise ConnectionError(f"POS server request failed: {str(e)}")
+
+                self._pool.put(connection)
+                return responses
+        finally:
+            self._pool_slots.release()
+
+    def request(self, method, path, payload=None):
+        """Send one request and return its decoded response body"""
+        return self.request_many([(method, path, payload)])[0][1]
+
+    def close(self):
+        """Close all idle connections"""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    # Change notification functions
+    def subscribe(self, callback):
+        """Register a callback that receives change events"""
+        if callback not in self._subscribers:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        """Remove a previously registered callback"""
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def get_versions(self):
+        """Get the version counter for each store as of the last poll"""
+        return dict(self.versions)
+
+    def poll_changes(self):
+        """Fetch change events from other terminals and notify subscribers"""
+        self._apply_changes(self.request('GET', f"/events?since={self._event_seq}"))
+
+    def _apply_changes(self, changes):
+        """Adopt the server versions, then deliver the events in order"""
+        self._event_seq = changes['seq']
+        self.versions = changes['versions']
+
+        # Events dropped from the server's log show up as a version gap,
+        # which subscribers already treat as a reason to reload
+        for event in changes['events']:
+            event.pop('seq', None)
+            if 'sale' in event:
+                event['sale'] = Sale.from_json(event['sale'])
+            if event['store'] == 'menu':
+                event['item'] = MenuItem.from_json(event['item'])
+            for callback in list(self._subscribers):
+                callback(event)
+
+    def _write(self, method, path, payload=None):
+        """Send a write and fetch the change events it caused in the same round trip"""
+        (_, result), (_, changes) = self.request_many([
+            (method, path, payload),
+            ('GET', f"/events?since={self._event_seq}", None)
+        ])
+        self._apply_changes(changes)
+        return result
+
+    # Menu Management Functions
+    # Amounts are paise here and rupees on the wire, like in the data files
+    def get_menu_items(self):
+        """Retrieve all menu items"""
+        return [MenuItem.from_json(item) for item in self.request('GET', "/menu")]
+
+    def add_menu_item(self, item):
+        """Add a new menu item, with its price in paise"""
+        result = self._write('POST', "/menu", MenuItem(item).to_json())
+        item.update(MenuItem.from_json(result.get('item') or {}))
+        return result['success'], result['message']
+
+    def update_menu_item(self, item_id, updated_data, expected_version=None):
+        """Update an existing menu item"""
+        query = f"?expected_version={expected_version}" if expected_version is not None else ""
+        result = self._write('PUT', f"/menu/{item_id}{query}", MenuItem(updated_data).to_json())
+        return result['success'], result['message']
+
+    def import_menu_items(self, items, upsert=False):
+        """Add many menu items in one request"""
+        query = "?upsert=1" if upsert else ""
+        result = self._write('POST', f"/menu/import{query}", [MenuItem(item).to_json() for item in items])
+        return result['success'], result['message']
+
+    # Files are read on this terminal and sent as one batch
+    import_menu = DataManager.import_menu
+
+    def delete_menu_item(self, item_id):
+        """Delete a menu item"""
+        result = self._write('DELETE', f"/menu/{item_id}")
+        return result['success'], result['message']
+
+    # Sales Tracking Functions
+    def get_sales(self, date_filter=None):
+        """Retrieve sales data with optional date filtering"""
+        query = f"?{urlencode({'date': date_filter})}" if date_filter else ""
+        return [Sale.from_json(sale) for sale in self.request('GET', f"/sales{query}")]
+
+    def iter_sales(self, start=None, end=None, fields=None):
+        """Stream the sales from start to end (inclusive) in timestamp order, a page at a time"""
+        start, end = self._range_bound(start), self._range_bound(end)
+        query = {key: value for key, value in (('end', end), ('fields', ','.join(fields or ()))) if value}
+        while True:
+            page = self.request('GET', f"/sales/range?{urlencode(dict(query, start=start) if start else query)}")
+            for sale in page['sales']:
+                yield Sale.from_json(sale)
+            if not page['next']:
+                return
+            start = page['next']
+
+    _range_bound = DataManager._range_bound
+
+    def add_sale(self, sale_data):
+        """Add a new sale record, with amounts in paise"""
+        result = self._write('POST', "/sales", Sale(sale_data).to_json())
+        sale_data.update(Sale.from_json(result.get('sale') or {}))
+        return result['success'], result['message']
+
+    def add_sales(self, sales, imported=False, update_inventory=True):
+        """Add several sale records in one request; each sale the server turns away is left unchanged"""
+        flags = {'imported': int(imported), 'update_inventory': int(update_inventory)}
+        result = self._write('POST', f"/sales?{urlencode(flags)}", [Sale(sale_data).to_json() for sale_data in sales])
+        for sale_data, stored in zip(sales, result.get('sales') or []):
+            if stored:
+                sale_data.update(Sale.from_json(stored))
+        return result['success'], result['message']
+
+    def checkpoint_sales_rollup(self):
+        """Have the server save its sales counters, as after an import"""
+        self._write('POST', "/sales/checkpoint")
+
+    def checkpoint_inventory(self):
+        """Have the server snapshot its stock levels, as after an import"""
+        self._write('POST', "/inventory/checkpoint")
+
+    def get_sales_signature(self):
+        """Get a signature of the sales file; always None, as every terminal's sales reach subscribers as events"""
+        return None
+
+    def get_sales_dates(self):
+        """Get the business dates that have sales, oldest first"""
+        return self.request('GET', "/sales/dates")
+
+    def get_daily_sales_summary(self, target_date=None):
+        """Get a summary of sales for a specific date"""
+        query = f"?{urlencode({'date': target_date})}" if target_date else ""
+        return convert_report_amounts(self.request('GET', f"/sales/summary{query}"), to_paise)
+
+    def get_top_items(self, k=10, by='quantity', target_date=None):
+        """Get the k best selling items by 'quantity' or 'revenue', all-time or for one date"""
+        query = {'k': k, 'by': by}
+        if target_date:
+            query['date'] = target_date
+        return convert_report_amounts(self.request('GET', f"/sales/top?{urlencode(query)}"), to_paise)
+    
+    def get_sales_heatmap(self):
+        """Get revenue and transaction counts by weekday and hour as 7x24 arrays"""
+        heatmap = convert_report_amounts(self.request('GET', "/sales/heatmap"), to_paise)
+        return {key: np.array(cells) for key, cells in heatmap.items()}
+    
+    def get_sale_lines(self):
+        """Get the line items of every sale as a LINE_DTYPE array, fetching only rows added since the last call"""
+        cached = self._sale_lines
+        page = self.request('GET', f"/sales/lines?{urlencode({'start': len(cached)})}")
+        if page['count'] < len(cached):
+            # The server rebuilt its line store; fetch it all again
+            self._sale_lines = cached[:0]
+            return self.get_sale_lines()
+
+        rows = np.zeros(page['count'] - len(cached), dtype=LINE_DTYPE)
+        for name, values in page['lines'].items():
+            rows[name] = values
+        self._sale_lines = np.concatenate([cached, rows])
+        return self._sale_lines
+
+    def business_date(self):
+        """Get the open business day"""
+        return self.request('GET', "/sales/day")['date']
+
+    def close_day(self, business_date=None):
+        """Close a business day (by default the open one) and write its Z-report"""
+        result = self._write('POST', "/sales/close", {'date': self._range_bound(business_date)})
+        return result['success'], result['message']
+
+    def get_z_report(self, day_date):
+        """Get the Z-report of a closed day, or None if it is open"""
+        report = self.request('GET', f"/sales/zreport?{urlencode({'date': self._range_bound(day_date)})}")
+        return convert_report_amounts(report, to_paise)
+
+    # Inventory Management Functions
+    def get_inventory(self):
+        """Retrieve inventory data"""
+        return [InventoryItem(item) for item in self.request('GET', "/inventory")]
+
+    def update_inventory(self, item_name, quantity_change, is_addition=True, reason=None, source_id=None,
+                         expected_version=None):
+        """Update inventory quantity for an item"""
+        result = self._write('POST', "/inventory", {
+            'item_name': item_name,
+            'quantity_change': quantity_change,
+            'is_addition': is_addition,
+            'reason': reason,
+            'source_id': source_id,
+            'expected_version': expected_version
+        })
+        return result['success'], result['message']
+
+    def apply_inventory_deltas(self, deltas, reason='adjustment', source_id=None):
+        """Apply a batch of stock changes in one request"""
+        result = self._write('POST', "/inventory/batch", {
+            'deltas': deltas,
+            'reason': reason,
+            'source_id': source_id
+        })
+        return result['success'], result['message']
+
+    def get_inventory_movements(self, item_name=None, reason=None):
+        """Retrieve ledger movements, optionally for one item or reason"""
+        filters = {key: value for key, value in (('item_name', item_name), ('reason', reason)) if value}
+        query = f"?{urlencode(filters)}" if filters else ""
+        return self.request('GET', f"/inventory/movements{query}")
+
+    # Export functions only use the getters above
+    export_menu_to_excel = DataManager.export_menu_to_excel
+    export_sales_to_excel = DataManager.export_sales_to_excel
+    export_inventory_to_excel = DataManager.export_inventory_to_excel
+
+
+def run_benchmark(address, total_sales, threads, pipeline):
+    """Post single-sale requests from several threads and report throughput and latency"""
+    client = RemoteDataManager(address, pool_size=threads)
+    menu = client.get_menu_items() or [{'name': 'Benchmark Item', 'price': 1000}]
+    item = menu[0]
+
+    latencies = []
+    latencies_lock = threading.Lock()
+    per_thread = total_sales // threads
+
+    def worker():
+        done = 0
+        while done < per_thread:
+            count = min(pipeline, per_thread - done)
+            sale = Sale({
+                'items': [{'name': item['name'], 'price': item.get('price', 0), 'quantity': 1}],
+                'total_amount': item.get('price', 0),
+                'payment_method': 'Cash'
+            }).to_json()
+            start = time.perf_counter()
+            client.request_many([('POST', "/sales", sale)] * count)
+            elapsed = time.perf_counter() - start
+            with latencies_lock:
+                latencies.extend([elapsed] * count)
+            done += count
+
+    start_time = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    duration = time.perf_counter() - start_time
+
+    latencies.sort()
+    print(f"{len(latencies)} sales in {duration:.2f}s ({len(latencies) / duration:.0f} sales/s)")
+    for label, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99)):
+        print(f"  {label} latency: {latencies[int(fraction * (len(latencies) - 1))] * 1000:.1f} ms")
+    client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="POS server client utilities")
+    parser.add_argument("--address", default=DEFAULT_ADDRESS)
+    parser.add_argument("--bench", action="store_true", help="Run a sales throughput benchmark")
+    parser.add_argument("--sales", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--pipeline", type=int, default=8, help="Requests in flight per connection")
+    args = parser.parse_args()
+
+    if args.bench:
+        run_benchmark(args.address, args.sales, args.threads, args.pipeline)
+    else:
+        client = RemoteDataManager(args.address)
+        print(json.dumps(client.request('GET', "/versions")))
+
+
+if __name__ == "__main__":
+    main()
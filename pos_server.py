@@ -0,0 +1,443 @@
+import json
+import asyncio
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+from data_manager import DataManager
+from records import MenuItem, Sale, convert_report_amounts, from_paise, json_default
+from backup_scheduler import BackupScheduler
+
+# Server defaults
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+EVENT_LOG_SIZE = 2000  # Change events kept for terminals catching up
+
+# Group commit: sales arriving while a write is in progress go out in the next one
+SALE_BATCH_MAX = 256
+
+# Sales per page of a date range; pages end on a day boundary
+SALES_PAGE_SIZE = 5000
+
+MAX_BODY_SIZE = 1024 * 1024
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class EventLog:
+    def __init__(self, data_manager, size=EVENT_LOG_SIZE):
+        """Record change events from the data manager with a global sequence number"""
+        self.data_manager = data_manager
+        self.events = deque(maxlen=size)
+        self.seq = 0
+        self._lock = threading.Lock()
+        data_manager.subscribe(self.on_data_changed)
+
+    def on_data_changed(self, event):
+        """Append a change event to the log"""
+        with self._lock:
+            self.seq += 1
+            self.events.append(dict(event, seq=self.seq))
+
+    def since(self, seq):
+        """Get events after seq, and whether none were dropped from the log"""
+        with self._lock:
+            events = [event for event in self.events if event['seq'] > seq]
+            complete = seq >= self.seq - len(self.events)
+            return {
+                'seq': self.seq,
+                'events': events,
+                'complete': complete,
+                'versions': self.data_manager.get_versions()
+            }
+
+
+class POSServer:
+    def __init__(self, data_manager, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """Initialize the server around the data manager that owns the store"""
+        self.data_manager = data_manager
+        self.host = host
+        self.port = port
+        self.event_log = EventLog(data_manager)
+
+        # Store calls block on file I/O, so they run one at a time off the event loop
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store")
+        self.sale_queue = None
+        self.server = None
+
+        self.routes = {
+            ('GET', 'menu'): self.get_menu,
+            ('POST', 'menu'): self.add_menu_item,
+            ('PUT', 'menu'): self.update_menu_item,
+            ('DELETE', 'menu'): self.delete_menu_item,
+            ('POST', 'menu/import'): self.import_menu_items,
+            ('GET', 'sales'): self.get_sales,
+            ('POST', 'sales'): self.add_sales,
+            ('GET', 'sales/range'): self.get_sales_range,
+            ('GET', 'sales/dates'): self.get_sales_dates,
+            ('GET', 'sales/summary'): self.get_sales_summary,
+            ('GET', 'sales/top'): self.get_top_items,
+            ('GET', 'sales/heatmap'): self.get_sales_heatmap,
+            ('GET', 'sales/lines'): self.get_sale_lines,
+            ('GET', 'sales/day'): self.get_business_date,
+            ('POST', 'sales/close'): self.close_day,
+            ('POST', 'sales/checkpoint'): self.checkpoint_sales_rollup,
+            ('GET', 'sales/zreport'): self.get_z_report,
+            ('GET', 'inventory'): self.get_inventory,
+            ('POST', 'inventory'): self.update_inventory,
+            ('POST', 'inventory/batch'): self.apply_inventory_deltas,
+            ('POST', 'inventory/checkpoint'): self.checkpoint_inventory,
+            ('GET', 'inventory/movements'): self.get_inventory_movements,
+            ('GET', 'versions'): self.get_versions,
+            ('GET', 'events'): self.get_events,
+        }
+
+    async def start(self):
+        """Start listening and committing sales"""
+        self.sale_queue = asyncio.Queue()
+        asyncio.get_running_loop().create_task(self.commit_sales())
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        return self.server
+
+    async def serve_forever(self):
+        """Run the server until cancelled"""
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def call_store(self, func, *args):
+        """Run a data manager call on the store thread"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    # Connection handling
+    async def handle_connection(self, reader, writer):
+        """Serve requests on a keep-alive connection in the order they arrive"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY_SIZE:
+                    await self.send_response(writer, 413, {'success': False, 'message': "Request too large"})
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                status, payload = await self.dispatch(method, target, body)
+                await self.send_response(writer, status, payload)
+
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def send_response(self, writer, status, payload):
+        """Write a JSON response"""
+        body = json.dumps(payload, default=json_default).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: keep-alive\r\n\r\n".encode('latin-1') + body
+        )
+        await writer.drain()
+
+    async def dispatch(self, method, target, body):
+        """Route a request to its handler"""
+        url = urlsplit(target)
+        parts = url.path.strip('/').split('/')
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        # A trailing numeric part is the record ID
+        record_id = None
+        if len(parts) > 1 and parts[-1].isdigit():
+            record_id = int(parts.pop())
+
+        handler = self.routes.get((method, '/'.join(parts)))
+        if handler is None:
+            return 404, {'success': False, 'message': "Not found"}
+
+        try:
+            data = json.loads(body) if body else None
+            return await handler(data=data, query=query, record_id=record_id)
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+            return 400, {'success': False, 'message': f"Bad request: {str(e)}"}
+        except Exception as e:
+            return 500, {'success': False, 'message': str(e)}
+
+    def result(self, outcome, **payload):
+        """Turn a (success, message) result into a response"""
+        success, message = outcome
+        response = {'success': success, 'message': message}
+        response.update(payload)
+        return (200 if success else 400), response
+
+    # Menu endpoints
+    async def get_menu(self, **request):
+        """Get all menu items"""
+        return 200, await self.call_store(self.data_manager.get_menu_items)
+
+    async def add_menu_item(self, data, **request):
+        """Add a menu item, returning it with its new ID"""
+        item = MenuItem.from_json(data)
+        outcome = await self.call_store(self.data_manager.add_menu_item, item)
+        return self.result(outcome, item=item)
+
+    async def update_menu_item(self, data, record_id, query, **request):
+        """Update the menu item with the ID in the path, optionally only at ?expected_version="""
+        expected_version = int(query['expected_version']) if 'expected_version' in query else None
+        return self.result(await self.call_store(
+            self.data_manager.update_menu_item, record_id, MenuItem.from_json(data), expected_version
+        ))
+
+    async def delete_menu_item(self, record_id, **request):
+        """Delete the menu item with the ID in the path"""
+        return self.result(await self.call_store(self.data_manager.delete_menu_item, record_id))
+
+    async def import_menu_items(self, data, query, **request):
+        """Add a list of menu items in one write, updating existing ones with ?upsert=1"""
+        if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+            raise TypeError("expected a list of menu items")
+        items = [MenuItem.from_json(item) for item in data]
+        return self.result(await self.call_store(
+            self.data_manager.import_menu_items, items, query.get('upsert') == '1'
+        ))
+
+    # Sales endpoints
+    async def get_sales(self, query, **request):
+        """Get sales, optionally for ?date=YYYY-MM-DD"""
+        return 200, await self.call_store(self.data_manager.get_sales, query.get('date'))
+
+    async def get_sales_range(self, query, **request):
+        """Get a page of sales between ?start= and ?end=, optionally only ?fields=a,b
+
+        The response's 'next' is the date to ask for the following page
+        from, or null after the last page.
+        """
+        fields = query['fields'].split(',') if query.get('fields') else None
+        limit = int(query.get('limit', SALES_PAGE_SIZE))
+
+        def read_page():
+            # Pages are cut between days, so the date is read even if not asked for
+            read_fields = fields + ['date'] if fields and 'date' not in fields else fields
+            sales, next_date = [], None
+            for sale in self.data_manager.iter_sales(query.get('start'), query.get('end'), read_fields):
+                if len(sales) >= limit and sale.get('date') != sales[-1].get('date'):
+                    next_date = sale.get('date')
+                    break
+                sales.append(sale)
+
+            if read_fields is not fields:
+                for sale in sales:
+                    sale.pop('date', None)
+            return {'sales': sales, 'next': next_date}
+
+        return 200, await self.call_store(read_page)
+
+    async def get_sales_dates(self, **request):
+        """Get the business dates that have sales, oldest first"""
+        return 200, await self.call_store(self.data_manager.get_sales_dates)
+
+    async def get_sales_summary(self, query, **request):
+        """Get the sales summary for ?date=YYYY-MM-DD (default the open business day), in rupees"""
+        summary = await self.call_store(self.data_manager.get_daily_sales_summary, query.get('date'))
+        return 200, convert_report_amounts(summary, from_paise)
+
+    async def get_top_items(self, query, **request):
+        """Get the best selling items, optionally ?k=, ?by=quantity|revenue and ?date=, in rupees"""
+        top_items = await self.call_store(
+            self.data_manager.get_top_items, int(query.get('k', 10)), query.get('by', 'quantity'), query.get('date')
+        )
+        return 200, convert_report_amounts(top_items, from_paise)
+    
+    async def get_sales_heatmap(self, **request):
+        """Get revenue (rupees) and transactions by weekday and hour"""
+        heatmap = await self.call_store(self.data_manager.get_sales_heatmap)
+        return 200, convert_report_amounts({key: cells.tolist() for key, cells in heatmap.items()}, from_paise)
+    
+    async def get_sale_lines(self, query, **request):
+        """Get the sale line rows from row ?start= on, as one list per column, and the total row count"""
+        start = int(query.get('start', 0))
+
+        def read_rows():
+            lines = self.data_manager.get_sale_lines()
+            return {'count': len(lines), 'lines': {name: lines[name][start:].tolist() for name in lines.dtype.names}}
+
+        return 200, await self.call_store(read_rows)
+
+    async def get_business_date(self, **request):
+        """Get the open business day"""
+        return 200, {'date': await self.call_store(self.data_manager.business_date)}
+
+    async def close_day(self, data, **request):
+        """Close the business day in the body's 'date' (default the open one) and write its Z-report"""
+        business_date = data.get('date') if isinstance(data, dict) else None
+        return self.result(await self.call_store(self.data_manager.close_day, business_date))
+
+    async def checkpoint_sales_rollup(self, **request):
+        """Save the sales counters, as after an import"""
+        await self.call_store(self.data_manager.checkpoint_sales_rollup)
+        return self.result((True, "Sales counters saved."))
+
+    async def get_z_report(self, query, **request):
+        """Get the Z-report of the closed day ?date=YYYY-MM-DD in rupees, or null if it is open"""
+        report = await self.call_store(self.data_manager.get_z_report, query.get('date'))
+        return 200, convert_report_amounts(report, from_paise)
+
+    async def add_sales(self, data, query, **request):
+        """Queue one sale or a list of sales for the next group commit, ?imported=1&update_inventory=0 as flags
+
+        Each sale is checked before it is queued and gets its own result, so
+        a bad sale is turned away with a 400 without failing the others.
+        """
+        sales = data if isinstance(data, list) else [data]
+        if not sales:
+            raise TypeError("expected a sale object or a list of them")
+        flags = (query.get('imported') == '1', query.get('update_inventory') != '0')
+        errors = await self.call_store(self.data_manager.check_sales, sales)
+
+        futures = []
+        for sale, error in zip(sales, errors):
+            future = asyncio.get_running_loop().create_future()
+            if error:
+                future.set_result((False, f"Invalid sale: {error}"))
+            else:
+                sale = Sale.from_json(sale)
+                await self.sale_queue.put((sale, flags, future))
+            futures.append((sale, future))
+
+        results = []
+        for sale, future in futures:
+            success, message = await future
+            results.append({'success': success, 'message': message, 'sale': sale if success else None})
+
+        if not isinstance(data, list):
+            return self.result((results[0]['success'], results[0]['message']), sale=results[0]['sale'])
+        recorded = sum(result['success'] for result in results)
+        message = f"{recorded} of {len(sales)} sales recorded." if recorded < len(sales) else \
+            f"{len(sales)} sales recorded successfully."
+        return self.result((recorded == len(sales), message), sales=[result['sale'] for result in results],
+                           results=[{'success': result['success'], 'message': result['message']}
+                                    for result in results])
+
+    async def commit_sales(self):
+        """Write queued sales in batches so concurrent tills share one append"""
+        while True:
+            queued = [await self.sale_queue.get()]
+            while len(queued) < SALE_BATCH_MAX and not self.sale_queue.empty():
+                queued.append(self.sale_queue.get_nowait())
+
+            # Sales with the same flags share an append
+            batches = {}
+            for sale, flags, future in queued:
+                batches.setdefault(flags, []).append((sale, future))
+            for flags, batch in batches.items():
+                await self.commit_batch(batch, flags)
+
+    async def commit_batch(self, batch, flags):
+        """Record a batch of queued sales, one by one if the data manager turns the batch away"""
+        try:
+            success, message = await self.call_store(self.data_manager.add_sales, [sale for sale, _ in batch], *flags)
+        except Exception as e:
+            # The append may have happened, so the sales are not retried
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        if success:
+            for _, future in batch:
+                future.set_result((True, "Sale recorded successfully."))
+        elif len(batch) == 1:
+            batch[0][1].set_result((False, message))
+        else:
+            # Find the sale at fault without failing the tills that shared its append
+            for entry in batch:
+                await self.commit_batch([entry], flags)
+
+    # Inventory endpoints
+    async def get_inventory(self, **request):
+        """Get current stock levels"""
+        return 200, await self.call_store(self.data_manager.get_inventory)
+
+    async def update_inventory(self, data, **request):
+        """Record a stock movement for one item"""
+        outcome = await self.call_store(
+            lambda: self.data_manager.update_inventory(
+                data['item_name'], data['quantity_change'], data.get('is_addition', True),
+                reason=data.get('reason'), source_id=data.get('source_id'),
+                expected_version=data.get('expected_version')
+            )
+        )
+        return self.result(outcome)
+
+    async def apply_inventory_deltas(self, data, **request):
+        """Record a batch of stock movements in one ledger write"""
+        if not isinstance(data.get('deltas'), list):
+            raise TypeError("expected a list of deltas")
+        return self.result(await self.call_store(
+            self.data_manager.apply_inventory_deltas, data['deltas'], data.get('reason', 'adjustment'),
+            data.get('source_id')
+        ))
+
+    async def checkpoint_inventory(self, **request):
+        """Snapshot the stock levels, as after an import"""
+        await self.call_store(self.data_manager.checkpoint_inventory)
+        return self.result((True, "Stock levels saved."))
+
+    async def get_inventory_movements(self, query, **request):
+        """Get ledger movements, optionally for ?item_name= or ?reason="""
+        return 200, await self.call_store(
+            self.data_manager.get_inventory_movements, query.get('item_name'), query.get('reason')
+        )
+
+    # Change tracking endpoints
+    async def get_versions(self, **request):
+        """Get the version counter of each store"""
+        return 200, self.data_manager.get_versions()
+
+    async def get_events(self, query, **request):
+        """Get change events after ?since=<seq>"""
+        return 200, self.event_log.since(int(query.get('since', 0)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the cafe data store to POS terminals")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--no-backups", action="store_true", help="Don't take automatic backups")
+    args = parser.parse_args()
+
+    data_manager = DataManager(args.data_dir)
+    backup_scheduler = None
+    if not args.no_backups:
+        backup_scheduler = BackupScheduler(data_manager)
+        backup_scheduler.start()
+
+    server = POSServer(data_manager, args.host, args.port)
+    print(f"Serving cafe data from {args.data_dir} on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if backup_scheduler:
+            backup_scheduler.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from functools import wraps
+
+# Set to 1 (or to a directory for the profiles) to profile UI actions from
+# startup; Ctrl+Shift+P turns profiling on and off while running
+PROFILE_ENV = "CAFE_PROFILE"
+DEFAULT_PROFILE_DIR = "profiles"
+PROFILE_LOG = "actions.log"
+
+# Seconds between stack samples. While the UI thread holds the GIL the
+# sampler only gets to run at thread switches, so the switch interval is
+# lowered to match for the length of each capture.
+SAMPLE_INTERVAL = 0.001
+
+
+def stack_labels(frame):
+    """Get 'function (file:line)' labels for a frame and its callers, outermost first"""
+    labels = []
+    while frame is not None:
+        code = frame.f_code
+        labels.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+class ActionProfiler:
+    """Sampling profiler for UI actions, writing one collapsed-stack file per action
+
+    Each capture samples the acting thread's stack from a background thread
+    and writes the counts as 'root;caller;callee count' lines, which
+    flamegraph.pl and speedscope read as is. The file name and a line in
+    actions.log give the action's wall time. Actions started while another
+    is being captured (a refresh inside a tab switch) count toward the
+    outer one.
+    """
+
+    def __init__(self, setting=None):
+        """Initialize the profiler from the CAFE_PROFILE setting: off when unset or '0'"""
+        self.enabled = bool(setting) and setting != '0'
+        self.output_dir = setting if setting and setting not in ('0', '1') else DEFAULT_PROFILE_DIR
+        self._lock = threading.Lock()
+        self._active = False
+
+    def toggle(self):
+        """Turn profiling on or off, returning whether it is now on"""
+        self.enabled = not self.enabled
+        return self.enabled
+
+    def action(self, name):
+        """Get a context manager that profiles the code under it as one action"""
+        return _Capture(self, name)
+
+    def _write(self, name, started, wall_time, counts):
+        """Write an action's collapsed stacks and log its wall time"""
+        wall_ms = wall_time * 1000
+        filename = f"{started:%Y%m%d-%H%M%S}-{started.microsecond // 1000:03d}-{name}-{wall_ms:.0f}ms.folded"
+
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(os.path.join(self.output_dir, filename), 'w') as f:
+                for stack, count in counts.most_common():
+                    f.write(';'.join((name,) + stack) + f" {count}\n")
+
+            with open(os.path.join(self.output_dir, PROFILE_LOG), 'a') as f:
+                f.write(f"{started:%Y-%m-%d %H:%M:%S}\t{name}\t{wall_ms:.1f} ms\t"
+                        f"{sum(counts.values())} samples\t{filename}\n")
+        except OSError as e:
+            # A profile that can't be saved must not get in the way of the till
+            print(f"Could not save profile for {name}: {e}", file=sys.stderr)
+
+
+class _Capture:
+    """One profiled run of an action"""
+
+    def __init__(self, profiler, name, skip_frames=0):
+        """Initialize the capture; skip_frames drops wrapper frames from the stacks"""
+        self.profiler = profiler
+        self.name = name
+        self.skip_frames = skip_frames
+        self.sampling = False
+
+    def __enter__(self):
+        with self.profiler._lock:
+            if not self.profiler.enabled or self.profiler._active:
+                return self
+            self.profiler._active = True
+        self.sampling = True
+
+        # Stacks are kept from the frame running the action down
+        caller = sys._getframe(1)
+        self.root_depth = len(stack_labels(caller)) - 1 + self.skip_frames
+        self.counts = Counter()
+        self.stop = threading.Event()
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(SAMPLE_INTERVAL)
+
+        self.started = datetime.now()
+        self.start_time = time.perf_counter()
+        self.sampler = threading.Thread(target=self.sample, args=(threading.get_ident(),), daemon=True)
+        self.sampler.start()
+        return self
+
+    def sample(self, thread_id):
+        """Count the acting thread's stack every SAMPLE_INTERVAL until stopped"""
+        while not self.stop.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(thread_id)
+            stack = tuple(stack_labels(frame)[self.root_depth:]) if frame is not None else ()
+            if stack:
+                self.counts[stack] += 1
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self.sampling:
+            return False
+
+        wall_time = time.perf_counter() - self.start_time
+        self.stop.set()
+        self.sampler.join()
+        sys.setswitchinterval(self.switch_interval)
+
+        self.profiler._write(self.name, self.started, wall_time, self.counts)
+        with self.profiler._lock:
+            self.profiler._active = False
+        return False
+
+
+# Shared by every frame of the app
+profiler = ActionProfiler(os.environ.get(PROFILE_ENV))
+
+
+def profiled(name=None):
+    """Decorate a method so each call is profiled as an action, named after it by default"""
+    def decorate(function):
+        action_name = name or function.__qualname__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+            with _Capture(profiler, action_name, skip_frames=1):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
@@ -5,6 +5,12 @@ from datetime import datetime, date
 import time
 import pandas as pd
 
+from basket_analysis import BasketAnalyzer
+from day_totals import DayAccumulator
+from profiling import profiled, profiler
+from records import item_key
+from utils import format_currency
+
 class QuickSaleFrame(ctk.CTkFrame):
     def __init__(self, parent, data_manager, colors):
         super().__init__(parent, fg_color=colors["background"])
@@ -26,7 +32,28 @@ class QuickSaleFrame(ctk.CTkFrame):
             font=("Roboto", 24, "bold"),
             text_color=self.colors["primary"]
         )
-        self.header.grid(row=0, column=0, columnspan=2, padx=20, pady=(20, 10), sticky="w")
+        self.header.grid(row=0, column=0, padx=20, pady=(20, 10), sticky="w")
+        
+        # Today's running totals, kept up to date from sale events
+        self.day_totals = DayAccumulator(data_manager)
+        self.day_panel = ctk.CTkFrame(self, fg_color="#E3F2FD", corner_radius=8)
+        self.day_panel.grid(row=0, column=1, padx=20, pady=(20, 10), sticky="e")
+        
+        self.day_totals_label = ctk.CTkLabel(
+            self.day_panel,
+            text="",
+            font=("Roboto", 14, "bold"),
+            text_color=self.colors["primary"]
+        )
+        self.day_totals_label.grid(row=0, column=0, padx=10, pady=(5, 0), sticky="w")
+        
+        self.day_top_label = ctk.CTkLabel(
+            self.day_panel,
+            text="",
+            font=("Roboto", 12),
+            text_color=self.colors["primary"]
+        )
+        self.day_top_label.grid(row=1, column=0, padx=10, pady=(0, 5), sticky="w")
         
         # Menu items section (left side)
         self.menu_frame = ctk.CTkFrame(self, fg_color=self.colors["background"])
@@ -125,17 +152,22 @@ class QuickSaleFrame(ctk.CTkFrame):
         self.cart_items_frame.grid(row=1, column=0, padx=10, pady=10, sticky="nsew")
         self.cart_items_frame.grid_columnconfigure(0, weight=1)
         
+        # Items often bought with what's in the cart
+        self.basket_analyzer = BasketAnalyzer(data_manager)
+        self.suggestions_frame = ctk.CTkFrame(self.cart_frame, fg_color="transparent")
+        self.suggestions_frame.grid(row=2, column=0, padx=10, pady=(0, 5), sticky="ew")
+        
         # Cart total and actions
         self.cart_actions_frame = ctk.CTkFrame(
             self.cart_frame,
             fg_color="#E3F2FD",
             corner_radius=8
         )
-        self.cart_actions_frame.grid(row=2, column=0, padx=10, pady=10, sticky="ew")
+        self.cart_actions_frame.grid(row=3, column=0, padx=10, pady=10, sticky="ew")
         self.cart_actions_frame.grid_columnconfigure((0, 1), weight=1)
         
         # Total amount
-        self.total_amount = 0.0
+        self.total_amount = 0
         self.total_label = ctk.CTkLabel(
             self.cart_actions_frame,
             text="Total: ₹0.00",
@@ -177,20 +209,37 @@ class QuickSaleFrame(ctk.CTkFrame):
         self.menu_items = []
         self.shortcut_map = {}
         self.menu_buttons = []
+        self.menu_buttons_by_id = {}
+        self.stock_levels = {}
+        
+        # Track which data versions are on screen
+        self.data_versions = {}
+        self.pending_events = []
+        self.data_manager.subscribe(self.on_data_changed)
         
         # Load menu items and categories
         self.refresh_data()
+        self.update_day_panel()
         
+    @profiled()
     def refresh_data(self):
         """Refresh menu items data and update display"""
+        # Remember the data versions this display reflects
+        self.data_versions = self.data_manager.get_versions()
+        self.pending_events = []
+        
         # Clear existing items
         for widget in self.items_frame.winfo_children():
             widget.destroy()
         
         self.menu_buttons = []
         
-        # Get updated menu items
+        # Get updated menu items and stock levels
         self.menu_items = self.data_manager.get_menu_items()
+        self.stock_levels = {
+            item_key(item): item.get('quantity', 0)
+            for item in self.data_manager.get_inventory()
+        }
         
         # Map shortcuts
         self.shortcut_map = {}
@@ -217,6 +266,60 @@ class QuickSaleFrame(ctk.CTkFrame):
         # Update cart display
         self.update_cart_display()
     
+    def on_data_changed(self, event):
+        """Queue change events that affect this frame"""
+        if event['store'] in ('menu', 'inventory'):
+            self.pending_events.append(event)
+            
+            # Patch straight away if the frame is on screen
+            if self.winfo_ismapped():
+                self.after_idle(self.sync_data)
+        elif event['store'] == 'sales' and self.winfo_ismapped():
+            self.after_idle(self.update_day_panel)
+    
+    def update_day_panel(self):
+        """Show today's running totals, read from memory"""
+        totals = self.day_totals.totals()
+        self.day_totals_label.configure(
+            text=f"Today: {format_currency(totals['total_revenue'])}  |  "
+                 f"{totals['total_transactions']} sales  |  Avg {format_currency(totals['average_basket'])}"
+        )
+        
+        top_items = ", ".join(f"{item['name']} x{item['quantity']}" for item in totals['top_items'])
+        self.day_top_label.configure(text=f"Top: {top_items or 'No sales yet'}")
+    
+    def sync_data(self):
+        """Bring the display up to date, patching only what changed"""
+        self.update_day_panel()
+        
+        versions = self.data_manager.get_versions()
+        if versions['menu'] == self.data_versions.get('menu') and \
+                versions['inventory'] == self.data_versions.get('inventory'):
+            return
+        
+        events = self.pending_events
+        self.pending_events = []
+        
+        # Menu changes or missed inventory events need a full reload
+        missed = versions['inventory'] - self.data_versions.get('inventory', 0) - len(events)
+        if versions['menu'] != self.data_versions.get('menu') or missed:
+            self.refresh_data()
+            return
+        
+        for event in events:
+            self.update_item_stock(event['item'])
+        
+        self.data_versions = versions
+    
+    def update_item_stock(self, inventory_item):
+        """Update the stock status of a single menu button"""
+        key = item_key(inventory_item)
+        self.stock_levels[key] = inventory_item.get('quantity', 0)
+        
+        button = self.menu_buttons_by_id.get(key)
+        if button and button.winfo_exists():
+            self.show_stock(button, button.item, self.stock_levels[key])
+    
     def bind_shortcuts(self):
         """Bind keyboard shortcuts for quick item addition"""
         # Unbind any existing shortcuts
@@ -246,7 +349,7 @@ class QuickSaleFrame(ctk.CTkFrame):
             if search_text and not (
                 search_text in item.get('name', '').lower() or 
                 search_text in item.get('category', '').lower() or
-                search_text in str(item.get('price', '')).lower()
+                search_text in format_currency(item.get('price', 0))
             ):
                 continue
                 
@@ -260,6 +363,8 @@ class QuickSaleFrame(ctk.CTkFrame):
         for widget in self.items_frame.winfo_children():
             widget.destroy()
         
+        self.menu_buttons_by_id = {}
+        
         # No items message
         if not items_to_display:
             no_items_label = ctk.CTkLabel(
@@ -301,6 +406,7 @@ class QuickSaleFrame(ctk.CTkFrame):
                 button = self.create_menu_button(item)
                 button.grid(row=row_counter, column=col_counter, padx=5, pady=5, sticky="nsew")
                 self.menu_buttons.append(button)
+                self.menu_buttons_by_id[item.get('id')] = button
                 
                 col_counter += 1
                 if col_counter >= 3:  # Start a new row after 3 items
@@ -313,19 +419,8 @@ class QuickSaleFrame(ctk.CTkFrame):
     
     def create_menu_button(self, item):
         """Create a button for a menu item"""
-        # Get inventory status
-        inventory = self.data_manager.get_inventory()
-        stock_quantity = 0
-        for inv_item in inventory:
-            if inv_item.get('name') == item.get('name'):
-                stock_quantity = inv_item.get('quantity', 0)
-                break
-        
-        # Status indicator
-        stock_color = "#00B894" if stock_quantity > 5 else "#FF9800" if stock_quantity > 0 else "#FF5252"
-        
         # Format button text
-        button_text = f"{item.get('name', 'Unnamed')}\n₹{item.get('price', '0.00')}"
+        button_text = f"{item.get('name', 'Unnamed')}\n{format_currency(item.get('price', 0))}"
         shortcut = item.get('shortcut', '')
         if shortcut:
             button_text += f"\n[{shortcut}]"
@@ -335,17 +430,28 @@ class QuickSaleFrame(ctk.CTkFrame):
             self.items_frame,
             text=button_text,
             font=("Roboto", 12),
+            height=80,
+            width=150
+        )
+        button.item = item
+        
+        self.show_stock(button, item, self.stock_levels.get(item.get('id'), 0))
+        
+        return button
+    
+    def show_stock(self, button, item, stock_quantity):
+        """Style a menu button for the given stock quantity"""
+        # Status indicator
+        stock_color = "#00B894" if stock_quantity > 5 else "#FF9800" if stock_quantity > 0 else "#FF5252"
+        
+        button.configure(
             fg_color=self.colors["primary"] if stock_quantity > 0 else "#777777",
             hover_color=self.colors["secondary"] if stock_quantity > 0 else "#555555",
-            height=80,
-            width=150,
             command=lambda i=item: self.add_to_cart(i) if stock_quantity > 0 else self.show_out_of_stock()
         )
         
         # Add a border to indicate stock status
         button.configure(border_width=2, border_color=stock_color)
-        
-        return button
     
     def show_out_of_stock(self):
         """Show out of stock message"""
@@ -390,9 +496,10 @@ class QuickSaleFrame(ctk.CTkFrame):
             no_items_label.grid(row=0, column=0, padx=20, pady=20)
             
             # Update total
-            self.total_amount = 0.0
-            self.total_label.configure(text=f"Total: ₹{self.total_amount:.2f}")
+            self.total_amount = 0
+            self.total_label.configure(text=f"Total: {format_currency(self.total_amount)}")
             
+            self.update_suggestions()
             return
         
         # Cart headers
@@ -429,7 +536,7 @@ class QuickSaleFrame(ctk.CTkFrame):
         total_header.grid(row=0, column=3, padx=5, sticky="w")
         
         # Display cart items
-        self.total_amount = 0.0
+        self.total_amount = 0
         for i, item in enumerate(self.cart):
             item_frame = self.create_cart_item_frame(item, i)
             item_frame.grid(row=i+1, column=0, padx=10, pady=5, sticky="ew")
@@ -438,7 +545,47 @@ class QuickSaleFrame(ctk.CTkFrame):
             self.total_amount += item['price'] * item['quantity']
         
         # Update total display
-        self.total_label.configure(text=f"Total: ₹{self.total_amount:.2f}")
+        self.total_label.configure(text=f"Total: {format_currency(self.total_amount)}")
+        
+        self.update_suggestions()
+    
+    def update_suggestions(self):
+        """Show in-stock items frequently added together with the cart's items"""
+        for widget in self.suggestions_frame.winfo_children():
+            widget.destroy()
+        
+        menu_by_id = {item.get('id'): item for item in self.menu_items}
+        suggestions = [
+            menu_by_id[item_id]
+            for item_id in self.basket_analyzer.suggest([item['id'] for item in self.cart])
+            if item_id in menu_by_id and self.stock_levels.get(item_id, 0) > 0
+        ]
+        
+        if not suggestions:
+            self.suggestions_frame.grid_remove()
+            return
+        
+        suggestions_label = ctk.CTkLabel(
+            self.suggestions_frame,
+            text="Frequently added together:",
+            font=("Roboto", 12, "bold"),
+            text_color=self.colors["primary"]
+        )
+        suggestions_label.grid(row=0, column=0, padx=5, pady=5, sticky="w")
+        
+        for i, item in enumerate(suggestions):
+            suggestion_button = ctk.CTkButton(
+                self.suggestions_frame,
+                text=f"+ {item.get('name')}",
+                font=("Roboto", 12),
+                width=0,
+                fg_color=self.colors["secondary"],
+                hover_color=self.colors["accent"],
+                command=lambda i=item: self.add_to_cart(i)
+            )
+            suggestion_button.grid(row=0, column=i+1, padx=5, pady=5)
+        
+        self.suggestions_frame.grid()
     
     def create_cart_item_frame(self, item, index):
         """Create a frame for a cart item"""
@@ -463,7 +610,7 @@ class QuickSaleFrame(ctk.CTkFrame):
         # Item price
         price_label = ctk.CTkLabel(
             frame,
-            text=f"₹{item.get('price', 0):.2f}",
+            text=format_currency(item.get('price', 0)),
             font=("Roboto", 12),
             text_color=self.colors["primary"]
         )
@@ -513,7 +660,7 @@ class QuickSaleFrame(ctk.CTkFrame):
         total = item.get('price', 0) * item.get('quantity', 1)
         total_label = ctk.CTkLabel(
             frame,
-            text=f"₹{total:.2f}",
+            text=format_currency(total),
             font=("Roboto", 12, "bold"),
             text_color=self.colors["primary"]
         )
@@ -579,27 +726,30 @@ class QuickSaleFrame(ctk.CTkFrame):
             messagebox.showinfo("Empty Cart", "Your cart is empty. Add items to complete a sale.")
             return
         
-        # Format sale data
+        # Format sale data; the data manager dates it to the open business day
         sale_data = {
             'items': [],
-            'total_amount': self.total_amount,
-            'date': date.today().strftime('%Y-%m-%d')
+            'total_amount': self.total_amount
         }
         
         # Add items
         for item in self.cart:
             sale_data['items'].append({
+                'item_id': item['id'],
                 'name': item['name'],
                 'price': item['price'],
                 'quantity': item['quantity']
             })
         
-        # Add the sale
-        success, message = self.data_manager.add_sale(sale_data)
+        # Add the sale; the profile stops before the confirmation waits on the cashier
+        with profiler.action("QuickSaleFrame.complete_sale"):
+            success, message = self.data_manager.add_sale(sale_data)
+            
+            if success:
+                self.cart = []
+                self.update_cart_display()
         
         if success:
-            messagebox.showinfo("Sale Complete", f"Sale completed successfully.\nTotal: ₹{self.total_amount:.2f}")
-            self.cart = []
-            self.update_cart_display()
+            messagebox.showinfo("Sale Complete", f"Sale completed successfully.\nTotal: {format_currency(sale_data['total_amount'])}")
         else:
             messagebox.showerror("Error", f"Failed to complete sale: {message}")
\ No newline at end of file
@@ -0,0 +1,269 @@
+import sys
+from collections.abc import MutableMapping
+
+
+def to_paise(amount):
+    """Convert a rupee amount to integer paise"""
+    return int(round(amount * 100))
+
+
+def from_paise(paise):
+    """Convert integer paise back to rupees, as an int for whole rupees"""
+    return paise // 100 if paise % 100 == 0 else paise / 100
+
+
+def is_amount(value):
+    """Check whether a value is a number that can be an amount of money"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+# Money keys of sales summaries and Z-reports, which are plain dicts
+REPORT_PAISE_FIELDS = frozenset(['total_revenue', 'revenue'])
+
+
+def convert_report_amounts(value, convert, money=False):
+    """Copy a summary or report with convert applied to each money value, however deeply nested
+
+    Reports hold paise like records do and go over the wire in rupees like
+    them, converted with from_paise() on the way out and to_paise() on the
+    way in.
+    """
+    if isinstance(value, dict):
+        return {key: convert_report_amounts(item, convert, key in REPORT_PAISE_FIELDS) for key, item in value.items()}
+    if isinstance(value, list):
+        return [convert_report_amounts(item, convert, money) for item in value]
+    return convert(value) if money and is_amount(value) else value
+
+
+def slot_names(fields):
+    """Get slot names for record keys; prefixed so keys like 'items' don't hide methods"""
+    return tuple('_' + field for field in fields)
+
+
+class Record(MutableMapping):
+    """Compact record that reads and writes like a dict
+
+    Known keys are kept in slots instead of a per-record dict and repeated
+    strings are interned. Money keys are integer paise; the data files keep
+    rupees, so from_json() and to_json() convert at that boundary. Any other
+    key goes to a small overflow dict, so records round-trip unchanged.
+    """
+    __slots__ = ('_extra',)
+
+    FIELDS = ()  # Keys held in slots, in output order
+    PAISE_FIELDS = frozenset()  # Money keys: integer paise here, rupees in JSON
+    INTERNED_FIELDS = frozenset()  # String keys with few distinct values
+    SLOTS = {}  # Slot name for each key in FIELDS
+
+    def __init__(self, data=(), **kwargs):
+        self._extra = None
+        pairs = data.items() if isinstance(data, (dict, MutableMapping)) else data
+        for key, value in pairs:
+            self[key] = value
+        for key, value in kwargs.items():
+            self[key] = value
+
+    @classmethod
+    def from_json(cls, data):
+        """Build a record from its JSON form, with amounts in rupees"""
+        record = cls()
+        for key, value in data.items():
+            if key in cls.PAISE_FIELDS and is_amount(value):
+                value = to_paise(value)
+            record[key] = value
+        return record
+
+    def __getitem__(self, key):
+        slot = self.SLOTS.get(key)
+        if slot is not None:
+            try:
+                return getattr(self, slot)
+            except AttributeError:
+                pass
+
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        slot = self.SLOTS.get(key)
+        if slot is not None:
+            if key in self.PAISE_FIELDS:
+                if is_amount(value):
+                    self._drop_extra(key)
+                    setattr(self, slot, int(round(value)))
+                    return
+            else:
+                if key in self.INTERNED_FIELDS and type(value) is str:
+                    value = sys.intern(value)
+                self._drop_extra(key)
+                setattr(self, slot, value)
+                return
+
+            # A money key holding something other than a number stays as given
+            if hasattr(self, slot):
+                delattr(self, slot)
+
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def __delitem__(self, key):
+        slot = self.SLOTS.get(key)
+        if slot is not None and hasattr(self, slot):
+            delattr(self, slot)
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for key, slot in self.SLOTS.items():
+            if hasattr(self, slot):
+                yield key
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        count = sum(1 for slot in self.SLOTS.values() if hasattr(self, slot))
+        return count + (len(self._extra) if self._extra is not None else 0)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self)!r})"
+
+    def _drop_extra(self, key):
+        """Remove a key from the overflow dict once it fits a slot again"""
+        if self._extra is not None:
+            self._extra.pop(key, None)
+
+    def copy(self):
+        """Get a shallow copy, like dict.copy()"""
+        return type(self)(self)
+
+    def to_json(self):
+        """Convert to the JSON form: plain dicts and lists, amounts in rupees"""
+        data = {}
+        for key, slot in self.SLOTS.items():
+            try:
+                value = getattr(self, slot)
+            except AttributeError:
+                continue
+            if key in self.PAISE_FIELDS:
+                value = from_paise(value)  # Slots only hold numbers for money keys
+            elif type(value) is list:
+                value = [element.to_json() if isinstance(element, Record) else element for element in value]
+            data[key] = value
+
+        if self._extra is not None:
+            for key, value in self._extra.items():
+                if isinstance(value, list):
+                    value = [element.to_json() if isinstance(element, Record) else element for element in value]
+                data[key] = value
+        return data
+
+
+def json_default(value):
+    """Serialize records for json.dumps(..., default=json_default)"""
+    if isinstance(value, Record):
+        return value.to_json()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class LineItem(Record):
+    FIELDS = ('item_id', 'name', 'price', 'quantity')
+    PAISE_FIELDS = frozenset(['price'])
+    INTERNED_FIELDS = frozenset(['name'])
+
+    __slots__ = slot_names(FIELDS)
+    SLOTS = dict(zip(FIELDS, __slots__))
+
+
+class Sale(Record):
+    FIELDS = ('id', 'items', 'total_amount', 'payment_method', 'date', 'timestamp')
+    PAISE_FIELDS = frozenset(['total_amount'])
+    INTERNED_FIELDS = frozenset(['payment_method', 'date'])
+
+    __slots__ = slot_names(FIELDS)
+    SLOTS = dict(zip(FIELDS, __slots__))
+
+    @classmethod
+    def from_json(cls, data):
+        """Build a sale and its line items from their JSON form"""
+        items = data.get('items')
+        if isinstance(items, list):
+            data = dict(data, items=[LineItem.from_json(item) if type(item) is dict else item for item in items])
+        return super().from_json(data)
+
+    def __setitem__(self, key, value):
+        if key == 'items' and isinstance(value, list):
+            value = [LineItem(item) if type(item) is dict else item for item in value]
+        super().__setitem__(key, value)
+
+
+class MenuItem(Record):
+    FIELDS = ('id', 'name', 'category', 'price', 'shortcut', 'description', 'version',
+              'created_at', 'updated_at')
+    PAISE_FIELDS = frozenset(['price'])
+    INTERNED_FIELDS = frozenset(['name', 'category'])
+
+    __slots__ = slot_names(FIELDS)
+    SLOTS = dict(zip(FIELDS, __slots__))
+
+
+class InventoryItem(Record):
+    FIELDS = ('item_id', 'name', 'quantity', 'last_updated', 'version')
+    INTERNED_FIELDS = frozenset(['name'])
+
+    __slots__ = slot_names(FIELDS)
+    SLOTS = dict(zip(FIELDS, __slots__))
+
+
+def item_key(record):
+    """Get the key joining a sale line or stock row to its menu item
+
+    That is the menu item id; lines and rows for things that were never on
+    the menu fall back to their name.
+    """
+    item_id = record.get('item_id')
+    return item_id if item_id is not None else record.get('name')
+
+
+def sale_from_json(data):
+    """json object_hook building Sale and LineItem records while a sales file is parsed
+
+    Records with exactly the usual keys skip the generic per-key path.
+    """
+    if 'items' not in data:
+        keys = data.keys()
+        if keys == LINE_ITEM_KEYS or keys == UNKEYED_LINE_ITEM_KEYS:
+            price = data['price']
+            if type(price) in (int, float):
+                item = LineItem.__new__(LineItem)
+                item._extra = None
+                if 'item_id' in data:
+                    item._item_id = data['item_id']
+                item._name = sys.intern(data['name']) if type(data['name']) is str else data['name']
+                item._price = int(round(price * 100))
+                item._quantity = data['quantity']
+                return item
+        return LineItem.from_json(data)
+
+    if data.keys() == SALE_KEYS:
+        total_amount = data['total_amount']
+        if type(total_amount) in (int, float) and type(data['items']) is list:
+            sale = Sale.__new__(Sale)
+            sale._extra = None
+            sale._id = data['id']
+            sale._items = data['items']
+            sale._total_amount = int(round(total_amount * 100))
+            sale._payment_method = sys.intern(data['payment_method']) if type(data['payment_method']) is str \
+                else data['payment_method']
+            sale._date = sys.intern(data['date']) if type(data['date']) is str else data['date']
+            sale._timestamp = data['timestamp']
+            return sale
+    return Sale.from_json(data)
+
+
+LINE_ITEM_KEYS = frozenset(LineItem.FIELDS)
+UNKEYED_LINE_ITEM_KEYS = LINE_ITEM_KEYS - {'item_id'}  # Lines written before items were keyed by id
+SALE_KEYS = frozenset(Sale.FIELDS)
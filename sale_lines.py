@@ -0,0 +1,137 @@
+import os
+import struct
+
+import numpy as np
+
+# One row per line item of a sale. epoch_seconds is the sale's local time
+# counted as if it were UTC, so .view('datetime64[s]') gives the wall-clock
+# time and hour. business_day is the sale's business date in days since
+# 1970-01-01 (.astype('datetime64[D]')), which daily, weekly and monthly
+# totals group by as the sales summaries do; a sale made after Close Day
+# belongs to the next business day whatever the clock says. item_id is -1
+# for items not on the menu. business_day fills what would be padding
+# after qty, so rows stay 40 bytes.
+LINE_DTYPE = np.dtype([
+    ('sale_id', '<i8'),
+    ('epoch_seconds', '<i8'),
+    ('item_id', '<i8'),
+    ('qty', '<i4'),
+    ('business_day', '<i4'),
+    ('unit_paise', '<i8'),
+], align=True)
+
+# business_day of a sale with no date that parses
+NO_BUSINESS_DAY = np.iinfo(np.int32).min
+
+# File header: magic, rows in use, end of the sales they came from in the
+# sales file, and the ID of the last of those sales
+HEADER = struct.Struct('<8sqqq')
+MAGIC = b'CAFELN02'
+
+
+def explode_sales(sales):
+    """Turn sales into an array of their line items, one LINE_DTYPE row each"""
+    sale_ids, timestamps, days, item_ids, quantities, prices = [], [], [], [], [], []
+    for sale in sales:
+        timestamp = sale.get('timestamp') or sale.get('date') or 'NaT'
+        day = sale.get('date') or timestamp[:10]
+        for item in sale.get('items') or []:
+            sale_ids.append(sale.get('id', 0))
+            timestamps.append(timestamp)
+            days.append(day)
+            item_id = item.get('item_id')
+            item_ids.append(-1 if item_id is None else item_id)
+            quantities.append(item.get('quantity', 0))
+            prices.append(item.get('price', 0))
+
+    lines = np.zeros(len(sale_ids), dtype=LINE_DTYPE)
+    lines['sale_id'] = sale_ids
+    lines['epoch_seconds'] = parse_timestamps(timestamps).astype(np.int64)
+    business_days = parse_timestamps(days).astype('datetime64[D]')
+    lines['business_day'] = np.where(np.isnat(business_days), NO_BUSINESS_DAY, business_days.astype(np.int64))
+    lines['item_id'] = item_ids
+    lines['qty'] = np.round(np.array(quantities, dtype=np.float64))
+    lines['unit_paise'] = np.round(np.array(prices, dtype=np.float64))
+    return lines
+
+
+def parse_timestamps(timestamps):
+    """Parse 'YYYY-MM-DD HH:MM:SS' strings to datetime64[s], NaT for any that don't parse"""
+    try:
+        return np.array(timestamps, dtype='datetime64[s]')
+    except ValueError:
+        parsed = np.full(len(timestamps), np.datetime64('NaT'), dtype='datetime64[s]')
+        for i, timestamp in enumerate(timestamps):
+            try:
+                parsed[i] = np.datetime64(timestamp, 's')
+            except ValueError:
+                pass
+        return parsed
+
+
+class SaleLineStore:
+    """Line items of every sale as fixed-width rows in a file, read through np.memmap
+
+    The file is a header followed by LINE_DTYPE rows. Rows are written
+    before the header that counts them, so a crash mid-append leaves the
+    stored rows as they were. Readers map only the rows counted when they
+    opened the file; a reset replaces the file rather than truncating it,
+    so their maps stay valid.
+    """
+
+    def __init__(self, path):
+        """Initialize the store for a file, which is created on the first append"""
+        self.path = path
+
+    def read_header(self):
+        """Get (row count, sales offset, last sale ID), or None if there is no valid file"""
+        try:
+            with open(self.path, 'rb') as f:
+                header = f.read(HEADER.size)
+        except FileNotFoundError:
+            return None
+
+        if len(header) < HEADER.size:
+            return None
+        magic, count, sales_offset, last_sale_id = HEADER.unpack(header)
+        if magic != MAGIC or os.path.getsize(self.path) < HEADER.size + count * LINE_DTYPE.itemsize:
+            return None
+        return count, sales_offset, last_sale_id
+
+    def append(self, lines, sales_offset, last_sale_id):
+        """Add rows for the sales up to sales_offset in the sales file"""
+        header = self.read_header()
+        if header is None:
+            self.reset()
+        count = header[0] if header else 0
+
+        with open(self.path, 'rb+') as f:
+            f.seek(HEADER.size + count * LINE_DTYPE.itemsize)
+            f.write(np.ascontiguousarray(lines, dtype=LINE_DTYPE).tobytes())
+            f.truncate()
+
+            # No fsync: the store is an index rebuilt from the sales file on any mismatch
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, count + len(lines), sales_offset, last_sale_id))
+
+    def rebase(self, sales_offset, last_sale_id):
+        """Keep the rows but record a new end of their sales, after the sales file was rewritten"""
+        header = self.read_header()
+        if header is not None:
+            with open(self.path, 'rb+') as f:
+                f.write(HEADER.pack(MAGIC, header[0], sales_offset, last_sale_id))
+
+    def reset(self):
+        """Replace the file with one holding no rows"""
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, 0, 0, 0))
+        os.replace(temp_path, self.path)
+
+    def lines(self):
+        """Map the stored rows read-only, without loading them"""
+        header = self.read_header()
+        count = header[0] if header else 0
+        if not count:
+            return np.zeros(0, dtype=LINE_DTYPE)
+        return np.memmap(self.path, dtype=LINE_DTYPE, mode='r', offset=HEADER.size, shape=(count,))
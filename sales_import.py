@@ -0,0 +1,228 @@
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from data_manager import DataManager
+
+# Line item rows read, checked and appended per batch
+DEFAULT_CHUNK_ROWS = 20000
+
+# Column headings (lowercased) used by old POS exports and the fields they fill;
+# the 'Items Sold' sheet of our own sales export is accepted too
+SALES_IMPORT_COLUMNS = {
+    'receipt': 'receipt', 'receipt no': 'receipt', 'bill no': 'receipt', 'bill': 'receipt',
+    'order id': 'receipt', 'sale id': 'receipt', 'sale_id': 'receipt',
+    'timestamp': 'timestamp', 'date & time': 'timestamp', 'datetime': 'timestamp',
+    'date': 'date', 'time': 'time',
+    'name': 'name', 'item': 'name', 'item name': 'name',
+    'quantity': 'quantity', 'qty': 'quantity',
+    'price': 'price', 'rate': 'price', 'unit price': 'price', 'unit price (₹)': 'price',
+    'payment_method': 'payment_method', 'payment method': 'payment_method', 'payment': 'payment_method',
+    'total_amount': 'total_amount',
+}
+
+
+def read_csv_chunks(filepath, chunk_rows):
+    """Read a CSV of line items (one row per item sold) in chunks of rows"""
+    for chunk in pd.read_csv(filepath, dtype=str, chunksize=chunk_rows, skipinitialspace=True):
+        yield chunk.rename(columns=lambda column: SALES_IMPORT_COLUMNS.get(column.strip().lower(), column))
+
+
+def read_jsonl_chunks(filepath, chunk_rows):
+    """Read a JSONL file of sales in the sales file's own form, flattened to line item rows
+
+    Lines that are not a sale object become a row without items, so they
+    are rejected and counted like any other bad row.
+    """
+    rows = []
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                sale = json.loads(line)
+                items = sale['items'] if isinstance(sale, dict) and isinstance(sale.get('items'), list) else None
+            except json.JSONDecodeError:
+                sale, items = None, None
+
+            if not items or not all(isinstance(item, dict) for item in items):
+                rows.append({'receipt': line_number})
+            else:
+                for item in items:
+                    rows.append({
+                        'receipt': line_number,
+                        'timestamp': sale.get('timestamp') or sale.get('date'),
+                        'payment_method': sale.get('payment_method'),
+                        'total_amount': sale.get('total_amount'),
+                        'name': item.get('name'),
+                        'price': item.get('price'),
+                        'quantity': item.get('quantity', 1)
+                    })
+
+            if len(rows) >= chunk_rows:
+                yield pd.DataFrame(rows, dtype=object)
+                rows = []
+
+    if rows:
+        yield pd.DataFrame(rows, dtype=object)
+
+
+def keep_receipts_whole(chunks):
+    """Hold back each chunk's last receipt so a sale split across chunks is read whole"""
+    carry = None
+    for chunk in chunks:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+            carry = None
+        if 'receipt' in chunk.columns and len(chunk):
+            last = chunk['receipt'].iloc[-1]
+            tail = chunk['receipt'] == last
+            carry, chunk = chunk[tail], chunk[~tail]
+        yield chunk
+
+    if carry is not None:
+        yield carry
+
+
+def normalize_chunk(df, dayfirst=False):
+    """Turn a chunk of line item rows into sales with amounts in paise
+
+    Rows are checked column by column; a sale with any bad row is
+    rejected whole so imported totals never silently drop items. Returns
+    the sales and the number of rejected rows.
+    """
+    df = df.reset_index(drop=True)
+
+    def column(name, default=''):
+        if name not in df.columns:
+            return pd.Series(default, index=df.index)
+        return df[name].fillna('').astype(str).str.strip()
+
+    def number(name, default):
+        values = column(name, default).str.replace(r'[₹,\s]', '', regex=True)
+        return pd.to_numeric(values.mask(values == '', default), errors='coerce')
+
+    # Timestamps may come as one column or as separate date and time
+    if 'timestamp' in df.columns:
+        stamps = column('timestamp')
+    else:
+        stamps = (column('date') + ' ' + column('time')).str.strip()
+    parsed = pd.to_datetime(stamps, errors='coerce', dayfirst=dayfirst)
+
+    # Rows without a time of day keep a date-only timestamp, which stays out of the hourly heatmap
+    has_time = stamps.str.contains(':')
+    timestamps = np.where(has_time, parsed.dt.strftime('%Y-%m-%d %H:%M:%S'), parsed.dt.strftime('%Y-%m-%d'))
+
+    names = column('name')
+    prices = number('price', '')
+    quantities = number('quantity', '1')
+    totals = number('total_amount', '')
+    payments = column('payment_method', 'Cash').mask(lambda values: values == '', 'Cash')
+
+    valid = (names != '') & (prices >= 0) & (quantities > 0) & (quantities == quantities.round()) & parsed.notna()
+
+    # Receipts tie rows into sales; without them every row is a sale
+    if 'receipt' in df.columns:
+        receipts = pd.factorize(df['receipt'].astype(str))[0]
+    else:
+        receipts = np.arange(len(df))
+    valid = valid.groupby(receipts).transform('all').to_numpy()
+
+    order = np.argsort(receipts, kind='stable')
+    order = order[valid[order]]
+    if not len(order):
+        return [], len(df)
+
+    names = names.to_numpy()[order].tolist()
+    prices = (prices.to_numpy()[order] * 100).round().astype(np.int64).tolist()
+    quantities = quantities.to_numpy()[order].astype(np.int64).tolist()
+    timestamps = timestamps[order].tolist()
+    payments = payments.to_numpy()[order].tolist()
+    totals = totals.to_numpy()[order]
+    receipts = receipts[order]
+
+    # Each run of equal receipt numbers is one sale
+    starts = np.flatnonzero(np.r_[True, receipts[1:] != receipts[:-1]]).tolist()
+    ends = starts[1:] + [len(order)]
+
+    sales = []
+    for start, end in zip(starts, ends):
+        items = [{'name': names[i], 'price': prices[i], 'quantity': quantities[i]} for i in range(start, end)]
+        total = totals[start]
+        sales.append({
+            'items': items,
+            'total_amount': int(round(total * 100)) if total == total else
+            sum(item['price'] * item['quantity'] for item in items),
+            'payment_method': payments[start],
+            'timestamp': timestamps[start],
+            'date': timestamps[start][:10]
+        })
+
+    return sales, len(df) - len(order)
+
+
+def import_sales(data_manager, filepath, chunk_rows=DEFAULT_CHUNK_ROWS, update_inventory=True, dayfirst=False):
+    """Stream sales from a CSV or JSONL file into the sales store
+
+    Each chunk is one append; the sales counters and the inventory snapshot
+    are brought up to date once at the end. Returns the import statistics.
+    """
+    if filepath.lower().endswith(('.jsonl', '.json')):
+        chunks = read_jsonl_chunks(filepath, chunk_rows)
+    else:
+        chunks = read_csv_chunks(filepath, chunk_rows)
+
+    stats = {'rows': 0, 'sales': 0, 'rejected_rows': 0}
+    start = time.perf_counter()
+    for chunk in keep_receipts_whole(chunks):
+        if not len(chunk):
+            continue
+        sales, rejected = normalize_chunk(chunk, dayfirst)
+        if sales:
+            data_manager.add_sales(sales, imported=True, update_inventory=update_inventory)
+
+        stats['rows'] += len(chunk)
+        stats['sales'] += len(sales)
+        stats['rejected_rows'] += rejected
+        elapsed = time.perf_counter() - start
+        print(f"  {stats['rows']} rows, {stats['sales']} sales ({stats['rows'] / elapsed:.0f} rows/s)")
+
+    # Fold everything just imported into the running sales counters in one pass
+    data_manager.checkpoint_sales_rollup()
+    if update_inventory:
+        data_manager.checkpoint_inventory()
+
+    stats['elapsed_seconds'] = time.perf_counter() - start
+    stats['rows_per_second'] = stats['rows'] / stats['elapsed_seconds'] if stats['elapsed_seconds'] else 0.0
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import historical sales from an old POS")
+    parser.add_argument("file", help="CSV with one row per item sold, or JSONL with one sale per line")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Rows per append")
+    parser.add_argument("--skip-inventory", action="store_true", help="Don't take imported sales off stock")
+    parser.add_argument("--dayfirst", action="store_true", help="Read dates like 03/04/2024 as 3 April")
+    args = parser.parse_args()
+
+    print(f"Importing sales from {args.file}...")
+    try:
+        stats = import_sales(DataManager(args.data_dir), args.file, args.chunk_rows,
+                             update_inventory=not args.skip_inventory, dayfirst=args.dayfirst)
+    except (OSError, ValueError) as e:
+        print(f"Import failed: {str(e)}")
+        sys.exit(1)
+
+    print(f"  {stats['sales']} sales imported from {stats['rows']} rows, "
+          f"{stats['rejected_rows']} rows rejected")
+    print(f"  {stats['elapsed_seconds']:.2f}s ({stats['rows_per_second']:.0f} rows/s)")
+    sys.exit(1 if stats['rejected_rows'] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,9 +6,16 @@ import json
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import pandas as pd
+import numpy as np
 import calendar
 import os
 
+from chart_cache import ChartCache
+from basket_analysis import BasketAnalyzer
+from profiling import profiled, profiler
+from records import item_key
+from utils import format_currency
+
 class SalesTrackingFrame(ctk.CTkFrame):
     def __init__(self, parent, data_manager, colors):
         super().__init__(parent, fg_color=colors["background"])
@@ -32,7 +39,7 @@ class SalesTrackingFrame(ctk.CTkFrame):
         # Buttons frame
         self.button_frame = ctk.CTkFrame(self, fg_color="transparent")
         self.button_frame.grid(row=1, column=0, padx=20, pady=10, sticky="ew")
-        self.button_frame.grid_columnconfigure((0, 1, 2, 3), weight=1)
+        self.button_frame.grid_columnconfigure((0, 1, 2, 3, 4), weight=1)
         
         # New sale button
         self.new_sale_button = ctk.CTkButton(
@@ -52,7 +59,7 @@ class SalesTrackingFrame(ctk.CTkFrame):
             font=("Roboto", 12),
             fg_color=self.colors["secondary"],
             hover_color="#0771c0",
-            command=lambda: self.show_daily_report(date.today().strftime('%Y-%m-%d'))
+            command=lambda: self.show_daily_report(self.data_manager.business_date())
         )
         self.today_report_button.grid(row=0, column=1, padx=5, pady=10, sticky="ew")
         
@@ -78,6 +85,17 @@ class SalesTrackingFrame(ctk.CTkFrame):
         )
         self.export_button.grid(row=0, column=3, padx=5, pady=10, sticky="ew")
         
+        # Close day button
+        self.close_day_button = ctk.CTkButton(
+            self.button_frame,
+            text="Close Day (Z-Report)",
+            font=("Roboto", 12),
+            fg_color=self.colors["primary"],
+            hover_color="#1e2526",
+            command=self.close_day
+        )
+        self.close_day_button.grid(row=0, column=4, padx=5, pady=10, sticky="ew")
+        
         # Date selector frame
         self.date_frame = ctk.CTkFrame(self, fg_color="transparent")
         self.date_frame.grid(row=2, column=0, padx=20, pady=(0, 10), sticky="ew")
@@ -159,11 +177,18 @@ class SalesTrackingFrame(ctk.CTkFrame):
         self.setup_sales_history_tab()
         self.setup_reports_tab()
         
+        # Track which data versions are on screen
+        self.data_versions = {}
+        
         # Load initial data
         self.refresh_data()
         
+    @profiled()
     def refresh_data(self):
         """Refresh sales data and update display"""
+        # Remember the data versions this display reflects
+        self.data_versions = self.data_manager.get_versions()
+        
         # Update daily sales tab
         self.load_daily_sales()
         
@@ -173,6 +198,14 @@ class SalesTrackingFrame(ctk.CTkFrame):
         # Update reports tab (will be refreshed when tab is selected)
         self.generate_reports()
     
+    def sync_data(self):
+        """Refresh the display only if sales or the menu changed since it was drawn"""
+        versions = self.data_manager.get_versions()
+        # Item names shown come from the menu, so renames need a redraw too
+        if versions['sales'] != self.data_versions.get('sales') or \
+                versions['menu'] != self.data_versions.get('menu'):
+            self.refresh_data()
+    
     def setup_daily_sales_tab(self):
         """Set up the daily sales tab UI"""
         tab = self.content_frame.tab("Daily Sales")
@@ -182,7 +215,7 @@ class SalesTrackingFrame(ctk.CTkFrame):
         # Date display
         self.daily_date_label = ctk.CTkLabel(
             tab,
-            text=f"Sales for {date.today().strftime('%Y-%m-%d')}",
+            text=f"Sales for {self.data_manager.business_date()}",
             font=("Roboto", 16, "bold"),
             text_color=self.colors["primary"]
         )
@@ -236,14 +269,42 @@ class SalesTrackingFrame(ctk.CTkFrame):
         """Set up the sales history tab UI"""
         tab = self.content_frame.tab("Sales History")
         tab.grid_columnconfigure(0, weight=1)
-        tab.grid_rowconfigure(0, weight=1)
+        tab.grid_rowconfigure(1, weight=1)
+        
+        # History is shown one business day at a time, latest first
+        self.history_date = None
+        self.history_nav_frame = ctk.CTkFrame(tab, fg_color="transparent")
+        self.history_nav_frame.grid(row=0, column=0, padx=10, pady=(10, 0), sticky="ew")
+        self.history_nav_frame.grid_columnconfigure(1, weight=1)
+        
+        self.history_prev_button = ctk.CTkButton(
+            self.history_nav_frame,
+            text="< Previous Day",
+            font=("Roboto", 12),
+            fg_color=self.colors["secondary"],
+            hover_color="#0771c0",
+            width=120,
+            command=lambda: self.show_history_day(-1)
+        )
+        self.history_prev_button.grid(row=0, column=0, padx=5, pady=5, sticky="w")
+        
+        self.history_next_button = ctk.CTkButton(
+            self.history_nav_frame,
+            text="Next Day >",
+            font=("Roboto", 12),
+            fg_color=self.colors["secondary"],
+            hover_color="#0771c0",
+            width=120,
+            command=lambda: self.show_history_day(1)
+        )
+        self.history_next_button.grid(row=0, column=2, padx=5, pady=5, sticky="e")
         
         # Sales history scrollable frame
         self.sales_history_frame = ctk.CTkScrollableFrame(
             tab,
             fg_color=self.colors["background"]
         )
-        self.sales_history_frame.grid(row=0, column=0, padx=10, pady=10, sticky="nsew")
+        self.sales_history_frame.grid(row=1, column=0, padx=10, pady=10, sticky="nsew")
         self.sales_history_frame.grid_columnconfigure(0, weight=1)
     
     def setup_reports_tab(self):
@@ -271,7 +332,8 @@ class SalesTrackingFrame(ctk.CTkFrame):
         self.report_type_var = tk.StringVar(value="Daily Sales")
         self.report_type_menu = ctk.CTkComboBox(
             self.reports_options_frame,
-            values=["Daily Sales", "Weekly Sales", "Monthly Sales", "Item Performance"],
+            values=["Daily Sales", "Weekly Sales", "Monthly Sales", "Item Performance",
+                    "Hourly Revenue Heatmap", "Hourly Transactions Heatmap", "Item Combos"],
             variable=self.report_type_var,
             command=self.generate_reports
         )
@@ -288,11 +350,17 @@ class SalesTrackingFrame(ctk.CTkFrame):
         self.figure = plt.Figure(figsize=(6, 4), dpi=100, facecolor=self.colors["background"])
         self.canvas = FigureCanvasTkAgg(self.figure, self.chart_frame)
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        
+        # Each report keeps its own axes so switching between them is cheap
+        self.chart_cache = ChartCache(self.figure, self.canvas, self.colors)
+        
+        # Mines frequently combined items for the combos report
+        self.basket_analyzer = BasketAnalyzer(self.data_manager)
     
     def load_daily_sales(self, target_date=None):
-        """Load and display sales for a specific date"""
+        """Load and display sales for a specific date (by default the open business day)"""
         if not target_date:
-            target_date = date.today().strftime('%Y-%m-%d')
+            target_date = self.data_manager.business_date()
         
         # Update date label
         self.daily_date_label.configure(text=f"Sales for {target_date}")
@@ -330,17 +398,17 @@ class SalesTrackingFrame(ctk.CTkFrame):
         
         # Calculate and display summary
         summary = self.data_manager.get_daily_sales_summary(target_date)
-        self.total_sales_label.configure(text=f"Total Sales: ₹{summary['total_revenue']:.2f}")
+        self.total_sales_label.configure(text=f"Total Sales: {format_currency(summary['total_revenue'])}")
         
         total_items = sum(summary['items_sold'].values())
         self.total_items_label.configure(text=f"Total Items Sold: {total_items}")
         
         self.total_transactions_label.configure(text=f"Total Transactions: {summary['total_transactions']}")
     
-    def create_sale_display(self, sale, index):
-        """Create a display frame for a single sale"""
+    def create_sale_display(self, sale, index, parent=None):
+        """Create a display frame for a single sale, in the daily sales list unless another parent is given"""
         sale_frame = ctk.CTkFrame(
-            self.daily_sales_frame,
+            parent or self.daily_sales_frame,
             fg_color=self.colors["background"],
             border_width=1,
             border_color="#E0E0E0",
@@ -379,7 +447,7 @@ class SalesTrackingFrame(ctk.CTkFrame):
         
         total_label = ctk.CTkLabel(
             header_frame,
-            text=f"Total: ₹{sale.get('total_amount', 0):.2f}",
+            text=f"Total: {format_currency(sale.get('total_amount', 0))}",
             font=("Roboto", 14, "bold"),
             text_color=self.colors["accent"]
         )
@@ -455,7 +523,7 @@ class SalesTrackingFrame(ctk.CTkFrame):
             
             price_label = ctk.CTkLabel(
                 item_row,
-                text=f"₹{item_price:.2f}",
+                text=format_currency(item_price),
                 font=("Roboto", 12),
                 text_color=self.colors["primary"]
             )
@@ -463,16 +531,28 @@ class SalesTrackingFrame(ctk.CTkFrame):
         
         return sale_frame
     
+    def show_history_day(self, step):
+        """Move the sales history to the previous (-1) or next (1) business day with sales"""
+        dates = self.data_manager.get_sales_dates()
+        if not dates:
+            return
+        
+        position = dates.index(self.history_date) if self.history_date in dates else len(dates) - 1
+        self.history_date = dates[min(max(position + step, 0), len(dates) - 1)]
+        self.load_sales_history()
+    
     def load_sales_history(self):
-        """Load and display sales history"""
+        """Load and display the sales history of one business day (by default the latest with sales)"""
         # Clear existing history
         for widget in self.sales_history_frame.winfo_children():
             widget.destroy()
         
-        # Get all sales data
-        all_sales = self.data_manager.get_sales()
+        # Dates come from the sales counters; only the shown day's sales are read
+        dates = self.data_manager.get_sales_dates()
         
-        if not all_sales:
+        if not dates:
+            self.history_prev_button.configure(state="disabled")
+            self.history_next_button.configure(state="disabled")
             no_sales_label = ctk.CTkLabel(
                 self.sales_history_frame,
                 text="No sales history found",
@@ -482,122 +562,125 @@ class SalesTrackingFrame(ctk.CTkFrame):
             no_sales_label.grid(row=0, column=0, padx=10, pady=20)
             return
         
-        # Group sales by date
-        sales_by_date = {}
-        for sale in all_sales:
-            sale_date = sale.get('date')
-            if sale_date not in sales_by_date:
-                sales_by_date[sale_date] = []
-            sales_by_date[sale_date].append(sale)
+        if self.history_date not in dates:
+            self.history_date = dates[-1]
+        position = dates.index(self.history_date)
+        self.history_prev_button.configure(state="normal" if position > 0 else "disabled")
+        self.history_next_button.configure(state="normal" if position < len(dates) - 1 else "disabled")
         
-        # Sort dates (newest first)
-        sorted_dates = sorted(sales_by_date.keys(), reverse=True)
-        
-        # Display sales grouped by date
+        date_str = self.history_date
         row_counter = 0
-        for date_str in sorted_dates:
-            # Create date header
-            date_frame = ctk.CTkFrame(
-                self.sales_history_frame,
-                fg_color=self.colors["secondary"],
-                corner_radius=8
-            )
-            date_frame.grid(row=row_counter, column=0, padx=10, pady=(15, 5), sticky="ew")
-            date_frame.grid_columnconfigure(0, weight=1)
-            
-            date_label = ctk.CTkLabel(
-                date_frame,
-                text=date_str,
-                font=("Roboto", 16, "bold"),
-                text_color="white"
-            )
-            date_label.grid(row=0, column=0, padx=10, pady=5, sticky="w")
-            
-            # Add a button to show full day report
-            view_button = ctk.CTkButton(
-                date_frame,
-                text="View Full Day",
-                font=("Roboto", 12),
-                fg_color=self.colors["accent"],
-                hover_color="#00a583",
-                width=120,
-                command=lambda d=date_str: self.show_daily_report(d)
-            )
-            view_button.grid(row=0, column=1, padx=10, pady=5, sticky="e")
-            
-            row_counter += 1
-            
-            # Create summary for this date
-            daily_summary = self.data_manager.get_daily_sales_summary(date_str)
-            
-            summary_frame = ctk.CTkFrame(
-                self.sales_history_frame,
-                fg_color="#E3F2FD",
-                corner_radius=8
-            )
-            summary_frame.grid(row=row_counter, column=0, padx=10, pady=5, sticky="ew")
-            summary_frame.grid_columnconfigure((0, 1, 2), weight=1)
-            
-            # Revenue
-            revenue_label = ctk.CTkLabel(
-                summary_frame,
-                text=f"Revenue: ₹{daily_summary['total_revenue']:.2f}",
-                font=("Roboto", 14),
-                text_color=self.colors["primary"]
-            )
-            revenue_label.grid(row=0, column=0, padx=10, pady=10, sticky="w")
-            
-            # Transactions
-            trans_label = ctk.CTkLabel(
-                summary_frame,
-                text=f"Transactions: {daily_summary['total_transactions']}",
-                font=("Roboto", 14),
-                text_color=self.colors["primary"]
-            )
-            trans_label.grid(row=0, column=1, padx=10, pady=10, sticky="w")
-            
-            # Top item
-            top_item = "None"
-            top_qty = 0
-            for item, qty in daily_summary['items_sold'].items():
-                if qty > top_qty:
-                    top_item = item
-                    top_qty = qty
-            
-            top_item_label = ctk.CTkLabel(
-                summary_frame,
-                text=f"Top item: {top_item} ({top_qty})",
-                font=("Roboto", 14),
-                text_color=self.colors["primary"]
-            )
-            top_item_label.grid(row=0, column=2, padx=10, pady=10, sticky="w")
-            
+        
+        # Create date header
+        date_frame = ctk.CTkFrame(
+            self.sales_history_frame,
+            fg_color=self.colors["secondary"],
+            corner_radius=8
+        )
+        date_frame.grid(row=row_counter, column=0, padx=10, pady=(15, 5), sticky="ew")
+        date_frame.grid_columnconfigure(0, weight=1)
+        
+        date_label = ctk.CTkLabel(
+            date_frame,
+            text=date_str,
+            font=("Roboto", 16, "bold"),
+            text_color="white"
+        )
+        date_label.grid(row=0, column=0, padx=10, pady=5, sticky="w")
+        
+        # Add a button to show full day report
+        view_button = ctk.CTkButton(
+            date_frame,
+            text="View Full Day",
+            font=("Roboto", 12),
+            fg_color=self.colors["accent"],
+            hover_color="#00a583",
+            width=120,
+            command=lambda d=date_str: self.show_daily_report(d)
+        )
+        view_button.grid(row=0, column=1, padx=10, pady=5, sticky="e")
+        
+        row_counter += 1
+        
+        # Create summary for this date
+        daily_summary = self.data_manager.get_daily_sales_summary(date_str)
+        
+        summary_frame = ctk.CTkFrame(
+            self.sales_history_frame,
+            fg_color="#E3F2FD",
+            corner_radius=8
+        )
+        summary_frame.grid(row=row_counter, column=0, padx=10, pady=5, sticky="ew")
+        summary_frame.grid_columnconfigure((0, 1, 2), weight=1)
+        
+        # Revenue
+        revenue_label = ctk.CTkLabel(
+            summary_frame,
+            text=f"Revenue: {format_currency(daily_summary['total_revenue'])}",
+            font=("Roboto", 14),
+            text_color=self.colors["primary"]
+        )
+        revenue_label.grid(row=0, column=0, padx=10, pady=10, sticky="w")
+        
+        # Transactions
+        trans_label = ctk.CTkLabel(
+            summary_frame,
+            text=f"Transactions: {daily_summary['total_transactions']}",
+            font=("Roboto", 14),
+            text_color=self.colors["primary"]
+        )
+        trans_label.grid(row=0, column=1, padx=10, pady=10, sticky="w")
+        
+        # Top item
+        top_item = "None"
+        top_qty = 0
+        for item, qty in daily_summary['items_sold'].items():
+            if qty > top_qty:
+                top_item = item
+                top_qty = qty
+        
+        top_item_label = ctk.CTkLabel(
+            summary_frame,
+            text=f"Top item: {top_item} ({top_qty})",
+            font=("Roboto", 14),
+            text_color=self.colors["primary"]
+        )
+        top_item_label.grid(row=0, column=2, padx=10, pady=10, sticky="w")
+        
+        row_counter += 1
+        
+        # The day's sales, newest first
+        sales = list(self.data_manager.iter_sales(self.history_date, self.history_date))
+        for i, sale in enumerate(reversed(sales)):
+            sale_frame = self.create_sale_display(sale, i, self.sales_history_frame)
+            sale_frame.grid(row=row_counter, column=0, padx=10, pady=5, sticky="ew")
             row_counter += 1
     
+    @profiled()
     def generate_reports(self, *args):
         """Generate and display reports based on selected type"""
         report_type = self.report_type_var.get()
         
-        # Clear previous chart
-        self.figure.clear()
-        ax = self.figure.add_subplot(111)
-        
-        if report_type == "Daily Sales":
-            self.generate_daily_sales_report(ax)
-        elif report_type == "Weekly Sales":
-            self.generate_weekly_sales_report(ax)
-        elif report_type == "Monthly Sales":
-            self.generate_monthly_sales_report(ax)
-        elif report_type == "Item Performance":
-            self.generate_item_performance_report(ax)
-        
-        # Update canvas
-        self.canvas.draw()
+        report_data = {
+            "Daily Sales": self.daily_sales_report_data,
+            "Weekly Sales": self.weekly_sales_report_data,
+            "Monthly Sales": self.monthly_sales_report_data,
+            "Item Performance": self.item_performance_report_data,
+            "Hourly Revenue Heatmap": lambda: self.hourly_heatmap_report_data('revenue'),
+            "Hourly Transactions Heatmap": lambda: self.hourly_heatmap_report_data('transactions'),
+            "Item Combos": self.item_combos_report_data,
+        }
+        
+        # Reports cover periods ending with the open business day, so the day
+        # is part of the version; they show menu names, so the menu version is too
+        versions = self.data_manager.get_versions()
+        version = (versions['sales'], versions['menu'], self.data_manager.business_date())
+        self.chart_cache.show(report_type, version, report_data[report_type])
     
-    def generate_daily_sales_report(self, ax):
-        """Generate report showing daily sales for the past week"""
-        # Get last 7 days
-        end_date = date.today()
+    def daily_sales_report_data(self):
+        """Prepare report showing daily sales for the past week"""
+        # Get last 7 business days
+        end_date = date.fromisoformat(self.data_manager.business_date())
         start_date = end_date - timedelta(days=6)
         
         # Generate date range
@@ -616,86 +699,58 @@ class SalesTrackingFrame(ctk.CTkFrame):
         # Shorter date format for x labels
         x_labels = [d.split('-')[2] + '/' + d.split('-')[1] for d in date_range]
         
-        # Create bar chart
-        bars = ax.bar(x_labels, daily_sales, color=self.colors["secondary"])
-        
-        # Add data labels on top of each bar
-        for bar in bars:
-            height = bar.get_height()
-            ax.text(bar.get_x() + bar.get_width()/2., height + 5,
-                   f'₹{height:.0f}', ha='center', va='bottom')
-        
-        # Set chart title and labels
-        ax.set_title('Daily Sales (Last 7 Days)', color=self.colors["primary"])
-        ax.set_xlabel('Date', color=self.colors["primary"])
-        ax.set_ylabel('Revenue (₹)', color=self.colors["primary"])
-        
-        # Style the chart
-        ax.set_facecolor(self.colors["background"])
-        self.figure.set_facecolor(self.colors["background"])
-        
-        # Set y axis to start at 0
-        ax.set_ylim(bottom=0)
-        
-        # Add grid lines
-        ax.grid(axis='y', linestyle='--', alpha=0.7)
+        return {
+            'categories': x_labels,
+            'values': [value / 100 for value in daily_sales],
+            'bar_colors': self.colors["secondary"],
+            'value_labels': [format_currency(value, 0) for value in daily_sales],
+            'label_offset': 5,
+            'title': 'Daily Sales (Last 7 Days)',
+            'xlabel': 'Date',
+            'ylabel': 'Revenue (₹)'
+        }
     
-    def generate_weekly_sales_report(self, ax):
-        """Generate report showing weekly sales for the past month"""
-        # Get last 4 weeks
-        end_date = date.today()
-        start_date = end_date - timedelta(days=28)
+    def weekly_sales_report_data(self):
+        """Prepare report showing weekly sales for the past month"""
+        # Get last 4 weeks of business days
+        end_date = date.fromisoformat(self.data_manager.business_date())
+        start_date = end_date - timedelta(days=27)
         
         # Generate weekly ranges
         weeks = []
-        weekly_sales = []
         
         for i in range(4):
             week_start = start_date + timedelta(days=i*7)
             week_end = week_start + timedelta(days=6)
             week_label = f"{week_start.strftime('%d/%m')}-{week_end.strftime('%d/%m')}"
             weeks.append(week_label)
-            
-            # Calculate total sales for the week
-            week_total = 0
-            current_day = week_start
-            while current_day <= week_end and current_day <= end_date:
-                summary = self.data_manager.get_daily_sales_summary(current_day.strftime('%Y-%m-%d'))
-                week_total += summary['total_revenue']
-                current_day += timedelta(days=1)
-            
-            weekly_sales.append(week_total)
-        
-        # Create bar chart
-        bars = ax.bar(weeks, weekly_sales, color=self.colors["secondary"])
-        
-        # Add data labels on top of each bar
-        for bar in bars:
-            height = bar.get_height()
-            ax.text(bar.get_x() + bar.get_width()/2., height + 5,
-                   f'₹{height:.0f}', ha='center', va='bottom')
-        
-        # Set chart title and labels
-        ax.set_title('Weekly Sales (Last 4 Weeks)', color=self.colors["primary"])
-        ax.set_xlabel('Week', color=self.colors["primary"])
-        ax.set_ylabel('Revenue (₹)', color=self.colors["primary"])
         
-        # Style the chart
-        ax.set_facecolor(self.colors["background"])
-        self.figure.set_facecolor(self.colors["background"])
-        
-        # Set y axis to start at 0
-        ax.set_ylim(bottom=0)
-        
-        # Add grid lines
-        ax.grid(axis='y', linestyle='--', alpha=0.7)
+        # Total the line items of the 4 weeks by business day's week, straight from the line store
+        lines = self.data_manager.get_sale_lines()
+        days = lines['business_day']
+        first_day = np.datetime64(start_date, 'D').astype(np.int64)
+        in_range = (days >= first_day) & (days < first_day + 28)
+        line_weeks = (days[in_range] - first_day) // 7
+        amounts = lines['qty'][in_range] * lines['unit_paise'][in_range]
+        weekly_sales = np.bincount(line_weeks, weights=amounts, minlength=4).round().astype(np.int64).tolist()
+        
+        return {
+            'categories': weeks,
+            'values': [value / 100 for value in weekly_sales],
+            'bar_colors': self.colors["secondary"],
+            'value_labels': [format_currency(value, 0) for value in weekly_sales],
+            'label_offset': 5,
+            'title': 'Weekly Sales (Last 4 Weeks)',
+            'xlabel': 'Week',
+            'ylabel': 'Revenue (₹)'
+        }
     
-    def generate_monthly_sales_report(self, ax):
-        """Generate report showing monthly sales for the past 6 months"""
-        # Get current month and past 5 months
-        today = date.today()
+    def monthly_sales_report_data(self):
+        """Prepare report showing monthly sales for the past 6 months"""
+        # Get the open business day's month and past 5 months
+        today = date.fromisoformat(self.data_manager.business_date())
         months = []
-        monthly_sales = []
+        month_keys = []
         
         for i in range(5, -1, -1):
             # Calculate month and year
@@ -709,104 +764,107 @@ class SalesTrackingFrame(ctk.CTkFrame):
             month_name = calendar.month_name[month][:3]
             month_label = f"{month_name} {str(year)[2:]}"
             months.append(month_label)
-            
-            # Get all sales and filter by month and year
-            all_sales = self.data_manager.get_sales()
-            month_total = 0
-            
-            for sale in all_sales:
-                sale_date = sale.get('date', '')
-                if sale_date:
-                    try:
-                        sale_year = int(sale_date.split('-')[0])
-                        sale_month = int(sale_date.split('-')[1])
-                        
-                        if sale_year == year and sale_month == month:
-                            month_total += sale.get('total_amount', 0)
-                    except (ValueError, IndexError):
-                        continue
-            
-            monthly_sales.append(month_total)
-        
-        # Create bar chart
-        bars = ax.bar(months, monthly_sales, color=self.colors["secondary"])
-        
-        # Add data labels on top of each bar
-        for bar in bars:
-            height = bar.get_height()
-            ax.text(bar.get_x() + bar.get_width()/2., height + 5,
-                   f'₹{height:.0f}', ha='center', va='bottom')
-        
-        # Set chart title and labels
-        ax.set_title('Monthly Sales (Last 6 Months)', color=self.colors["primary"])
-        ax.set_xlabel('Month', color=self.colors["primary"])
-        ax.set_ylabel('Revenue (₹)', color=self.colors["primary"])
-        
-        # Style the chart
-        ax.set_facecolor(self.colors["background"])
-        self.figure.set_facecolor(self.colors["background"])
-        
-        # Set y axis to start at 0
-        ax.set_ylim(bottom=0)
-        
-        # Add grid lines
-        ax.grid(axis='y', linestyle='--', alpha=0.7)
+            month_keys.append(f"{year}-{month:02d}")
+        
+        # Total the line items of these months by business day's month, straight from the line store
+        lines = self.data_manager.get_sale_lines()
+        line_months = lines['business_day'].astype('datetime64[D]').astype('datetime64[M]')
+        month_numbers = (line_months - np.datetime64(month_keys[0])).astype(np.int64)
+        in_range = (month_numbers >= 0) & (month_numbers < len(month_keys))
+        amounts = lines['qty'][in_range] * lines['unit_paise'][in_range]
+        monthly_sales = np.bincount(month_numbers[in_range], weights=amounts,
+                                    minlength=len(month_keys)).round().astype(np.int64).tolist()
+        
+        return {
+            'categories': months,
+            'values': [value / 100 for value in monthly_sales],
+            'bar_colors': self.colors["secondary"],
+            'value_labels': [format_currency(value, 0) for value in monthly_sales],
+            'label_offset': 5,
+            'title': 'Monthly Sales (Last 6 Months)',
+            'xlabel': 'Month',
+            'ylabel': 'Revenue (₹)'
+        }
     
-    def generate_item_performance_report(self, ax):
-        """Generate report showing top selling items"""
-        # Get all sales
-        all_sales = self.data_manager.get_sales()
-        
-        # Count items sold
-        item_counts = {}
-        for sale in all_sales:
-            for item in sale.get('items', []):
-                item_name = item.get('name')
-                item_qty = item.get('quantity', 1)
-                
-                if item_name in item_counts:
-                    item_counts[item_name] += item_qty
-                else:
-                    item_counts[item_name] = item_qty
-        
-        # Sort items by quantity sold (descending)
-        sorted_items = sorted(item_counts.items(), key=lambda x: x[1], reverse=True)
-        
-        # Take top 10 items or all if less than 10
-        top_items = sorted_items[:10]
+    def item_performance_report_data(self):
+        """Prepare report showing top selling items"""
+        # Top 10 items by quantity sold, from the running sales counters
+        top_items = self.data_manager.get_top_items(10)
         
         # Extract names and counts
-        item_names = [item[0] for item in top_items]
-        item_quantities = [item[1] for item in top_items]
-        
-        # Create horizontal bar chart
-        bars = ax.barh(item_names, item_quantities, color=self.colors["secondary"])
-        
-        # Add data labels next to each bar
-        for bar in bars:
-            width = bar.get_width()
-            ax.text(width + 0.5, bar.get_y() + bar.get_height()/2,
-                   f'{width:.0f}', ha='left', va='center')
-        
-        # Set chart title and labels
-        ax.set_title('Top Selling Items', color=self.colors["primary"])
-        ax.set_xlabel('Quantity Sold', color=self.colors["primary"])
-        
-        # Style the chart
-        ax.set_facecolor(self.colors["background"])
-        self.figure.set_facecolor(self.colors["background"])
-        
-        # Set x axis to start at 0
-        ax.set_xlim(left=0)
-        
-        # Add grid lines
-        ax.grid(axis='x', linestyle='--', alpha=0.7)
+        item_names = [item['name'] for item in top_items]
+        item_quantities = [item['quantity'] for item in top_items]
+        
+        return {
+            'categories': item_names,
+            'values': item_quantities,
+            'bar_colors': self.colors["secondary"],
+            'value_labels': [f'{quantity:.0f}' for quantity in item_quantities],
+            'label_offset': 0.5,
+            'horizontal': True,
+            'title': 'Top Selling Items',
+            'xlabel': 'Quantity Sold',
+            'empty_message': "No sales recorded yet"
+        }
+    
+    def hourly_heatmap_report_data(self, measure):
+        """Prepare report showing 'revenue' or 'transactions' by weekday and hour of day"""
+        # Running weekday x hour totals, kept up to date as sales are added
+        cells = self.data_manager.get_sales_heatmap()[measure]
+        if measure == 'revenue':
+            cells = cells / 100
+        
+        # Name the busiest slot for shift planning
+        weekday, hour = divmod(int(cells.argmax()), cells.shape[1])
+        busiest = f"{calendar.day_abbr[weekday]} {hour:02d}:00"
+        
+        if measure == 'revenue':
+            title = f'Revenue by Weekday and Hour (busiest: {busiest})'
+            colorbar_label = 'Revenue (₹)'
+        else:
+            title = f'Transactions by Weekday and Hour (busiest: {busiest})'
+            colorbar_label = 'Transactions'
+        
+        return {
+            'kind': 'heatmap',
+            'cells': cells,
+            'row_labels': list(calendar.day_abbr),
+            'column_labels': [f'{hour:02d}' for hour in range(cells.shape[1])],
+            'title': title,
+            'xlabel': 'Hour of Day',
+            'ylabel': 'Weekday',
+            'colorbar_label': colorbar_label,
+            'empty_message': "No sales recorded yet"
+        }
+    
+    def item_combos_report_data(self):
+        """Prepare report showing the item combinations bought together most strongly"""
+        # Rules are sorted by lift: how much likelier the pairing is than chance
+        top_rules = self.basket_analyzer.rules()[:10]
+        
+        combo_names = [' + '.join(rule['antecedent']) + ' → ' + rule['consequent'] for rule in top_rules]
+        lifts = [rule['lift'] for rule in top_rules]
+        
+        return {
+            'categories': combo_names,
+            'values': lifts,
+            'bar_colors': self.colors["secondary"],
+            # Share of baskets with the first items that also had the last one
+            'value_labels': [f"{rule['confidence']:.0%}" for rule in top_rules],
+            'label_offset': 0.1,
+            'horizontal': True,
+            # Strongest combo at the top
+            'invert': True,
+            'title': 'Frequently Bought Together',
+            'xlabel': 'Lift (times likelier than chance)',
+            'empty_message': "Not enough sales to find combos yet"
+        }
     
     def add_new_sale(self):
         """Open dialog to add a new sale"""
         self.sale_dialog = SaleDialog(self, self.colors, self.data_manager)
         self.wait_window(self.sale_dialog)
-        self.refresh_data()
+        self.sync_data()
     
     def show_daily_report(self, target_date):
         """Show the daily report for a specific date"""
@@ -845,6 +903,49 @@ class SalesTrackingFrame(ctk.CTkFrame):
         except ValueError:
             messagebox.showerror("Invalid Date", "Please select a valid date")
     
+    def close_day(self):
+        """Close the open business day after confirmation and show its Z-report"""
+        business_date = self.data_manager.business_date()
+        if not messagebox.askyesno(
+            "Close Day",
+            f"Close {business_date}? Its sales will be archived and later sales will go to the next day."
+        ):
+            return
+        
+        success, message = self.data_manager.close_day(business_date)
+        if not success:
+            messagebox.showerror("Close Day Failed", message)
+            return
+        
+        self.sync_data()
+        messagebox.showinfo(f"Z-Report {business_date}", self.z_report_text(self.data_manager.get_z_report(business_date)))
+    
+    def z_report_text(self, report):
+        """Format the final totals of a closed day for display"""
+        lines = [
+            f"Date: {report['date']}",
+            f"Closed at: {report['closed_at']}",
+            f"Transactions: {report['transactions']}",
+            f"Revenue: {format_currency(report['revenue'])}"
+        ]
+        if report['transactions']:
+            lines.append(f"Average sale: {format_currency(report['revenue'] // report['transactions'])}")
+            lines.append(f"Sales from {report['first_sale_at']} to {report['last_sale_at']}")
+        
+        if report['payments']:
+            lines.append("")
+            lines.append("Payments:")
+            for method, totals in sorted(report['payments'].items()):
+                lines.append(f"  {method}: {totals['transactions']} sales, {format_currency(totals['revenue'])}")
+        
+        # Best sellers first; the full list is in the closed days file
+        if report['items']:
+            lines.append("")
+            lines.append("Top items:")
+            for item in report['items'][:10]:
+                lines.append(f"  {item['name']}: {item['quantity']} sold, {format_currency(item['revenue'])}")
+        return "\n".join(lines)
+    
     def export_data(self):
         """Export sales data to Excel"""
         # Ask if user wants to export all sales or just for a specific date
@@ -868,7 +969,7 @@ class SalesTrackingFrame(ctk.CTkFrame):
         date_filter = None
         
         if dialog.result == "Today's Sales":
-            date_filter = date.today().strftime('%Y-%m-%d')
+            date_filter = self.data_manager.business_date()
         elif dialog.result == "Selected Date":
             try:
                 year = int(self.year_var.get())
@@ -879,7 +980,8 @@ class SalesTrackingFrame(ctk.CTkFrame):
                 messagebox.showerror("Invalid Date", "Please select a valid date")
                 return
         
-        success, message = self.data_manager.export_sales_to_excel(filepath, date_filter)
+        with profiler.action("export_sales"):
+            success, message = self.data_manager.export_sales_to_excel(filepath, date_filter)
         
         if success:
             messagebox.showinfo("Export Successful", message)
@@ -1069,7 +1171,7 @@ class SaleDialog(ctk.CTkToplevel):
                 item for item in self.menu_items
                 if search_text in item.get('name', '').lower() or 
                    search_text in item.get('category', '').lower() or
-                   search_text in str(item.get('price', '')).lower()
+                   search_text in format_currency(item.get('price', 0))
             ]
             self.display_menu_items(filtered_items)
     
@@ -1137,13 +1239,13 @@ class SaleDialog(ctk.CTkToplevel):
         stock_quantity = 0
         
         for inv_item in inventory:
-            if inv_item.get('name') == item.get('name'):
+            if item_key(inv_item) == item.get('id'):
                 stock_quantity = inv_item.get('quantity', 0)
                 break
         
         # Item name and price
         name_text = item.get('name', 'Unnamed')
-        price_text = f"₹{item.get('price', '0.00')}"
+        price_text = format_currency(item.get('price', 0))
         
         name_label = ctk.CTkLabel(
             frame,
@@ -1201,6 +1303,7 @@ class SaleDialog(ctk.CTkToplevel):
         # Add new item to cart
         cart_item = {
             'id': item['id'],
+            'item_id': item['id'],
             'name': item['name'],
             'price': item['price'],
             'quantity': 1
@@ -1241,7 +1344,7 @@ class SaleDialog(ctk.CTkToplevel):
             total_amount += item['price'] * item['quantity']
         
         # Update total
-        self.total_var.set(f"₹{total_amount:.2f}")
+        self.total_var.set(format_currency(total_amount))
     
     def create_cart_item_display(self, item, index):
         """Create a display for a cart item"""
@@ -1307,7 +1410,7 @@ class SaleDialog(ctk.CTkToplevel):
         price = item['price'] * item['quantity']
         price_label = ctk.CTkLabel(
             frame,
-            text=f"₹{price:.2f}",
+            text=format_currency(price),
             font=("Roboto", 14),
             text_color=self.colors["primary"]
         )
@@ -1351,19 +1454,18 @@ class SaleDialog(ctk.CTkToplevel):
         # Calculate total
         total_amount = sum(item['price'] * item['quantity'] for item in self.cart_items)
         
-        # Prepare sale data
+        # Prepare sale data; the data manager dates it to the open business day
         sale_data = {
             'items': self.cart_items,
-            'total_amount': total_amount,
-            'date': date.today().strftime('%Y-%m-%d'),
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            'total_amount': total_amount
         }
         
         # Save the sale
-        success, message = self.data_manager.add_sale(sale_data)
+        with profiler.action("SaleDialog.complete_sale"):
+            success, message = self.data_manager.add_sale(sale_data)
         
         if success:
-            messagebox.showinfo("Sale Complete", f"Sale completed successfully. Total: ₹{total_amount:.2f}")
+            messagebox.showinfo("Sale Complete", f"Sale completed successfully. Total: {format_currency(total_amount)}")
             self.destroy()
         else:
             messagebox.showerror("Error", message)
@@ -0,0 +1,390 @@
+import os
+import re
+import json
+import struct
+
+try:
+    import orjson
+except ImportError:  # Optional, the stdlib encoder is used instead
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # Optional, only needed for the msgpack codec
+    msgpack = None
+
+from records import Record, json_default
+
+# First line of a data file in a codec other than the original JSON array
+HEADER_PREFIX = b'#cafe-store '
+
+# Top level "id" key of a record in a JSON array file written with one key per line
+RECORD_ID_PATTERN = re.compile(rb'\n    "id": (\d+)')
+
+# Closing brace of a record in such a file (nested values are indented deeper)
+RECORD_END_PATTERN = re.compile(rb'\n  \}')
+
+# Compact JSON for the values of records (the C encoder, unlike indent=2)
+RECORD_VALUE_ENCODER = json.JSONEncoder(default=json_default)
+
+# How far back from the end of a file to look for the last record
+TAIL_WINDOW = 65536
+
+
+def apply_object_hook(value, object_hook):
+    """Build records from parsed plain values innermost first, like json's object_hook"""
+    if type(value) is dict:
+        for key, element in value.items():
+            if type(element) in (dict, list):
+                value[key] = apply_object_hook(element, object_hook)
+        return object_hook(value)
+    if type(value) is list:
+        return [apply_object_hook(element, object_hook) if type(element) in (dict, list) else element
+                for element in value]
+    return value
+
+
+class JsonArrayCodec:
+    """Records as one JSON array with one key per line, the original layout
+
+    Files have no header line; they are recognized by the opening bracket.
+    Appends overwrite the closing bracket.
+    """
+    name = 'json'
+    header = b''
+
+    def format_record(self, record):
+        """Format a record with one key per line, as RECORD_ID_PATTERN expects
+
+        Nested values such as line items stay on one line, which keeps large
+        appends on the fast JSON encoder.
+        """
+        data = record.to_json() if isinstance(record, Record) else record
+        encode = RECORD_VALUE_ENCODER.encode
+        fields = ',\n    '.join(f'{encode(key)}: {encode(value)}' for key, value in data.items())
+        return '{\n    ' + fields + '\n  }'
+
+    def dump(self, records):
+        """Encode a whole file of records"""
+        if not records:
+            return b'[]'
+        return ('[\n  ' + ',\n  '.join(self.format_record(record) for record in records) + '\n]').encode()
+
+    def load(self, data, object_hook=None):
+        """Decode a whole file of records"""
+        return json.loads(data, object_hook=object_hook) if data.strip() else []
+
+    def read_records(self, data, offset, object_hook=None, final=True):
+        """Decode the complete records in data, read from offset in a file
+
+        Returns the records, the (start, end) span of each within data and
+        how many bytes of data they take up. Each span starts where the one
+        before ends, so spans tile the file. Unless final, data may stop
+        anywhere and only the records up to the last complete one are read.
+        """
+        if final:
+            data = data.rstrip()
+            if not data and offset == 0:
+                return [], [], 0  # Empty file, no records yet
+            if not data.endswith(b']'):
+                raise ValueError("file is not a closed JSON array")
+            body = data[:-1].rstrip()
+        else:
+            ends = list(RECORD_END_PATTERN.finditer(data))
+            body = data[:ends[-1].end()] if ends else b''
+
+        content = body.lstrip().lstrip(b'[,')
+        records = json.loads(b'[' + content + b']', object_hook=object_hook) if content.strip() else []
+
+        # Files in another layout get one span covering every record
+        ends = [match.end() for match in RECORD_END_PATTERN.finditer(body)]
+        if len(ends) == len(records):
+            spans = list(zip([0] + ends[:-1], ends))
+        else:
+            spans = [(0, len(body))] * len(records)
+        return records, spans, len(body)
+
+    def read_spans(self, chunks, object_hook=None):
+        """Decode the records in the bytes of a list of spans"""
+        parts = [chunk.lstrip().lstrip(b'[,') for chunk in chunks]
+        return json.loads(b'[' + b','.join(parts) + b']', object_hook=object_hook)
+
+    def append(self, f, records):
+        """Append records to a file open for update, or return False if its end is damaged"""
+        size = f.seek(0, os.SEEK_END)
+        tail_start = max(0, size - 4096)
+        f.seek(tail_start)
+        tail = f.read().rstrip()
+        body = tail[:-1].rstrip()
+
+        if not (tail.endswith(b']') and body):
+            return False
+
+        # Overwrite from just after the last record (or the opening bracket)
+        separator = '' if body.endswith(b'[') else ','
+        lines = [self.format_record(record) for record in records]
+        f.seek(tail_start + len(body))
+        f.write((separator + '\n  ' + ',\n  '.join(lines) + '\n]').encode())
+        f.truncate()
+        return True
+
+    def last_record_id(self, f, end=None):
+        """Get the ID of the last record ending at or before end (default the end of file), or 0"""
+        end = f.seek(0, os.SEEK_END) if end is None else end
+        f.seek(max(0, end - TAIL_WINDOW))
+        head = f.read(end - max(0, end - TAIL_WINDOW))
+
+        # Record level keys are indented by four spaces, nested ones deeper
+        ids = RECORD_ID_PATTERN.findall(head)
+        return int(ids[-1]) if ids else 0
+
+    def is_record_end(self, f, offset):
+        """Check whether offset is just after a record (or the start of the records)"""
+        f.seek(max(0, offset - 4096))
+        head = f.read(offset - max(0, offset - 4096))
+        return offset == 0 or head.rstrip().endswith((b'}', b'['))
+
+
+class JsonLinesCodec:
+    """Records as compact JSON, one per line, after a header line
+
+    Uses orjson when it is installed. Appends only ever add bytes, and a
+    line cut short by a crash is dropped on the next append.
+    """
+    name = 'jsonl'
+    header = HEADER_PREFIX + b'jsonl\n'
+
+    def __init__(self, use_orjson=True):
+        """Initialize the codec, optionally without orjson even if it is installed"""
+        self.orjson = orjson if use_orjson else None
+
+    def encode_record(self, record):
+        """Encode one record as a line"""
+        data = record.to_json() if isinstance(record, Record) else record
+        if self.orjson:
+            return self.orjson.dumps(data, default=json_default) + b'\n'
+        return RECORD_VALUE_ENCODER.encode(data).encode() + b'\n'
+
+    def dump(self, records):
+        """Encode a whole file of records"""
+        return self.header + b''.join(self.encode_record(record) for record in records)
+
+    def load(self, data, object_hook=None):
+        """Decode a whole file of records"""
+        if not data.startswith(self.header):
+            raise ValueError("file does not start with a jsonl header")
+        return self.read_spans([data[len(self.header):]], object_hook)
+
+    def read_records(self, data, offset, object_hook=None, final=True):
+        """Decode the complete lines in data, read from offset in a file (see JsonArrayCodec)"""
+        start = 0
+        if offset == 0:
+            if not data.startswith(self.header[:len(data)]):
+                raise ValueError("file does not start with a jsonl header")
+            start = min(len(data), len(self.header))
+
+        end = data.rfind(b'\n', start) + 1
+        if end <= start:
+            return [], [], start
+
+        ends = [match.end() for match in re.finditer(b'\n', data[start:end])]
+        spans = [(start + span_start, start + span_end) for span_start, span_end in zip([0] + ends[:-1], ends)]
+        return self.read_spans([data[start:end]], object_hook), spans, end
+
+    def read_spans(self, chunks, object_hook=None):
+        """Decode the records in the bytes of a list of spans of whole lines"""
+        lines = b''.join(chunks).strip(b'\n')
+        if not lines:
+            return []
+
+        # Compact JSON has no raw newlines, so the lines become one array
+        data = b'[' + lines.replace(b'\n', b',') + b']'
+        if self.orjson is None:
+            return json.loads(data, object_hook=object_hook)
+        records = self.orjson.loads(data)
+        return apply_object_hook(records, object_hook) if object_hook else records
+
+    def append(self, f, records):
+        """Append records to a file open for update, first dropping a line cut short"""
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            f.write(self.header)
+        else:
+            f.seek(size - 1)
+            if f.read(1) != b'\n':
+                f.seek(self._last_line_start(f, size))
+                f.truncate()
+
+        f.write(b''.join(self.encode_record(record) for record in records))
+        return True
+
+    def _last_line_start(self, f, end):
+        """Find where the line running up to end starts"""
+        window = TAIL_WINDOW
+        while True:
+            start = max(len(self.header), end - window)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline >= 0:
+                return start + newline + 1
+            if start == len(self.header):
+                return start
+            window *= 2
+
+    def last_record_id(self, f, end=None):
+        """Get the ID of the last record ending at or before end (default the end of file), or 0"""
+        end = f.seek(0, os.SEEK_END) if end is None else end
+        f.seek(max(0, end - 1))
+        if end <= len(self.header):
+            return 0
+        if f.read(1) != b'\n':
+            end = self._last_line_start(f, end)  # Skip a line cut short
+            if end <= len(self.header):
+                return 0
+
+        start = self._last_line_start(f, end - 1)
+        f.seek(start)
+        record = json.loads(f.read(end - start))
+        return record.get('id', 0) if isinstance(record, dict) else 0
+
+    def is_record_end(self, f, offset):
+        """Check whether offset is just after a record (or the start of the records)"""
+        if offset in (0, len(self.header)):
+            return True
+        f.seek(offset - 1)
+        return offset > len(self.header) and f.read(1) == b'\n'
+
+
+class MsgpackCodec:
+    """Records as msgpack maps after a header line
+
+    Each record is framed by its length before and after it, so records
+    can be read forwards or, for the last ID, backwards from the end.
+    """
+    name = 'msgpack'
+    header = HEADER_PREFIX + b'msgpack\n'
+    FRAME = struct.Struct('<I')
+
+    def encode_record(self, record):
+        """Encode one record as a frame"""
+        data = record.to_json() if isinstance(record, Record) else record
+        payload = msgpack.packb(data, default=json_default)
+        length = self.FRAME.pack(len(payload))
+        return length + payload + length
+
+    def dump(self, records):
+        """Encode a whole file of records"""
+        return self.header + b''.join(self.encode_record(record) for record in records)
+
+    def load(self, data, object_hook=None):
+        """Decode a whole file of records"""
+        if not data.startswith(self.header):
+            raise ValueError("file does not start with a msgpack header")
+        records, _, end = self._read_frames(data, len(self.header), object_hook)
+        if end != len(data):
+            raise ValueError("msgpack file ends with a damaged record")
+        return records
+
+    def _read_frames(self, data, start, object_hook=None):
+        """Decode the complete frames from start, returning records, spans and where they end"""
+        view = memoryview(data)
+        frame = self.FRAME
+        records, spans = [], []
+        pos = start
+        while pos + 8 <= len(data):
+            length = frame.unpack_from(data, pos)[0]
+            end = pos + length + 8
+            if end > len(data):
+                break
+            if frame.unpack_from(data, end - 4)[0] != length:
+                raise ValueError("msgpack record frame is damaged")
+            records.append(msgpack.unpackb(view[pos + 4:end - 4], object_hook=object_hook))
+            spans.append((pos, end))
+            pos = end
+        return records, spans, pos
+
+    def read_records(self, data, offset, object_hook=None, final=True):
+        """Decode the complete frames in data, read from offset in a file (see JsonArrayCodec)"""
+        start = 0
+        if offset == 0:
+            if not data.startswith(self.header[:len(data)]):
+                raise ValueError("file does not start with a msgpack header")
+            start = min(len(data), len(self.header))
+        return self._read_frames(data, start, object_hook)
+
+    def read_spans(self, chunks, object_hook=None):
+        """Decode the records in the bytes of a list of spans of whole frames"""
+        return self._read_frames(b''.join(chunks), 0, object_hook)[0]
+
+    def append(self, f, records):
+        """Append records to a file open for update, first dropping a frame cut short"""
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            f.write(self.header)
+        elif not self.is_record_end(f, size):
+            # Rare, so the frames are walked from the start to find the last whole one
+            f.seek(0)
+            _, _, end = self._read_frames(f.read(), len(self.header))
+            f.seek(end)
+            f.truncate()
+
+        f.seek(0, os.SEEK_END)
+        f.write(b''.join(self.encode_record(record) for record in records))
+        return True
+
+    def last_record_id(self, f, end=None):
+        """Get the ID of the last record ending at or before end (default the end of file), or 0"""
+        end = f.seek(0, os.SEEK_END) if end is None else end
+        if end <= len(self.header) or not self.is_record_end(f, end):
+            return 0
+
+        f.seek(end - 4)
+        length = self.FRAME.unpack(f.read(4))[0]
+        f.seek(end - 4 - length)
+        record = msgpack.unpackb(f.read(length))
+        return record.get('id', 0) if isinstance(record, dict) else 0
+
+    def is_record_end(self, f, offset):
+        """Check whether offset is just after a frame (or the start of the records)"""
+        if offset in (0, len(self.header)):
+            return True
+        if offset < len(self.header) + 8:
+            return False
+
+        f.seek(offset - 4)
+        length = self.FRAME.unpack(f.read(4))[0]
+        start = offset - 8 - length
+        if start < len(self.header):
+            return False
+        f.seek(start)
+        return self.FRAME.unpack(f.read(4))[0] == length
+
+
+CODECS = {'json': JsonArrayCodec(), 'jsonl': JsonLinesCodec()}
+if msgpack is not None:
+    CODECS['msgpack'] = MsgpackCodec()
+
+
+def get_codec(name):
+    """Get a codec by name"""
+    if name == 'msgpack' and msgpack is None:
+        raise RuntimeError("The msgpack codec needs the msgpack package (pip install msgpack)")
+    if name not in CODECS:
+        raise ValueError(f"Unknown data file codec: {name}")
+    return CODECS[name]
+
+
+def detect_codec(head):
+    """Get the codec of a file from its first bytes; files without a header are JSON arrays"""
+    if head.startswith(HEADER_PREFIX):
+        return get_codec(head[len(HEADER_PREFIX):].split(b'\n', 1)[0].decode('ascii', 'replace'))
+    return CODECS['json']
+
+
+def file_codec(filepath):
+    """Get the codec of a data file, or None if it doesn't exist"""
+    try:
+        with open(filepath, 'rb') as f:
+            return detect_codec(f.read(64))
+    except FileNotFoundError:
+        return None
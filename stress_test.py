@@ -0,0 +1,171 @@
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+
+from data_manager import DataManager
+from day_totals import DayAccumulator
+
+STRESS_ITEM = "Stress Test Item"
+STRESS_PRICE = 1000  # Paise
+EXTRA_ITEM = "Stress Test Extra"  # Sold before it is on the menu
+
+
+def hammer_sales(data_dir, sales_per_worker, start_event, results):
+    """Record single-item sales as fast as possible, reporting each call's latency"""
+    data_manager = DataManager(data_dir)
+    start_event.wait()
+
+    latencies = []
+    for _ in range(sales_per_worker):
+        start = time.perf_counter()
+        data_manager.add_sale({
+            'items': [{'name': STRESS_ITEM, 'price': STRESS_PRICE, 'quantity': 1}],
+            'total_amount': STRESS_PRICE,
+            'payment_method': 'Cash'
+        })
+        latencies.append(time.perf_counter() - start)
+
+    results.put(('sales', latencies))
+
+
+def bump_price(data_dir, bumps, start_event, results):
+    """Raise the stress item's price by one repeatedly with compare-and-swap retries"""
+    data_manager = DataManager(data_dir)
+    start_event.wait()
+
+    conflicts = 0
+    for _ in range(bumps):
+        while True:
+            item = next(item for item in data_manager.get_menu_items() if item['name'] == STRESS_ITEM)
+            success, _ = data_manager.update_menu_item(
+                item['id'], {'price': item['price'] + 1}, expected_version=item['version']
+            )
+            if success:
+                break
+            conflicts += 1
+
+    results.put(('conflicts', conflicts))
+
+
+def percentile(values, fraction):
+    """Get a percentile of sorted values"""
+    return values[int(fraction * (len(values) - 1))] if values else 0.0
+
+
+def run(processes, sales_per_worker, bumps, data_dir):
+    """Run the stress test in data_dir and return whether nothing was lost"""
+    total_sales = processes * sales_per_worker
+    initial_stock = total_sales + 1000
+
+    data_manager = DataManager(data_dir)
+    data_manager.add_menu_item({
+        'name': STRESS_ITEM,
+        'category': 'Snacks',
+        'price': STRESS_PRICE,
+        'initial_stock': initial_stock
+    })
+
+    start_event = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=hammer_sales, args=(data_dir, sales_per_worker, start_event, results))
+        for _ in range(processes)
+    ]
+    workers += [
+        multiprocessing.Process(target=bump_price, args=(data_dir, bumps, start_event, results))
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+
+    start = time.perf_counter()
+    start_event.set()
+
+    # Drain results before joining so workers never block on a full queue
+    latencies = []
+    conflicts = 0
+    for _ in workers:
+        kind, value = results.get()
+        if kind == 'sales':
+            latencies.extend(value)
+        else:
+            conflicts += value
+    duration = time.perf_counter() - start
+    for worker in workers:
+        worker.join()
+
+    # Check the outcome from a fresh instance that only sees the files
+    checker = DataManager(data_dir)
+    sales = checker.get_sales()
+    stock = {item['name']: item['quantity'] for item in checker.get_inventory()}
+    sale_movements = checker.get_inventory_movements(STRESS_ITEM, 'sale')
+    price = next(item['price'] for item in checker.get_menu_items() if item['name'] == STRESS_ITEM)
+
+    checks = [
+        ("sales recorded", len(sales), total_sales),
+        ("unique sale IDs", len({sale['id'] for sale in sales}), total_sales),
+        ("sale ledger entries", len(sale_movements), total_sales),
+        ("remaining stock", stock.get(STRESS_ITEM), initial_stock - total_sales),
+        ("final price", price, STRESS_PRICE + processes * bumps),
+    ]
+
+    latencies.sort()
+    print(f"{processes} processes x {sales_per_worker} sales, {processes} x {bumps} price updates")
+    print(f"  {total_sales / duration:.0f} sales/s over {duration:.2f}s")
+    print(f"  add_sale latency p50 {percentile(latencies, 0.50) * 1000:.1f} ms, "
+          f"p95 {percentile(latencies, 0.95) * 1000:.1f} ms, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms")
+    print(f"  compare-and-swap conflicts retried: {conflicts}")
+
+    # Keying sales by menu id after a close must not copy archived sales
+    # back into the sales file: one unkeyed sale is archived, one stays hot
+    extra_sale = {'items': [{'name': EXTRA_ITEM, 'price': STRESS_PRICE, 'quantity': 1}], 'total_amount': STRESS_PRICE}
+    checker.add_sales([dict(extra_sale)], update_inventory=False)
+    checker.close_day()
+    checker.add_sales([dict(extra_sale, items=[dict(extra_sale['items'][0])])], update_inventory=False)
+    checker.add_menu_item({'name': EXTRA_ITEM, 'category': 'Snacks', 'price': STRESS_PRICE})
+    checker.migrate_item_ids()
+    reopened = DataManager(data_dir)
+    checks.append(("sales after close and id migration", len(reopened.get_sales()), total_sales + 2))
+    checks.append(("sales of the open day", len(reopened.get_sales(reopened.business_date())), 1))
+
+    # Day totals kept from events must still pick up another process's sales
+    day_totals = DayAccumulator(reopened)
+    day_totals.totals()
+    checker.add_sales([dict(extra_sale, items=[dict(extra_sale['items'][0])])], update_inventory=False)
+    checks.append(("day totals with another process's sale", day_totals.totals()['total_transactions'], 2))
+
+    passed = True
+    for label, actual, expected in checks:
+        status = "ok" if actual == expected else "LOST"
+        passed = passed and actual == expected
+        print(f"  {label}: {actual} (expected {expected}) {status}")
+
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that concurrent processes sharing a data folder lose nothing")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--sales", type=int, default=250, help="Sales per process")
+    parser.add_argument("--bumps", type=int, default=25, help="Price updates per process")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary data folder")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="cafe_stress_")
+    try:
+        passed = run(args.processes, args.sales, args.bumps, data_dir)
+    finally:
+        if args.keep:
+            print(f"Data kept in {data_dir}")
+        else:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
 import os
+import re
 import sys
 import shutil
 import json
 from datetime import datetime
 import pandas as pd
+from backup_store import BackupStore
 
 def create_data_directory():
     """Create the data directory if it doesn't exist"""
@@ -25,9 +27,24 @@ def create_data_directory():
                 f.write(default_content)
             print(f"Created file: {file_path}")
 
-def format_currency(amount):
-    """Format a number as currency"""
-    return f"₹{float(amount):.2f}"
+def format_currency(paise, decimals=2):
+    """Format an amount in integer paise as rupees, exactly"""
+    paise = int(paise)
+    sign = "-" if paise < 0 else ""
+    rupees, cents = divmod(abs(paise), 100)
+    if decimals == 0:
+        rupees += 1 if cents >= 50 else 0
+        return f"{sign}₹{rupees}"
+    return f"{sign}₹{rupees}.{cents:02d}"
+
+def parse_currency(text):
+    """Parse a rupee amount typed by a user into integer paise"""
+    text = str(text).strip().lstrip("₹").replace(",", "").strip()
+    match = re.fullmatch(r"(-?)(\d*)(?:\.(\d{0,2}))?", text)
+    if not match or not (match.group(2) or match.group(3)):
+        raise ValueError(f"not an amount: {text!r}")
+    paise = int(match.group(2) or 0) * 100 + int((match.group(3) or "").ljust(2, "0"))
+    return -paise if match.group(1) else paise
 
 def format_timestamp(timestamp_str):
     """Format a timestamp string for display"""
@@ -51,87 +68,274 @@ def get_safe_filename(name):
     safe_name = ''.join(c if c.isalnum() else '_' for c in name)
     return safe_name
 
+# Backups live in this folder of the data directory they back up
+BACKUP_DIR_NAME = "backups"
+
+# Backup retention
+BACKUP_KEEP_LAST = 10  # Most recent snapshots always kept
+BACKUP_KEEP_DAILY = 30  # Days for which the last snapshot of the day is kept
+
+def get_backup_dir(data_manager=None):
+    """Get the backup directory for a data manager's store (the default store if None)"""
+    return os.path.join(data_manager.data_dir if data_manager else "data", BACKUP_DIR_NAME)
+
+def _backup_files(data_manager):
+    """Get the data files to back up, keyed by file name"""
+    if data_manager:
+        return data_manager.get_data_files()
+    
+    file_names = ["menu.txt", "sales.txt", "inventory.txt", "inventory_ledger.txt", "inventory_checkpoint.txt",
+                  "sales_rollup.txt", "format.txt", "closed_days.txt"]
+    files = {file_name: f"data/{file_name}" for file_name in file_names}
+    if os.path.isdir("data/archive"):
+        for name in sorted(os.listdir("data/archive")):
+            if name.endswith('.gz'):
+                files[f"archive/{name}"] = f"data/archive/{name}"
+    return files
+
 def create_backup(data_manager):
-    """Create a backup of all data files"""
+    """Create an incremental backup of all data files"""
     try:
-        # Create backup directory if it doesn't exist
-        backup_dir = "data/backups"
-        if not os.path.exists(backup_dir):
-            os.makedirs(backup_dir)
+        store = BackupStore(get_backup_dir(data_manager))
         
-        # Create timestamp for backup files
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # Only chunks that changed since earlier backups are written
+        files = data_manager.read_data_files() if data_manager else _backup_files(None)
+        snapshot_id, stats = store.create_snapshot(files)
+        store.prune(BACKUP_KEEP_LAST, BACKUP_KEEP_DAILY)
         
-        # Backup each file
-        for file_name in ["menu.txt", "sales.txt", "inventory.txt"]:
-            source_path = f"data/{file_name}"
-            dest_path = f"{backup_dir}/{timestamp}_{file_name}"
-            
-            if os.path.exists(source_path):
-                shutil.copy2(source_path, dest_path)
-        
-        return True, f"Backup created successfully at {timestamp}"
+        return True, (
+            f"Backup created successfully at {snapshot_id} "
+            f"({stats['new_chunks']} of {stats['chunks']} chunks new, "
+            f"{stats['stored_bytes'] / 1024:.1f} KB written)"
+        )
     except Exception as e:
         return False, f"Backup failed: {str(e)}"
 
+def list_backups(data_manager=None):
+    """List available backup timestamps, oldest first"""
+    return BackupStore(get_backup_dir(data_manager)).list_snapshots()
+
+def prune_backups(keep_last=BACKUP_KEEP_LAST, keep_daily=BACKUP_KEEP_DAILY, data_manager=None):
+    """Delete old backups and any chunks no remaining backup uses"""
+    try:
+        removed, freed_chunks = BackupStore(get_backup_dir(data_manager)).prune(keep_last, keep_daily)
+        return True, f"Removed {len(removed)} backups and {freed_chunks} unused chunks"
+    except Exception as e:
+        return False, f"Pruning backups failed: {str(e)}"
+
 def restore_backup(backup_timestamp, data_manager=None):
     """Restore data from a backup"""
     try:
-        backup_dir = "data/backups"
-        
-        # Check if files exist
-        required_files = [
-            f"{backup_dir}/{backup_timestamp}_menu.txt",
-            f"{backup_dir}/{backup_timestamp}_sales.txt",
-            f"{backup_dir}/{backup_timestamp}_inventory.txt"
-        ]
-        
-        for file_path in required_files:
-            if not os.path.exists(file_path):
-                return False, f"Backup file not found: {file_path}"
+        store = BackupStore(get_backup_dir(data_manager))
+        if store.get_manifest(backup_timestamp) is None:
+            return _restore_legacy_backup(backup_timestamp, data_manager)
         
         # Create backup of current data before restoring
         if data_manager:
             create_backup(data_manager)
         
-        # Restore each file
-        for file_name in ["menu.txt", "sales.txt", "inventory.txt"]:
-            source_path = f"{backup_dir}/{backup_timestamp}_{file_name}"
-            dest_path = f"data/{file_name}"
-            
-            shutil.copy2(source_path, dest_path)
+        destinations = _backup_files(data_manager)
+        
+        # Archived days in the backup are restored even if they are gone now
+        data_dir = data_manager.data_dir if data_manager else "data"
+        for file_name in store.get_manifest(backup_timestamp)['files']:
+            if file_name.startswith('archive/'):
+                destinations[file_name] = os.path.join(data_dir, file_name)
+        os.makedirs(os.path.join(data_dir, "archive"), exist_ok=True)
+        
+        restored = store.restore_snapshot(backup_timestamp, destinations)
+        
+        # Data files the backup predates are reset so no stale state survives
+        for file_name, file_path in destinations.items():
+            if file_name not in restored and os.path.exists(file_path):
+                os.remove(file_path)
+        
+        if data_manager:
+            data_manager.reload()
         
         return True, "Backup restored successfully"
     except Exception as e:
         return False, f"Restore failed: {str(e)}"
 
-def validate_json_file(file_path):
-    """Validate that a file contains valid JSON and fix if possible"""
-    try:
-        with open(file_path, 'r') as f:
-            content = f.read().strip()
+def _restore_legacy_backup(backup_timestamp, data_manager=None):
+    """Restore a backup made as full timestamped copies of each file"""
+    backup_dir = get_backup_dir(data_manager)
+    
+    # Check if files exist
+    required_files = [
+        f"{backup_dir}/{backup_timestamp}_menu.txt",
+        f"{backup_dir}/{backup_timestamp}_sales.txt",
+        f"{backup_dir}/{backup_timestamp}_inventory.txt"
+    ]
+    
+    for file_path in required_files:
+        if not os.path.exists(file_path):
+            return False, f"Backup file not found: {file_path}"
+    
+    # Create backup of current data before restoring
+    if data_manager:
+        create_backup(data_manager)
+    
+    # Restore each file
+    destinations = _backup_files(data_manager)
+    for file_name in ["menu.txt", "sales.txt", "inventory.txt"]:
+        source_path = f"{backup_dir}/{backup_timestamp}_{file_name}"
+        shutil.copy2(source_path, destinations[file_name])
+    
+    # The restored inventory holds the full stock, so drop the newer ledger;
+    # the restored sales predate any closed day, so drop the closed days and
+    # archived sales too. Sales counters are rebuilt and old files migrated
+    # again on reload
+    stale_files = ["inventory_ledger.txt", "inventory_checkpoint.txt", "sales_rollup.txt", "format.txt",
+                   "closed_days.txt"]
+    stale_files += [file_name for file_name in destinations if file_name.startswith('archive/')]
+    for file_name in stale_files:
+        if os.path.exists(destinations[file_name]):
+            os.remove(destinations[file_name])
+    
+    # A close interrupted before the restore must not be finished on top of it
+    data_dir = data_manager.data_dir if data_manager else "data"
+    close_marker = os.path.join(data_dir, "close_pending.txt")
+    if os.path.exists(close_marker):
+        os.remove(close_marker)
+    
+    if data_manager:
+        data_manager.reload()
+    
+    return True, "Backup restored successfully"
+
+# Streaming validation
+VALIDATE_CHUNK_SIZE = 64 * 1024
+MAX_RECORD_SIZE = 1024 * 1024  # A record that doesn't parse within this many characters is corrupt
+_WHITESPACE = re.compile(r'\s*')
+
+def _iter_json_array(file_path):
+    """Read a JSON array file in chunks, yielding one event per element
+
+    Yields ('record', value) for each element, then ('end', None) for a valid
+    array, ('empty', None) for an empty file, ('not_array', None) if the file
+    holds another JSON value, or ('error', reason) at the first point the
+    array is damaged. Only the current record is held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    state = 'start'
+    
+    with open(file_path, 'r') as f:
+        while True:
+            pos = _WHITESPACE.match(buffer, pos).end()
             
-            # Handle empty file
-            if not content:
-                with open(file_path, 'w') as f_write:
-                    f_write.write('[]')
-                return True, "Fixed empty file with empty array"
+            # Parsing a record may need more than is buffered
+            need_more = pos == len(buffer)
+            value = None
+            if not need_more and state in ('first', 'value') and buffer[pos] != ']':
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    need_more = end == len(buffer) and not eof  # A number may continue
+                except json.JSONDecodeError:
+                    need_more = True
+                    if eof or len(buffer) - pos > MAX_RECORD_SIZE:
+                        yield 'error', 'record is incomplete or corrupt'
+                        return
             
-            # Try to parse JSON
-            json.loads(content)
-            return True, "Valid JSON"
-    except json.JSONDecodeError:
-        # Try to fix common issues
-        try:
-            with open(file_path, 'r') as f:
-                content = f.read().strip()
+            if need_more and not eof:
+                buffer, pos = buffer[pos:], 0
+                try:
+                    chunk = f.read(VALIDATE_CHUNK_SIZE)
+                except UnicodeDecodeError:
+                    yield 'error', 'file contains undecodable bytes'
+                    return
+                eof = not chunk
+                buffer += chunk
+                continue
             
-            # Reset file with empty array if content is corrupt
-            with open(file_path, 'w') as f:
-                f.write('[]')
+            if pos == len(buffer):
+                if state == 'start':
+                    yield 'empty', None
+                elif state == 'after':
+                    yield 'end', None
+                else:
+                    yield 'error', 'file ends before the closing bracket'
+                return
             
-            return False, "Invalid JSON, reset with empty array"
-        except Exception as e:
-            return False, f"Failed to fix JSON: {str(e)}"
+            char = buffer[pos]
+            if state == 'start':
+                if char != '[':
+                    yield 'not_array', None
+                    return
+                pos += 1
+                state = 'first'
+            elif state == 'after':
+                yield 'error', 'unexpected data after the closing bracket'
+                return
+            elif state == 'separator':
+                if char == ',':
+                    state = 'value'
+                elif char == ']':
+                    state = 'after'
+                else:
+                    yield 'error', 'missing comma between records'
+                    return
+                pos += 1
+            elif char == ']':
+                if state == 'value':
+                    yield 'error', 'trailing comma before the closing bracket'
+                    return
+                pos += 1
+                state = 'after'
+            else:
+                pos = end
+                state = 'separator'
+                yield 'record', value
+
+def validate_json_file(file_path):
+    """Validate a JSON data file, salvaging intact records if it is corrupt"""
+    try:
+        outcome, reason = None, None
+        for kind, value in _iter_json_array(file_path):
+            if kind != 'record':
+                outcome, reason = kind, value
+        
+        if outcome == 'end':
+            return True, "Valid JSON"
+        
+        if outcome == 'empty':
+            # Replaced like every other write here, so a crash can't truncate it
+            temp_path = file_path + '.tmp'
+            with open(temp_path, 'w') as f:
+                f.write('[]')
+            os.replace(temp_path, file_path)
+            return True, "Fixed empty file with empty array"
+        
+        if outcome == 'not_array':
+            # Single objects like the inventory checkpoint are small
+            try:
+                with open(file_path, 'r') as f:
+                    json.load(f)
+                return True, "Valid JSON"
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                return False, "Invalid JSON that isn't an array, file left unchanged"
+        
+        # Write every record before the damage to a new file in the same
+        # layout as DataManager, keeping the original aside for inspection
+        salvaged_path = file_path + '.tmp'
+        salvaged = 0
+        with open(salvaged_path, 'w') as f:
+            f.write('[')
+            for kind, record in _iter_json_array(file_path):
+                if kind != 'record':
+                    break
+                f.write(',\n  ' if salvaged else '\n  ')
+                f.write(json.dumps(record, indent=2).replace('\n', '\n  '))
+                salvaged += 1
+            f.write('\n]' if salvaged else ']')
+        
+        quarantine_path = f"{file_path}.corrupt-{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        shutil.copy2(file_path, quarantine_path)
+        os.replace(salvaged_path, file_path)
+        
+        return False, f"Invalid JSON ({reason}), salvaged {salvaged} records; original kept at {quarantine_path}"
     except Exception as e:
         return False, f"Error validating file: {str(e)}"